@@ -1,37 +1,291 @@
 from app.api import schemas
-from app.dependencies import get_ble_provisioner
-from fastapi import APIRouter, Depends
+from app.dependencies import (
+    get_adapter_manager,
+    get_ble_session_factory,
+    get_ble_warm_session_factory,
+    get_job_queue,
+    get_scheduler,
+    get_site_survey,
+)
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from app.api import utils as api_utils
+from app.scheduler import PRIORITIES, QueueFull
 from app.config import (
     EDGE_SENSOR_SERVICE_NAME_PREFIX,
     EDGE_SENSOR_OUI,
 )
-from typing import List
+from typing import List, Optional, Union
 
 ble_router = APIRouter(prefix="/api/v1")
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+def get_metrics() -> Response:
+    # Prometheus exposition of the provisioning latencies and failures
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
 
 @ble_router.get("/discover")
 async def discover_devices(
-    provisioner=Depends(get_ble_provisioner),
+    adapter_manager=Depends(get_adapter_manager),
 ) -> List[schemas.BLEDevice]:
     return [
         schemas.BLEDevice(**d)
-        for d in await provisioner.discover(
+        for d in await adapter_manager.discover(
             service_name_prefix=EDGE_SENSOR_SERVICE_NAME_PREFIX,
             fallback_oui=EDGE_SENSOR_OUI,
         )
     ]
 
 
+@ble_router.get("/adapters")
+async def get_adapters(
+    adapter_manager=Depends(get_adapter_manager),
+) -> List[schemas.BLEAdapterStats]:
+    return [schemas.BLEAdapterStats(**s) for s in adapter_manager.stats()]
+
+
+def _device(address, pop, name, sec_ver, username, adapter_manager):
+    # Device addressed by a follow-up operation, named as advertised unless given
+    return schemas.BLEDeviceWithPoP(
+        device_name=name or adapter_manager.device_name(address) or address,
+        device_address=address,
+        device_pop=pop,
+        sec_ver=sec_ver,
+        username=username,
+    )
+
+
+async def _run_on_device(device, warm_session_factory, operation):
+    try:
+        return await api_utils.run_on_device(device, warm_session_factory, operation)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+
+
+@ble_router.get("/devices/{address}/wifi-scan", response_model=List[schemas.WiFiAP])
+async def scan_device_wifi(
+    address: str,
+    pop: str = "",
+    name: Optional[str] = None,
+    sec_ver: Optional[int] = None,
+    username: Optional[str] = None,
+    stream: bool = False,
+    max_age: Optional[float] = None,
+    refresh: bool = False,
+    nearby: bool = False,
+    adapter_manager=Depends(get_adapter_manager),
+    session_factory=Depends(get_ble_session_factory),
+    site_survey=Depends(get_site_survey),
+) -> Union[List[schemas.WiFiAP], StreamingResponse]:
+    """
+    Access points seen by the device at `address`, or streamed as NDJSON
+    while the pages come in with `stream=true`. A scan the device reported
+    not more than `max_age` seconds ago is answered without scanning again,
+    unless `refresh=true`; with `nearby=true` so is a scan of any device on
+    the same adapter, for sites where those are close together.
+    """
+    device = _device(address, pop, name, sec_ver, username, adapter_manager)
+    aps = api_utils.iter_device_wifi_aps(
+        device,
+        session_factory,
+        site_survey=None if refresh else site_survey,
+        iface=adapter_manager.select_adapter(address).iface,
+        max_age=max_age,
+        nearby=nearby,
+    )
+    if stream:
+        async def _stream():
+            async for ap in aps:
+                yield ap.model_dump_json() + "\n"
+
+        return StreamingResponse(_stream(), media_type="application/x-ndjson")
+    try:
+        return [ap async for ap in aps]
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+
+
+@ble_router.get("/devices/{address}/wifi-status")
+async def get_device_wifi_status(
+    address: str,
+    pop: str = "",
+    name: Optional[str] = None,
+    sec_ver: Optional[int] = None,
+    username: Optional[str] = None,
+    adapter_manager=Depends(get_adapter_manager),
+    warm_session_factory=Depends(get_ble_warm_session_factory),
+) -> schemas.WiFiStatus:
+    device = _device(address, pop, name, sec_ver, username, adapter_manager)
+    return schemas.WiFiStatus(
+        **await _run_on_device(device, warm_session_factory, lambda p: p.get_wifi_status())
+    )
+
+
+@ble_router.post("/devices/{address}/wifi-reset", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_device_wifi(
+    address: str,
+    pop: str = "",
+    name: Optional[str] = None,
+    sec_ver: Optional[int] = None,
+    username: Optional[str] = None,
+    adapter_manager=Depends(get_adapter_manager),
+    warm_session_factory=Depends(get_ble_warm_session_factory),
+) -> None:
+    device = _device(address, pop, name, sec_ver, username, adapter_manager)
+    await _run_on_device(device, warm_session_factory, lambda p: p.reset_wifi())
+
+
+@ble_router.post("/devices/{address}/wifi-reprov", status_code=status.HTTP_204_NO_CONTENT)
+async def reprov_device_wifi(
+    address: str,
+    pop: str = "",
+    name: Optional[str] = None,
+    sec_ver: Optional[int] = None,
+    username: Optional[str] = None,
+    adapter_manager=Depends(get_adapter_manager),
+    warm_session_factory=Depends(get_ble_warm_session_factory),
+) -> None:
+    device = _device(address, pop, name, sec_ver, username, adapter_manager)
+    await _run_on_device(device, warm_session_factory, lambda p: p.reprov_wifi())
+
+
+@ble_router.post("/devices/{address}/custom-data")
+async def send_device_custom_data(
+    address: str,
+    custom_data: schemas.CustomData,
+    pop: str = "",
+    name: Optional[str] = None,
+    sec_ver: Optional[int] = None,
+    username: Optional[str] = None,
+    adapter_manager=Depends(get_adapter_manager),
+    warm_session_factory=Depends(get_ble_warm_session_factory),
+) -> schemas.CustomDataResult:
+    device = _device(address, pop, name, sec_ver, username, adapter_manager)
+    return schemas.CustomDataResult(
+        accepted=await _run_on_device(device, warm_session_factory, lambda p: p.custom_data(custom_data.data))
+    )
+
+
+@ble_router.get("/wifi-survey")
+async def get_wifi_survey(
+    iface: Optional[str] = None,
+    max_age: Optional[float] = None,
+    site_survey=Depends(get_site_survey),
+) -> schemas.WiFiSurvey:
+    """
+    Access points reported by the devices' Wi-Fi scans, strongest first, and
+    the channels they use, least crowded first; of the devices on adapter
+    `iface` only, if given.
+    """
+    if site_survey is None:
+        return schemas.WiFiSurvey(aps=[], channels=[])
+    return schemas.WiFiSurvey(
+        aps=site_survey.aps(group=iface, max_age=max_age),
+        channels=site_survey.channels(group=iface, max_age=max_age),
+    )
+
+
+def _admit(request, scheduler, devices, priority, background=False):
+    """
+    Scheduler admission of a provisioning request: 429 with Retry-After when
+    the queues are full, 413 when the request could never fit them
+    """
+    if priority is None:
+        priority = scheduler.default_priority(len(devices), background=background)
+    elif priority not in PRIORITIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"priority must be one of {', '.join(PRIORITIES)}"
+        )
+    client = request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
+    try:
+        return scheduler.admit(client, priority, len(devices))
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+
+
 @ble_router.post("/provision")
 async def provision_device(
-    devices: list[schemas.BLEDeviceWithPoP], provisioner=Depends(get_ble_provisioner)
-) -> list[schemas.BLEDevice]:
+    devices: list[schemas.BLEDeviceWithPoP],
+    request: Request,
+    response: Response,
+    background: bool = False,
+    priority: Optional[str] = None,
+    session_factory=Depends(get_ble_session_factory),
+    job_queue=Depends(get_job_queue),
+    scheduler=Depends(get_scheduler),
+) -> Union[list[schemas.BLEDevice], schemas.ProvisioningJob]:
+    """
+    Provision `devices` and return the provisioned ones. With `background=true`
+    a job is enqueued instead and returned right away, see `GET /jobs/{job_id}`.
+
+    `priority` is "interactive" or "bulk", by default interactive for a single
+    device provisioned in the foreground. Requests beyond the scheduler's
+    queue limits are refused with 429 and a Retry-After header.
+    """
+    admission = _admit(request, scheduler, devices, priority, background=background)
+    if background:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return await job_queue.enqueue(devices, admission=admission)
+
     _, prov_devices = await api_utils.provision_ble_devices(
-        devices, provisioner
+        devices, session_factory, admission=admission
     )
 
     return [
         schemas.BLEDevice(**d.model_dump())
         for d in prov_devices
     ]
+
+
+@ble_router.post("/provision/stream")
+async def provision_device_stream(
+    devices: list[schemas.BLEDeviceWithPoP],
+    request: Request,
+    priority: Optional[str] = None,
+    session_factory=Depends(get_ble_session_factory),
+    scheduler=Depends(get_scheduler),
+) -> StreamingResponse:
+    """
+    Provision `devices` streaming one event per device and phase as NDJSON,
+    or as Server-Sent Events when the client accepts `text/event-stream`.
+    Scheduled like `POST /provision`.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    admission = _admit(request, scheduler, devices, priority)
+    events = api_utils.iter_provision_ble_events(devices, session_factory, admission=admission)
+
+    async def _stream():
+        async for event in events:
+            if sse:
+                yield f"event: {event.phase}\ndata: {event.model_dump_json()}\n\n"
+            else:
+                yield event.model_dump_json() + "\n"
+
+    # Gives back the room of the devices if the stream never got to start
+    return StreamingResponse(
+        _stream(), media_type="text/event-stream" if sse else "application/x-ndjson",
+        background=BackgroundTask(admission.close),
+    )
+
+
+@ble_router.get("/scheduler")
+async def get_scheduler_stats(scheduler=Depends(get_scheduler)) -> schemas.SchedulerStats:
+    return schemas.SchedulerStats(**scheduler.stats())
+
+
+@ble_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, job_queue=Depends(get_job_queue)) -> schemas.ProvisioningJob:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
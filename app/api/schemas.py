@@ -3,6 +3,8 @@ This module contains the pydantic models (schemas) for the API.
 08/10/2023
 """
 
+from typing import Any, Optional
+
 from pydantic import BaseModel
 
 class WlanIfaceAddress(BaseModel):
@@ -14,3 +16,91 @@ class BLEDevice(BaseModel):
 
 class BLEDeviceWithPoP(BLEDevice):
     device_pop: str
+    # protocomm security scheme (None: as reported by the device), 2 (SRP6a) takes the PoP as password
+    sec_ver: Optional[int] = None
+    username: Optional[str] = None
+
+class WiFiAP(BaseModel):
+    ssid: str
+    bssid: str
+    channel: int
+    rssi: int
+    auth: str
+
+class WiFiSurveyAP(WiFiAP):
+    avg_rssi: float
+    reporters: int
+    age: float
+
+class WiFiSurveyChannel(BaseModel):
+    channel: int
+    aps: int
+    max_rssi: int
+
+class WiFiSurvey(BaseModel):
+    aps: list[WiFiSurveyAP]
+    channels: list[WiFiSurveyChannel]
+
+class WiFiStatus(BaseModel):
+    state: str
+    fail_reason: Optional[str] = None
+
+class CustomData(BaseModel):
+    data: str
+
+class CustomDataResult(BaseModel):
+    accepted: bool
+
+class ProvisioningResult(BLEDevice):
+    provisioned: bool
+    attempts: int
+    error: Optional[str] = None
+    failure: Optional[str] = None
+    elapsed: float
+
+class ProvisioningEvent(BaseModel):
+    phase: str
+    device_name: Optional[str] = None
+    device_address: Optional[str] = None
+    elapsed: float
+    phase_elapsed: Optional[float] = None
+    reason: Optional[str] = None
+    attempt: Optional[int] = None
+    failure: Optional[str] = None
+    recovery: Optional[str] = None
+    resume_from: Optional[str] = None
+    timings: Optional[dict[str, Any]] = None
+    result: Optional[ProvisioningResult] = None
+
+class ProvisioningJob(BaseModel):
+    job_id: str
+    status: str
+    created_at: float
+    updated_at: float
+    total: int
+    completed: int = 0
+    results: list[ProvisioningResult] = []
+
+class SchedulerQueueStats(BaseModel):
+    priority: str
+    queued: int
+    clients: int
+
+class SchedulerStats(BaseModel):
+    concurrency: int
+    running: int
+    service_time: float
+    queues: list[SchedulerQueueStats]
+
+class BLEAdapterStats(BaseModel):
+    iface: str
+    in_flight: int
+    max_connections: int
+    devices_heard: int
+    sessions: int
+    provisioned: int
+    provisioned_per_minute: float
+    avg_session_time: Optional[float] = None
+    avg_handshake_time: Optional[float] = None
+    warm_sessions: int = 0
+    warm_hits: int = 0
@@ -1,28 +1,193 @@
-from app.config import BLE_PROV_MAX_RETRIES
+import asyncio
+import contextlib
+import time
+import uuid
 
-async def provision_ble_devices(devices, provisioner):
+from app.api import schemas
+from app.ble_wifi_provisioner import retry, tracing
+from app.config import (
+    BLE_PROV_MAX_RETRIES, BLE_PROV_MAX_IN_FLIGHT, BLE_PROV_RETRY_BACKOFF, BLE_PROV_RETRY_MAX_BACKOFF,
+    BLE_PROV_RETRY_JITTER,
+)
+
+retry_policy = retry.RetryPolicy(
+    max_attempts=BLE_PROV_MAX_RETRIES,
+    backoff=BLE_PROV_RETRY_BACKOFF,
+    max_backoff=BLE_PROV_RETRY_MAX_BACKOFF,
+    jitter=BLE_PROV_RETRY_JITTER,
+)
+
+
+async def _provision_ble_device(device, session_factory, on_event=None, parent_span=None):
+    """
+    Provision a single device with its own provisioner (transport and
+    security context) in up to BLE_PROV_MAX_RETRIES attempts, see
+    retry.provision. Never raises: the outcome is reported as a
+    ProvisioningResult. Phase events of the provisioner are forwarded to
+    `on_event`.
+
+    `session_factory(device=...)` returns an async context manager yielding
+    the provisioner and disconnecting it on exit, e.g. BLEAdapterManager.session
+    """
+    with tracing.span(
+        "provision_device",
+        parent=parent_span,
+        device_address=device.device_address,
+        device_name=device.device_name,
+    ) as span:
+        result = await _provision_ble_device_attempts(device, session_factory, on_event)
+        span.set_attribute("provisioned", result.provisioned)
+        span.set_attribute("attempts", result.attempts)
+        if result.failure is not None:
+            span.set_attribute("failure", result.failure)
+        if result.error is not None:
+            span.set_error(result.error)
+    return result
+
+
+async def _provision_ble_device_attempts(device, session_factory, on_event):
+    start_time = time.monotonic()
+    outcome = {"provisioned": False, "attempts": 0, "error": None, "failure": None}
+    try:
+        async with session_factory(device=device) as provisioner:
+            provisioner.on_event = on_event
+            outcome = await retry.provision(provisioner, device.model_dump(), retry_policy)
+    except Exception as e:
+        outcome["error"] = str(e)
+
+    return schemas.ProvisioningResult(
+        device_name=device.device_name,
+        device_address=device.device_address,
+        elapsed=time.monotonic() - start_time,
+        **outcome,
+    )
+
+
+async def iter_device_wifi_aps(device, session_factory, site_survey=None, iface=None, max_age=None,
+                               nearby=False):
+    """
+    Connect to `device` and yield the access points of a Wi-Fi scan run on
+    it as schemas.WiFiAP, page by page. Raises RuntimeError on failure.
+
+    If the device reported a scan to `site_survey` within `max_age` seconds,
+    that scan is yielded instead, without connecting to the device. With
+    `nearby`, so are the scans of any device on adapter `iface`, for sites
+    where the devices of an adapter are known to be close together.
+    """
+    if site_survey is not None:
+        survey = dict(group=iface) if nearby else dict(reporter=device.device_address)
+        if site_survey.fresh(max_age=max_age, **survey):
+            for ap in site_survey.aps(max_age=max_age, **survey):
+                yield schemas.WiFiAP(**ap)
+            return
+    async with session_factory(device=device, iface=iface) as provisioner:
+        await provisioner.connect(**device.model_dump())
+        async for ap in provisioner.iter_wifi_APs():
+            yield schemas.WiFiAP(**ap)
+
+
+async def run_on_device(device, warm_session_factory, operation):
+    """
+    Await `operation(provisioner)` on `device`, reusing its warm session if
+    any, see BLEAdapterManager.warm_session. Raises RuntimeError on failure.
+    """
+    async with warm_session_factory(**device.model_dump()) as provisioner:
+        return await operation(provisioner)
+
+
+async def iter_provision_ble_devices(devices, session_factory, max_in_flight=BLE_PROV_MAX_IN_FLIGHT, batch_id=None,
+                                     admission=None):
+    """
+    Provision `devices` concurrently, with at most `max_in_flight` devices
+    connected at the same time, yielding one ProvisioningResult per device
+    as soon as it completes. `session_factory` is entered once per device
+    so that every device gets its own BLEWiFiProvisioner.
+
+    With a scheduler `admission` (see app.scheduler) every device waits for
+    a provisioning slot; its unused room is given back when done.
+    """
+    async for event in iter_provision_ble_events(devices, session_factory, max_in_flight, batch_id, admission):
+        if event.phase == "result":
+            yield event.result
+
+
+async def iter_provision_ble_events(devices, session_factory, max_in_flight=BLE_PROV_MAX_IN_FLIGHT, batch_id=None,
+                                    admission=None):
+    """
+    Same engine as `iter_provision_ble_devices`, yielding a ProvisioningEvent
+    per device and phase as it happens (scanning, connected, session_established,
+    config_sent, applied, wifi_connected, failed, retry) and a final `result`
+    event per device carrying its ProvisioningResult.
+
+    The devices' tracing spans share one trace per batch, tagged with `batch_id`.
+    """
+    queue = asyncio.Queue()
+    batch_span = tracing.start_span(
+        "provision_batch", batch_id=batch_id or uuid.uuid4().hex, devices=len(devices)
+    )
+    semaphore = asyncio.Semaphore(max(1, max_in_flight))
+
+    def _on_event(event):
+        queue.put_nowait(schemas.ProvisioningEvent(**event))
+
+    async def _bounded(device):
+        start_time = time.monotonic()
+        cancelled = None
+        try:
+            # In-flight permit of the batch first: a device waiting on its own batch holds no
+            # scheduler slot, which other clients' requests could use meanwhile
+            async with semaphore, admission.slot() if admission is not None else contextlib.nullcontext():
+                result = await _provision_ble_device(device, session_factory, _on_event, batch_span)
+        except (Exception, asyncio.CancelledError) as e:
+            # Every device gets its result event, or the batch would wait for it forever
+            if isinstance(e, asyncio.CancelledError):
+                cancelled = e
+            result = schemas.ProvisioningResult(
+                device_name=device.device_name,
+                device_address=device.device_address,
+                provisioned=False,
+                attempts=0,
+                error=str(e) or type(e).__name__,
+                elapsed=time.monotonic() - start_time,
+            )
+        queue.put_nowait(schemas.ProvisioningEvent(
+            phase="result",
+            device_name=result.device_name,
+            device_address=result.device_address,
+            elapsed=result.elapsed,
+            reason=result.error,
+            result=result,
+        ))
+        if cancelled is not None:
+            raise cancelled
+
+    tasks = [asyncio.create_task(_bounded(device)) for device in devices]
+    pending = len(tasks)
+    try:
+        while pending:
+            event = await queue.get()
+            if event.phase == "result":
+                pending -= 1
+            yield event
+    finally:
+        # Do not leave devices connected if the consumer goes away early
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if admission is not None:
+            admission.close()
+        batch_span.end()
+
+
+async def provision_ble_devices(devices, session_factory, max_in_flight=BLE_PROV_MAX_IN_FLIGHT, batch_id=None,
+                                admission=None):
+    _devices = {device.device_address: device for device in devices}
     _not_prov_devices = []
     _prov_devices = []
-    for device in devices:
-        await provisioner.connect(**device.model_dump())
-        attempt = 0 # Counter
-        _provisioned = False
-        # Loop until the maximum number of retries is reached
-        while attempt < BLE_PROV_MAX_RETRIES:
-            try:
-                # Attempt to provision the device
-                await provisioner.prov_device()
-                _prov_devices.append(device)
-                _provisioned = True
-                break  # Break the loop if provisioning is successful
-            except:
-                # Increment the counter and retry if an exception occurs
-                attempt += 1
-
-        # Check if the device was not provisioned after all retries
-        if not _provisioned:
+    async for result in iter_provision_ble_devices(devices, session_factory, max_in_flight, batch_id, admission):
+        device = _devices[result.device_address]
+        if result.provisioned:
+            _prov_devices.append(device)
+        else:
             _not_prov_devices.append(device)
-
-        # Disconnect the provisioner after the provisioning attempts
-        await provisioner.disconnect()
-    return _not_prov_devices,_prov_devices
\ No newline at end of file
+    return _not_prov_devices,_prov_devices
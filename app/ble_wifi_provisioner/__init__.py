@@ -3,3 +3,11 @@
 #
 
 from .ble_wifi_provisioner import BLEWiFiProvisioner
+from .transport import BLE_Background_Scanner, BLEDeviceRegistry, GATTNameCache
+from .transport import SimulatedESP32Device, Transport_Sim
+from .security import KeyPool
+from .capabilities import CapabilityCache, DeviceCapabilities
+from .site_survey import SiteSurvey
+from .retry import RetryPolicy
+from .adapter_manager import BLEAdapter, BLEAdapterManager
+from .simulator import SimulatedFleet
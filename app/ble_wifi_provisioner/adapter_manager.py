@@ -0,0 +1,338 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from .ble_wifi_provisioner import BLEWiFiProvisioner
+from .transport import BLE_Background_Scanner
+
+logger = logging.getLogger("BLEWiFiProvisioner.adapter")
+
+
+class BLEAdapter:
+    """
+    One HCI interface shared by every provisioner using it: its background
+    scanner, the GATT name cache, a bounded number of connection slots and
+    the lock arbitrating the radio between scans and connection setup
+    """
+
+    def __init__(self, iface, max_connections=4, scan_ttl=60.0, gatt_cache=None):
+        self.iface = iface
+        self.max_connections = max_connections
+        self.scanner = BLE_Background_Scanner(iface=iface, ttl=scan_ttl)
+        self.gatt_cache = gatt_cache
+        self.in_flight = 0
+
+        # Throughput counters, see `stats`
+        self.started_at = time.monotonic()
+        self.sessions = 0
+        self.provisioned = 0
+        self.busy_time = 0.0
+        self.handshakes = 0
+        self.handshake_time = 0.0
+        self.warm_sessions = 0
+        self.warm_hits = 0
+
+        self._slots = asyncio.Semaphore(max_connections)
+        self._radio_lock = asyncio.Lock()
+
+    async def start(self):
+        try:
+            await self.scanner.start()
+        except Exception as e:
+            # Provisioners fall back to targeted lookups and full scans
+            logger.warning(f"Background BLE scan unavailable on {self.iface}: {e}")
+
+    async def stop(self):
+        await self.scanner.stop()
+
+    @property
+    def load(self):
+        return self.in_flight / self.max_connections
+
+    def rssi(self, address):
+        # Last RSSI this adapter heard `address` with, None if not heard recently
+        found = self.scanner.registry.get(address) if address else None
+        return None if found is None else found[1].rssi
+
+    def stats(self):
+        uptime = time.monotonic() - self.started_at
+        return {
+            "iface": self.iface,
+            "in_flight": self.in_flight,
+            "max_connections": self.max_connections,
+            "devices_heard": len(self.scanner.registry),
+            "sessions": self.sessions,
+            "provisioned": self.provisioned,
+            "provisioned_per_minute": 60.0 * self.provisioned / uptime if uptime > 0 else 0.0,
+            "avg_session_time": self.busy_time / self.sessions if self.sessions else None,
+            "avg_handshake_time": self.handshake_time / self.handshakes if self.handshakes else None,
+            "warm_sessions": self.warm_sessions,
+            "warm_hits": self.warm_hits,
+        }
+
+    async def acquire_slot(self):
+        # Returns the start time to hand back to `release_slot`
+        await self._slots.acquire()
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release_slot(self, start_time):
+        self.in_flight -= 1
+        self.sessions += 1
+        self.busy_time += time.monotonic() - start_time
+        self._slots.release()
+
+    def end_session(self, provisioner):
+        # Account for a provisioner session on this adapter before it disconnects
+        self.provisioned += int(provisioner.wifi_connected)
+        if provisioner.handshake_time is not None:
+            self.handshakes += 1
+            self.handshake_time += provisioner.handshake_time
+
+    @asynccontextmanager
+    async def connection_slot(self):
+        # Bounds the GATT connections held on this adapter at the same time
+        start_time = await self.acquire_slot()
+        try:
+            yield self
+        finally:
+            self.release_slot(start_time)
+
+    @asynccontextmanager
+    async def radio(self):
+        """
+        Exclusive use of the radio for scans, lookups and connection setup.
+        The background scan is paused meanwhile, as BlueZ controllers set up
+        connections faster (and more reliably) while not discovering.
+        """
+        async with self._radio_lock:
+            await self.scanner.pause()
+            try:
+                yield self
+            finally:
+                await self.scanner.resume()
+
+
+class WarmSession:
+    # Connected provisioner of one device kept for follow-up operations, holding a connection slot
+    def __init__(self, device_address):
+        self.device_address = device_address
+        self.connect_kwargs = None
+        self.provisioner = None
+        self.adapter = None
+        self.slot_time = None
+        self.last_used = time.monotonic()
+        self.closed = False
+        self.lock = asyncio.Lock()
+
+    @property
+    def idle(self):
+        return not self.lock.locked()
+
+
+class BLEAdapterManager:
+    """
+    Owns one BLEAdapter per HCI interface for the lifetime of the app and
+    hands out per-device provisioner sessions bound to them. With several
+    interfaces, each device goes to the adapter that heard it best, traded
+    off against the load of the adapter (`load_penalty` dB at full load).
+
+    With a `session_idle_timeout`, `warm_session` keeps devices connected
+    (session established) between operations, up to `max_warm_sessions` per
+    adapter, least recently used first out when a connection slot is needed.
+    """
+
+    # RSSI assumed for adapters that have not heard the device
+    RSSI_FLOOR = -127
+
+    def __init__(self, ifaces, provisioner_kwargs=None, max_connections=4, scan_ttl=60.0, gatt_cache=None,
+                 load_penalty=20.0, session_idle_timeout=0.0, max_warm_sessions=None):
+        self.adapters = {
+            iface: BLEAdapter(iface, max_connections=max_connections, scan_ttl=scan_ttl, gatt_cache=gatt_cache)
+            for iface in ifaces
+        }
+        self.provisioner_kwargs = dict(provisioner_kwargs or {})
+        self.load_penalty = load_penalty
+        self.session_idle_timeout = session_idle_timeout
+        self.max_warm_sessions = max_connections if max_warm_sessions is None else max_warm_sessions
+        # device address -> WarmSession, least recently used first
+        self._warm = OrderedDict()
+        self._sweeper = None
+
+    @property
+    def keep_warm(self):
+        return self.session_idle_timeout > 0 and self.max_warm_sessions > 0
+
+    async def start(self):
+        for adapter in self.adapters.values():
+            await adapter.start()
+        if self.keep_warm:
+            self._sweeper = asyncio.create_task(self._sweep_warm_sessions())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for warm in list(self._warm.values()):
+            await self._close_warm(warm)
+        for adapter in self.adapters.values():
+            await adapter.stop()
+
+    def adapter(self, iface=None):
+        if iface is None:
+            return next(iter(self.adapters.values()))
+        return self.adapters[iface]
+
+    def select_adapter(self, device_address=None):
+        def _score(adapter):
+            rssi = adapter.rssi(device_address)
+            rssi = self.RSSI_FLOOR if rssi is None else rssi
+            # Full adapters last, then best RSSI discounted by load
+            return (adapter.in_flight >= adapter.max_connections, -(rssi - self.load_penalty * adapter.load))
+
+        return min(self.adapters.values(), key=_score)
+
+    def stats(self):
+        return [adapter.stats() for adapter in self.adapters.values()]
+
+    def device_name(self, device_address):
+        # Advertised name of a device heard by any adapter, None if not heard recently
+        for adapter in self.adapters.values():
+            found = adapter.scanner.registry.get(device_address)
+            if found is not None and found[1].local_name:
+                return found[1].local_name
+        return None
+
+    async def discover(self, service_name_prefix="", fallback_oui=""):
+        # Devices heard by any adapter, each reported once
+        devices = dict()
+        for iface in self.adapters:
+            for device in await self.provisioner(iface=iface).discover(service_name_prefix, fallback_oui):
+                devices.setdefault(device["device_address"], device)
+        return list(devices.values())
+
+    def provisioner(self, iface=None, **kwargs):
+        # Provisioner bound to an adapter, without holding a connection slot
+        return BLEWiFiProvisioner(adapter=self.adapter(iface), **{**self.provisioner_kwargs, **kwargs})
+
+    @asynccontextmanager
+    async def session(self, device=None, iface=None, **kwargs):
+        """
+        Provisioner for one device holding one connection slot of its adapter
+        until the session ends; the device is disconnected on exit
+        """
+        if iface is None:
+            adapter = self.select_adapter(getattr(device, "device_address", None))
+        else:
+            adapter = self.adapter(iface)
+        await self._make_room(adapter)
+        async with adapter.connection_slot():
+            provisioner = self.provisioner(iface=adapter.iface, **kwargs)
+            try:
+                yield provisioner
+            finally:
+                adapter.end_session(provisioner)
+                await self._disconnect(provisioner)
+
+    @asynccontextmanager
+    async def warm_session(self, device_name, device_address, device_pop, sec_ver=None, username=None, iface=None):
+        """
+        Provisioner connected to a device with the session established, as
+        `BLEWiFiProvisioner.connect` takes it. The connection is kept after the
+        block for the next operation on the device, until it is idle for
+        `session_idle_timeout` seconds or its slot is needed; it is dropped
+        if the block raises. Without an idle timeout, every call connects.
+        """
+        connect_kwargs = dict(
+            device_name=device_name, device_address=device_address, device_pop=device_pop,
+            sec_ver=sec_ver, username=username,
+        )
+        while True:
+            warm = self._warm.get(device_address)
+            if warm is None:
+                warm = self._warm[device_address] = WarmSession(device_address)
+            async with warm.lock:
+                if warm.closed:
+                    # Evicted while waiting for the previous operation
+                    continue
+                if warm.provisioner is not None and (
+                    warm.connect_kwargs != connect_kwargs or not warm.provisioner.connected
+                ):
+                    await self._close_warm(warm)
+                    continue
+                if warm.provisioner is None:
+                    try:
+                        await self._open_warm(warm, connect_kwargs, iface)
+                    except BaseException:
+                        await self._close_warm(warm)
+                        raise
+                else:
+                    warm.adapter.warm_hits += 1
+                self._warm.move_to_end(device_address)
+                try:
+                    yield warm.provisioner
+                except BaseException:
+                    # State of the device unknown, start over next time
+                    await self._close_warm(warm)
+                    raise
+                warm.last_used = time.monotonic()
+                if not self.keep_warm:
+                    await self._close_warm(warm)
+                return
+
+    async def _open_warm(self, warm, connect_kwargs, iface):
+        adapter = self.adapter(iface) if iface is not None else self.select_adapter(warm.device_address)
+        await self._make_room(adapter, warm=self.keep_warm)
+        warm.slot_time = await adapter.acquire_slot()
+        warm.adapter = adapter
+        adapter.warm_sessions += 1
+        warm.connect_kwargs = connect_kwargs
+        warm.provisioner = self.provisioner(iface=adapter.iface)
+        await warm.provisioner.connect(**connect_kwargs)
+
+    async def _close_warm(self, warm):
+        warm.closed = True
+        if self._warm.get(warm.device_address) is warm:
+            del self._warm[warm.device_address]
+        if warm.adapter is None:
+            return
+        adapter, warm.adapter = warm.adapter, None
+        adapter.end_session(warm.provisioner)
+        await self._disconnect(warm.provisioner)
+        adapter.warm_sessions -= 1
+        adapter.release_slot(warm.slot_time)
+
+    async def _make_room(self, adapter, warm=False):
+        """
+        Evict idle warm sessions of `adapter`, least recently used first, while
+        they hold every connection slot (or, for a new warm session, reach the
+        `max_warm_sessions` cap)
+        """
+        def _full():
+            if adapter.in_flight >= adapter.max_connections:
+                return True
+            return warm and adapter.warm_sessions >= self.max_warm_sessions
+
+        while _full():
+            idle = next((w for w in self._warm.values() if w.adapter is adapter and w.idle), None)
+            if idle is None:
+                return
+            logger.debug(f"Evicting warm session of {idle.device_address} from {adapter.iface}")
+            await self._close_warm(idle)
+
+    async def _sweep_warm_sessions(self):
+        # Disconnect the warm sessions idle for longer than the timeout
+        while True:
+            await asyncio.sleep(self.session_idle_timeout / 2)
+            now = time.monotonic()
+            for warm in list(self._warm.values()):
+                if warm.idle and now - warm.last_used >= self.session_idle_timeout:
+                    await self._close_warm(warm)
+
+    async def _disconnect(self, provisioner):
+        try:
+            await provisioner.disconnect()
+        except Exception as e:
+            logger.warning(f"Failed to disconnect from {provisioner.device_address}: {e}")
@@ -4,27 +4,105 @@ SPDX-License-Identifier: Apache-2.0
 """
 
 import time
+import asyncio
 import logging
 
+from bleak.exc import BleakError
+
 from . import prov
+from . import metrics
 from . import security
+from . import tracing
 from . import transport
+from .utils import DeviceLogger, poll_delays
+from .capabilities import DEFAULT_MAX_VALUE_LEN, DEFAULT_SCAN_BATCH, DeviceCapabilities, scan_page_size
 
 TAG = "BLEWiFiProvisioner"
 
+# Failures of the link: the transport's own RuntimeErrors, bleak errors and GATT timeouts
+LINK_ERRORS = (RuntimeError, BleakError, asyncio.TimeoutError)
+
+
+def link_error(e):
+    # RuntimeError for one of LINK_ERRORS, as callers expect (timeouts come without message)
+    return RuntimeError(str(e) or type(e).__name__)
+
+
 class BLEWiFiProvisioner:
-    def __init__(self, wifi_ssid, wifi_passphrase, iface, verbose=False):
+    def __init__(self, wifi_ssid, wifi_passphrase, iface=None, verbose=False,
+                 wifi_poll_initial=(1.0, 1.0), wifi_poll_backoff=1.5,
+                 wifi_poll_max_interval=5.0, wifi_poll_timeout=30.0, scanner=None,
+                 lookup_timeout=2.0, gatt_cache=None, on_event=None, adapter=None,
+                 exchange_mode="auto", transport=None, key_pool=None, handshake_offload=False,
+                 sec2_ephemeral_pool=None, sec2_executor=None, capability_cache=None,
+                 site_survey=None):
         self.ssid = wifi_ssid
         self.passphrase = wifi_passphrase
-        self.iface = iface
         self.verbose = verbose
+        # Optional BLEAdapter (see adapter_manager) providing the interface,
+        # scanner and GATT name cache, and arbitrating the radio
+        self.adapter = adapter
+        self.iface = iface if adapter is None else adapter.iface
+        # Optional transport.BLE_Background_Scanner shared between provisioners
+        self.scanner = scanner if adapter is None else adapter.scanner
+        # Targeted find-by-address timeout before connect falls back to a full scan
+        self.lookup_timeout = lookup_timeout
+        # Optional transport.GATTNameCache shared between provisioners
+        self.gatt_cache = gatt_cache if adapter is None else adapter.gatt_cache
+        # How requests are exchanged over GATT, see transport.ble_cli EXCHANGE_*
+        self.exchange_mode = exchange_mode
+        # Optional security.KeyPool shared between provisioners; with `handshake_offload`
+        # the key exchange and cipher setup of the session run in a worker thread
+        self.key_pool = key_pool
+        self.handshake_offload = handshake_offload
+        # Security 2: optional KeyPool of SRP6a ephemerals and concurrent.futures
+        # executor (e.g. a process pool) for the SRP6a premaster secret
+        self.sec2_ephemeral_pool = sec2_ephemeral_pool
+        self.sec2_executor = sec2_executor
+        # Optional capabilities.CapabilityCache shared between provisioners
+        self.capability_cache = capability_cache
+        # Optional site_survey.SiteSurvey collecting the Wi-Fi scans of the devices
+        self.site_survey = site_survey
+
+        # Wi-Fi status polling schedule, see `_wait_wifi_connected`
+        self.wifi_poll_initial = wifi_poll_initial
+        self.wifi_poll_backoff = wifi_poll_backoff
+        self.wifi_poll_max_interval = wifi_poll_max_interval
+        self.wifi_poll_timeout = wifi_poll_timeout
+
+        # Optional callable receiving a dict per provisioning phase, see `emit`
+        self.on_event = on_event
+        self.device_name = None
+        self.device_address = None
+        self.wifi_connected = False
+        # capabilities.DeviceCapabilities of the connected device and where they came from
+        self.capabilities = None
+        self.capabilities_source = None
+        # Seconds spent establishing the last session, None until one was established
+        self.handshake_time = None
+        self._session_established = False
+        # Security context of the session, set up by `connect`
+        self._sec = None
+        # (pop, sec_ver, username) of the last `connect`, see `restart_session`
+        self._session_args = None
+        # Step of `prov_device` still to be done on the device, see PROV_STEPS
+        self.prov_step = "config"
+        self._start_time = self._phase_time = time.monotonic()
+        # Last phase reported by `emit`, labelling failures and retries
+        self._last_phase = "idle"
 
         self._init_logger()
-        self._init_transport(iface=self.iface)
+        # A ready-made transport (e.g. transport.Transport_Sim) replaces BLE
+        if transport is not None:
+            self._tp = transport
+        else:
+            self._init_transport(iface=self.iface)
 
     # --- main API ---
     async def discover(self, service_name_prefix="", fallback_oui=""):
-        devices = await self._tp.discover()
+        with tracing.span("discover", iface=str(self.iface)) as span:
+            devices = await self._tp.discover()
+            span.set_attribute("devices", len(devices))
         filtered_devices = []
         for dev_addr, (_, adv_data) in devices.items():
             if adv_data.local_name is not None:
@@ -42,59 +120,164 @@ class BLEWiFiProvisioner:
                     })
         return filtered_devices
     
-    async def connect(self, device_name, device_address, device_pop):
-        self._init_security(pop=device_pop)
+    async def connect(self, device_name, device_address, device_pop, sec_ver=None, username=None):
+        """
+        Connect and establish the protocomm session. The security scheme is
+        `sec_ver` if given, else the one the device reports in `proto-ver`
+        """
+        with tracing.span("connect", device_address=device_address, device_name=device_name):
+            await self._connect(device_name, device_address, device_pop, sec_ver, username)
+
+    async def _connect(self, device_name, device_address, device_pop, sec_ver, username):
+        self.device_name = device_name
+        self.device_address = device_address
+        self._logger.extra["device"] = device_address
+        self._session_established = False
+        self._start_time = self._phase_time = time.monotonic()
+
+        # proto-ver cached for the device spares the transport its read
+        cached = await self.capability_cache.get(device_address) if self.capability_cache is not None else None
+
+        self.emit("scanning")
         try:
-            await self._tp.connect(devname=device_name, devaddr=device_address)
-        except RuntimeError as e:
-            raise RuntimeError(e)
+            with tracing.span("ble_connect") as span:
+                await self._tp.connect(
+                    devname=device_name, devaddr=device_address,
+                    proto_ver=cached,
+                )
+                for key in ("lookup_source", "nu_lookup_source"):
+                    if key in self._tp.connect_timings:
+                        span.set_attribute(key, self._tp.connect_timings[key])
+        except LINK_ERRORS as e:
+            self.emit("failed", reason=str(link_error(e)))
+            raise link_error(e) from e
+        self.emit("connected", timings=self._tp.connect_timings)
+        self._session_args = (device_pop, sec_ver, username)
+        await self._start_session(device_pop, sec_ver, username)
+
+    async def restart_session(self):
+        """
+        Establish a new protocomm session over the current link, e.g. after a
+        failed exchange left the ciphers of both ends out of step
+        """
+        if self._session_args is None:
+            raise RuntimeError("Not connected")
+        with tracing.span("restart_session", device_address=self.device_address):
+            self._session_established = False
+            await self._start_session(*self._session_args)
+
+    async def _start_session(self, device_pop, sec_ver, username):
+        try:
+            self.capabilities = await self._resolve_capabilities()
+            if sec_ver is None:
+                sec_ver = self.capabilities.sec_ver
+            if not self.capabilities.pop_required:
+                device_pop = ""
+            self._init_security(pop=device_pop, sec_ver=sec_ver, username=username)
+        except LINK_ERRORS as e:
+            self.emit("failed", reason=str(link_error(e)))
+            raise link_error(e) from e
 
         self.log("==== Starting Session ====")
-        if not await self._establish_session():
+        self.handshake_time = None
+        handshake_start = time.monotonic()
+        try:
+            with tracing.span("establish_session", sec_ver=sec_ver, capabilities=self.capabilities_source):
+                established = await self._establish_session()
+        except LINK_ERRORS as e:
+            # Cached capabilities may be stale (e.g. a firmware update changed the scheme)
+            if self.capabilities_source == "cache":
+                await self.capability_cache.invalidate(self.device_address)
+            self.emit("failed", reason=str(link_error(e)))
+            raise link_error(e) from e
+        if not established:
             self.log(
                 "Failed to establish session. Ensure that security scheme and proof of possession are correct"
             )
+            self.emit("failed", reason="Error in establishing session")
             raise RuntimeError("Error in establishing session")
+        self.handshake_time = time.monotonic() - handshake_start
+        self._session_established = True
+        metrics.HANDSHAKE_SECONDS.labels(sec_ver=str(sec_ver)).observe(self.handshake_time)
         self.log("==== Session Established ====")
+        self.emit("session_established", timings={
+            "handshake": self.handshake_time, "sec_ver": sec_ver, "capabilities": self.capabilities_source,
+        })
+
+    @property
+    def connected(self):
+        # Link up and protocomm session established, i.e. ready for commands
+        return self._session_established and self.link_connected
+
+    @property
+    def link_connected(self):
+        # BLE link up, whether or not a session is established over it
+        return getattr(self._tp, "connected", False)
+
+    @property
+    def phase(self):
+        # Last provisioning phase reached, see `emit`
+        return self._last_phase
+
+    def supports(self, command):
+        # Whether the device implements `command`, assumed until its capabilities are known
+        return self.capabilities is None or self.capabilities.supports(command)
 
     async def get_version(self):
+        # Read while resolving the endpoints on connect, if the transport did
+        proto_ver = getattr(self._tp, "proto_ver", None)
+        if proto_ver is not None:
+            return proto_ver
         response = None
         try:
-            response = await self._tp.send_data("proto-ver", "---")
-        except RuntimeError as e:
-            raise RuntimeError(e)
-        return response
+            response = await self._tp.send_data("proto-ver", b"---")
+        except LINK_ERRORS as e:
+            raise link_error(e) from e
+        return response.decode("latin-1")
 
     async def custom_data(self, custom_data):
         try:
             message = prov.custom_data_request(self._sec, custom_data)
             response = await self._tp.send_data("custom-data", message)
             return prov.custom_data_response(self._sec, response) == 0
-        except RuntimeError as e:
-            raise RuntimeError(e)
+        except LINK_ERRORS as e:
+            raise link_error(e) from e
+
+    async def get_wifi_status(self):
+        # {'state': 'connected' | 'connecting' | 'disconnected' | 'failed' | 'unknown', 'fail_reason': ...}
+        return await self._get_wifi_config()
 
-    async def scan_wifi_APs(self, tp, sec):
+    async def scan_wifi_APs(self, tp=None, sec=None):
+        # Access points seen by the device, see `iter_wifi_APs`
+        return [ap async for ap in self.iter_wifi_APs(tp, sec)]
+
+    async def iter_wifi_APs(self, tp=None, sec=None):
         """
-        Read at most 4 entries at a time. This is because if we are using BLE transport
-        then the response packet size should not exceed the present limit of 256 bytes of
-        characteristic value imposed by protocomm_ble. This limit may be removed in the
-        future
+        Run a Wi-Fi scan on the device and yield the access points page by
+        page. The page size follows the negotiated ATT MTU and the size of the
+        entries seen so far, within the characteristic value limit of
+        protocomm_ble; the first page has the legacy 4 entries. Complete
+        scans are reported to the site survey, if any.
         """
-
-        APs = []
+        tp = tp or self._tp
+        sec = sec or self._sec
+        if sec is None:
+            raise RuntimeError("Not connected")
+        self._require("wifi_scan")
         group_channels = 0
-        readlen = 100
-        readlen = 4
+        max_value_len = self.capabilities.max_value_len if self.capabilities is not None else DEFAULT_MAX_VALUE_LEN
+        mtu = getattr(tp, "mtu", 23)
 
         try:
             message = prov.scan_start_request(
                 sec, blocking=True, group_channels=group_channels
             )
-            start_time = time.time()
+            start_time = time.monotonic()
             response = await tp.send_data("prov-scan", message)
-            stop_time = time.time()
+            scan_time = time.monotonic() - start_time
+            metrics.WIFI_SCAN_SECONDS.observe(scan_time)
             self.log(
-                "++++ Scan process executed in " + str(stop_time - start_time) + " sec"
+                "++++ Scan process executed in " + str(scan_time) + " sec"
             )
             prov.scan_start_response(sec, response)
 
@@ -102,87 +285,216 @@ class BLEWiFiProvisioner:
             response = await tp.send_data("prov-scan", message)
             result = prov.scan_status_response(sec, response)
             self.log("++++ Scan results : " + str(result["count"]))
-            if result["count"] != 0:
-                index = 0
-                remaining = result["count"]
-                while remaining:
-                    count = [remaining, readlen][remaining > readlen]
-                    message = prov.scan_result_request(sec, index, count)
-                    response = await tp.send_data("prov-scan", message)
-                    APs += prov.scan_result_response(sec, response)
-                    remaining -= count
-                    index += count
-        except RuntimeError as e:
-            raise RuntimeError(e)
+            index = 0
+            remaining = result["count"]
+            readlen = DEFAULT_SCAN_BATCH
+            entry_size = 0
+            aps = []
+            while remaining:
+                count = min(remaining, readlen)
+                message = prov.scan_result_request(sec, index, count)
+                response = await tp.send_data("prov-scan", message)
+                APs = prov.scan_result_response(sec, response)
+                aps.extend(APs)
+                for ap in APs:
+                    yield ap
+                remaining -= count
+                index += count
+                # Largest entry so far (overhead included) sizes the next pages
+                entry_size = max(entry_size, -(-len(response) // max(1, len(APs))))
+                readlen = scan_page_size(mtu, entry_size, max_value_len)
+            if self.site_survey is not None:
+                self.site_survey.report(self.device_address, aps, group=self.iface)
+        except LINK_ERRORS as e:
+            raise link_error(e) from e
 
     async def reset_wifi(self):
+        if self._sec is None:
+            raise RuntimeError("Not connected")
+        self._require("wifi_ctrl")
         try:
             message = prov.ctrl_reset_request(self._sec)
             response = await self._tp.send_data("prov-ctrl", message)
             prov.ctrl_reset_response(self._sec, response)
 
-        except RuntimeError as e:
-            raise RuntimeError(e)
+        except LINK_ERRORS as e:
+            raise link_error(e) from e
 
-    async def reprov_wifi(self, tp, sec):
+    async def reprov_wifi(self, tp=None, sec=None):
+        tp = tp or self._tp
+        sec = sec or self._sec
+        if sec is None:
+            raise RuntimeError("Not connected")
+        self._require("wifi_ctrl")
         try:
             message = prov.ctrl_reprov_request(sec)
             response = await tp.send_data("prov-ctrl", message)
             prov.ctrl_reprov_response(sec, response)
 
-        except RuntimeError as e:
-            raise RuntimeError(e)
+        except LINK_ERRORS as e:
+            raise link_error(e) from e
 
-    async def prov_device(self):
-        self.log("==== Sending Wi-Fi Credentials to Target ====")
-        if not await self._send_wifi_config():
-            raise RuntimeError("Error in send Wi-Fi config")
-        self.log("==== Wi-Fi Credentials sent successfully ====")
+    # Steps of `prov_device`: send the credentials, apply them, wait for the Wi-Fi outcome
+    PROV_STEPS = ("config", "apply", "wait")
 
-        self.log("==== Applying Wi-Fi Config to Target ====")
-        if not await self._apply_wifi_config():
-            raise RuntimeError("Error in apply Wi-Fi config")
-        self.log("==== Apply config sent successfully ====")
-
-        await self._wait_wifi_connected()
+    async def prov_device(self, resume_from="config"):
+        """
+        Provision the Wi-Fi credentials, starting from step `resume_from` (see
+        PROV_STEPS) when the device already went through the earlier ones,
+        e.g. `prov_step` after a failure
+        """
+        with tracing.span("prov_device", device_address=self.device_address, resume_from=resume_from):
+            await self._prov_device(self.PROV_STEPS.index(resume_from))
+
+    async def _prov_device(self, start=0):
+        self.wifi_connected = False
+        if start <= 0:
+            self.log("==== Sending Wi-Fi Credentials to Target ====")
+            if not await self._send_wifi_config():
+                self.emit("failed", reason="Error in send Wi-Fi config")
+                raise RuntimeError("Error in send Wi-Fi config")
+            self.log("==== Wi-Fi Credentials sent successfully ====")
+            self.prov_step = "apply"
+            self.emit("config_sent")
+
+        if start <= 1:
+            self.log("==== Applying Wi-Fi Config to Target ====")
+            if not await self._apply_wifi_config():
+                self.emit("failed", reason="Error in apply Wi-Fi config")
+                raise RuntimeError("Error in apply Wi-Fi config")
+            self.log("==== Apply config sent successfully ====")
+            self.prov_step = "wait"
+            self.emit("applied")
+
+        join_start = time.monotonic()
+        with tracing.span("wait_wifi_connected") as span:
+            fail_reason = await self._wait_wifi_connected()
+            span.set_attribute("result", fail_reason or "connected")
+        metrics.WIFI_JOIN_SECONDS.labels(result=fail_reason or "connected").observe(time.monotonic() - join_start)
+        if fail_reason is not None:
+            # The device gave up joining, the credentials have to be sent again
+            self.prov_step = "config"
+            self.emit("failed", reason=fail_reason)
+            raise RuntimeError(f"Wi-Fi connection failed: {fail_reason}")
+        self.wifi_connected = True
+        self.prov_step = "config"
+        self.emit("wifi_connected")
 
     async def disconnect(self):
+        self._session_established = False
         await self._tp.disconnect()
 
     def log(self, msg):
         if self.verbose and self._logger:
             self._logger.info(msg=msg)
 
+    def emit(self, phase, **data):
+        """
+        Report a provisioning phase of the current device to `on_event` with
+        the time elapsed since `connect` and since the previous phase
+        """
+        now = time.monotonic()
+        event = {
+            "phase": phase,
+            "device_name": self.device_name,
+            "device_address": self.device_address,
+            "elapsed": now - self._start_time,
+            "phase_elapsed": now - self._phase_time,
+            **data,
+        }
+        self._phase_time = now
+        if phase == "failed":
+            metrics.FAILURES.labels(phase=self._last_phase, reason=metrics.failure_reason(data.get("reason"))).inc()
+        elif phase == "retry":
+            metrics.RETRIES.labels(phase=self._last_phase).inc()
+        else:
+            self._last_phase = phase
+        if self.on_event is not None:
+            self.on_event(event)
+
     # --- private methods ---
 
     def _init_logger(self):
         TAG = "BLEWiFiProvisioner"
-        self._logger = logging.getLogger(TAG)
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(f"[{TAG}] "+"%(levelname)s: %(message)s")
-        handler.setFormatter(formatter)
-        self._logger.addHandler(handler)
-        self._logger.setLevel(logging.INFO)
-
-    def _init_security(self, pop):
-        self._sec = security.Security1(pop, self.verbose)
+        logger = logging.getLogger(TAG)
+        # The logger is process wide, configure it once
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter(f"[{TAG}] "+"%(levelname)s: %(message)s")
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+        # Records of this provisioner name the device it is connected to
+        self._logger = DeviceLogger(logger, {"device": None})
+
+    async def _resolve_capabilities(self):
+        """
+        Capabilities of the connected device: its `proto-ver` from the
+        capability cache, else as the transport already read it, else read
+        from the device, and the endpoints the transport found
+        """
+        endpoints = self._tp.name_uuid_lookup
+        if self.capability_cache is not None:
+            proto_ver = await self.capability_cache.get(self.device_address)
+            if proto_ver is not None:
+                self.capabilities_source = "cache"
+                return DeviceCapabilities(proto_ver, endpoints)
+        proto_ver = getattr(self._tp, "proto_ver", None)
+        self.capabilities_source = "transport"
+        if proto_ver is None:
+            if "proto-ver" not in endpoints:
+                # Legacy firmware without proto-ver: security 1 and the basic commands
+                self.capabilities_source = "default"
+                return DeviceCapabilities("", endpoints)
+            proto_ver = await self.get_version()
+            self.capabilities_source = "device"
+        if self.capability_cache is not None:
+            await self.capability_cache.put(self.device_address, proto_ver)
+        return DeviceCapabilities(proto_ver, endpoints)
+
+    def _require(self, command):
+        # Skip the round trip of commands the firmware does not implement
+        if not self.supports(command):
+            raise RuntimeError(f"Command not supported by the device: {command}")
+
+    def _init_security(self, pop, sec_ver=1, username=None):
+        if sec_ver == 1:
+            self._sec = security.Security1(pop, self.verbose, key_pool=self.key_pool)
+        elif sec_ver == 2:
+            # The PoP is the SRP6a password
+            self._sec = security.Security2(
+                username, pop, self.verbose, ephemeral_pool=self.sec2_ephemeral_pool, executor=self.sec2_executor
+            )
+        else:
+            raise RuntimeError(f"Unsupported security scheme: {sec_ver}")
+        self._sec.device = self.device_address
 
     def _init_transport(self, iface="hci0"):
-        self._tp = transport.Transport_BLE(iface=iface, verbose=self.verbose)
+        self._tp = transport.Transport_BLE(
+            iface=iface, verbose=self.verbose, scanner=self.scanner, lookup_timeout=self.lookup_timeout,
+            gatt_cache=self.gatt_cache, adapter=self.adapter, exchange_mode=self.exchange_mode
+        )
 
     async def _establish_session(self):
         try:
+            # The SRP6a pow() calls of security 2 (ephemeral, premaster secret) never
+            # run on the event loop: a worker thread runs them, or waits on the executor
+            sec2 = isinstance(self._sec, security.Security2)
+            offload = self.handshake_offload or sec2
             response = None
             while True:
-                request = self._sec.security_session(response)
+                if offload and (response is not None or sec2):
+                    request = await asyncio.to_thread(self._sec.security_session, response)
+                else:
+                    request = self._sec.security_session(response)
                 if request is None:
                     break
                 response = await self._tp.send_data("prov-session", request)
                 if response is None:
                     return False
             return True
-        except RuntimeError as e:
-            raise RuntimeError(e)
+        except LINK_ERRORS as e:
+            raise link_error(e) from e
 
     async def _send_wifi_config(self):
         try:
@@ -191,49 +503,57 @@ class BLEWiFiProvisioner:
             )
             response = await self._tp.send_data("prov-config", message)
             return prov.config_set_config_response(self._sec, response) == 0
-        except RuntimeError as e:
-            raise RuntimeError(e)
+        except LINK_ERRORS as e:
+            raise link_error(e) from e
 
     async def _apply_wifi_config(self):
         try:
             message = prov.config_apply_config_request(self._sec)
             response = await self._tp.send_data("prov-config", message)
             return prov.config_apply_config_response(self._sec, response) == 0
-        except RuntimeError as e:
-            raise RuntimeError(e)
+        except LINK_ERRORS as e:
+            raise link_error(e) from e
 
     async def _get_wifi_config(self):
         try:
             message = prov.config_get_status_request(self._sec)
             response = await self._tp.send_data("prov-config", message)
             return prov.config_get_status_response(self._sec, response, verbose=self.verbose)
-        except RuntimeError as e:
-            raise RuntimeError(e)
+        except LINK_ERRORS as e:
+            raise link_error(e) from e
 
     async def _wait_wifi_connected(self):
         """
-        Wait for provisioning to report Wi-Fi is connected
+        Wait for provisioning to report Wi-Fi is connected, polling the status
+        without blocking the event loop: `wifi_poll_initial` delays first, then
+        exponential backoff by `wifi_poll_backoff` up to `wifi_poll_max_interval`,
+        giving up after `wifi_poll_timeout` seconds
 
-        Returns True if Wi-Fi connection succeeded, False if connection consistently failed
+        Returns None if Wi-Fi connection succeeded, otherwise the failure reason
+        ('auth_error', 'network_not_found', 'failed', 'disconnected', 'unknown' or 'timeout')
         """
-        TIME_PER_POLL = 5
-        retry = 3
-
-        while True:
-            time.sleep(TIME_PER_POLL)
-            ret = await self._get_wifi_config()
-            self.log(f"==== Wi-Fi connection state: {ret}  ====")
-            if ret == "connecting":
-                continue
-            elif ret == "connected":
+        deadline = time.monotonic() + self.wifi_poll_timeout
+        last_state = None
+
+        for delay in poll_delays(
+            self.wifi_poll_initial, self.wifi_poll_backoff, self.wifi_poll_max_interval
+        ):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(delay, remaining))
+            with tracing.span("wifi_status_poll") as span:
+                status = await self._get_wifi_config()
+                span.set_attribute("state", status["state"])
+            self.log(f"==== Wi-Fi connection state: {status['state']}  ====")
+            if status["state"] == "connected":
                 self.log("==== Provisioning was successful ====")
-                return True
-            elif retry > 0:
-                retry -= 1
-                self.log(
-                    "Waiting to poll status again (status %s, %d tries left)..."
-                    % (ret, retry)
-                )
-            else:
+                return None
+            elif status["state"] == "failed":
+                # Terminal state, the device will not retry with these credentials
                 self.log("---- Provisioning failed! ----")
-                return False
+                return status["fail_reason"] or "failed"
+            last_state = status["state"]
+
+        self.log("---- Provisioning failed! ----")
+        return "timeout" if last_state in (None, "connecting") else last_state
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger("BLEWiFiProvisioner.capabilities")
+
+# Characteristic value limit of protocomm_ble, and the results per ScanResult request known to fit it
+DEFAULT_MAX_VALUE_LEN = 256
+DEFAULT_SCAN_BATCH = 4
+# Encoded ScanResult entry with a 32 byte SSID (negative RSSI varints take 10 bytes)
+MAX_SCAN_ENTRY_SIZE = 60
+# ScanResult response fields besides the entries, plus the AES-GCM tag of security 2
+SCAN_RESULT_OVERHEAD = 8 + 16
+
+
+def scan_page_size(mtu, entry_size, max_value_len=DEFAULT_MAX_VALUE_LEN):
+    """
+    Results per ScanResult request: as many `entry_size` entries as fill the
+    whole ATT reads (MTU - 1 bytes each) that fit in the characteristic value
+    """
+    read_len = max(1, mtu - 1)
+    budget = min(max_value_len, max(1, max_value_len // read_len) * read_len)
+    return max(1, (budget - SCAN_RESULT_OVERHEAD) // max(1, entry_size))
+
+
+class DeviceCapabilities:
+    """
+    Parsed `proto-ver` response of a wifi_provisioning firmware, e.g.
+    {"prov": {"ver": "v1.1", "sec_ver": 2, "cap": ["wifi_scan"]}}, and the
+    names of the `endpoints` found in its GATT service
+    """
+
+    def __init__(self, proto_ver, endpoints=()):
+        self.proto_ver = proto_ver
+        self.endpoints = set(endpoints)
+        try:
+            info = json.loads(proto_ver)
+        except ValueError:
+            # Legacy firmware answers a bare version string
+            info = {"prov": {"ver": proto_ver}}
+        prov = info.get("prov", {}) if isinstance(info, dict) else {}
+        self.version = prov.get("ver", "")
+        self.cap = list(prov.get("cap", []))
+        # Firmware predating security 2 does not report sec_ver
+        self.sec_ver = 0 if "no_sec" in self.cap else prov.get("sec_ver", 1)
+        self.pop_required = "no_pop" not in self.cap and "no_sec" not in self.cap
+        self.max_value_len = DEFAULT_MAX_VALUE_LEN
+
+    @property
+    def commands(self):
+        commands = {"wifi_config"}
+        if "wifi_scan" in self.cap:
+            commands.add("wifi_scan")
+        # Reset / reprovision, if the firmware registered the endpoint
+        if "prov-ctrl" in self.endpoints:
+            commands.add("wifi_ctrl")
+        return commands
+
+    def supports(self, command):
+        return command in self.commands
+
+
+class CapabilityCache:
+    """
+    `proto-ver` responses by device address, kept in memory and, with a
+    `path`, as JSON on disk, read and written in a worker thread. A hit
+    spares the proto-ver round trip on reconnect and tells the security
+    scheme before the session.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = None
+        # Serializes loading and writing the file
+        self._lock = asyncio.Lock()
+
+    async def _load(self):
+        if self._entries is None:
+            async with self._lock:
+                if self._entries is None:
+                    self._entries = dict() if self.path is None else await asyncio.to_thread(self._read)
+        return self._entries
+
+    async def _save(self):
+        if self.path is None:
+            return
+        async with self._lock:
+            # Snapshot of the entries as they are now, they keep changing meanwhile
+            data = json.dumps(self._entries, indent=2, sort_keys=True)
+            await asyncio.to_thread(self._write, data)
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable capability cache {self.path}: {e}")
+        return dict()
+
+    def _write(self, data):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write capability cache {self.path}: {e}")
+
+    async def get(self, device_address):
+        # proto-ver response of the device, None if unknown
+        entry = (await self._load()).get(device_address)
+        return None if entry is None else entry["proto_ver"]
+
+    async def put(self, device_address, proto_ver):
+        entries = await self._load()
+        if entries.get(device_address, {}).get("proto_ver") == proto_ver:
+            return
+        entries[device_address] = {"proto_ver": proto_ver, "updated_at": time.time()}
+        await self._save()
+
+    async def invalidate(self, device_address):
+        if (await self._load()).pop(device_address, None) is not None:
+            logger.info(f"Invalidated capabilities of {device_address}")
+            await self._save()
@@ -0,0 +1,58 @@
+from prometheus_client import Counter, Histogram
+
+# BLE operations take from milliseconds (ATT round trips) to tens of seconds (scans, Wi-Fi join)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+SCAN_SECONDS = Histogram(
+    "ble_prov_scan_seconds", "BLE scans looking for devices", ["kind"], buckets=LATENCY_BUCKETS
+)
+CONNECT_SECONDS = Histogram(
+    "ble_prov_connect_seconds", "GATT connection setup, device lookup excluded", ["iface"], buckets=LATENCY_BUCKETS
+)
+DESCRIPTOR_READ_SECONDS = Histogram(
+    "ble_prov_descriptor_read_seconds", "Resolution of the protocomm endpoints on connect", ["source"],
+    buckets=LATENCY_BUCKETS,
+)
+HANDSHAKE_SECONDS = Histogram(
+    "ble_prov_handshake_seconds", "Protocomm session establishment", ["sec_ver"], buckets=LATENCY_BUCKETS
+)
+SEND_DATA_SECONDS = Histogram(
+    "ble_prov_send_data_seconds", "Protocomm request/response exchanges", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+WIFI_SCAN_SECONDS = Histogram(
+    "ble_prov_wifi_scan_seconds", "Wi-Fi scans run on the devices", buckets=LATENCY_BUCKETS
+)
+WIFI_JOIN_SECONDS = Histogram(
+    "ble_prov_wifi_join_seconds", "Apply config until the device reports the Wi-Fi outcome", ["result"],
+    buckets=LATENCY_BUCKETS,
+)
+RETRIES = Counter(
+    "ble_prov_retries_total", "Provisioning retries, by the last phase reached", ["phase"]
+)
+FAILURES = Counter(
+    "ble_prov_failures_total", "Provisioning failures, by the last phase reached and reason", ["phase", "reason"]
+)
+
+# Wi-Fi outcomes reported by `_wait_wifi_connected`, and error messages by kind
+WIFI_FAIL_REASONS = ("auth_error", "network_not_found", "failed", "disconnected", "unknown", "timeout")
+ERROR_KINDS = (
+    ("Device not found", "device_not_found"),
+    ("Failed to initialize transport", "transport"),
+    ("Failed to verify", "session_auth"),
+    ("Error in establishing session", "session"),
+    ("Error in send Wi-Fi config", "config"),
+    ("Error in apply Wi-Fi config", "apply"),
+    ("Command not supported", "unsupported"),
+    ("Unsupported security", "unsupported"),
+)
+
+
+def failure_reason(reason):
+    # Bounded label value for a failure reason (exception messages vary)
+    reason = reason or ""
+    if reason in WIFI_FAIL_REASONS:
+        return reason
+    for prefix, kind in ERROR_KINDS:
+        if reason.startswith(prefix):
+            return kind
+    return "error"
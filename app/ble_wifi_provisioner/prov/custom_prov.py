@@ -6,25 +6,20 @@
 
 import logging
 
-from ..utils import str_to_bytes
+from ..utils import Hex, log_verbose, str_to_bytes
 
 
 logger = logging.getLogger('BLEWiFiProvisioner.prov')
 
-def print_verbose(security_ctx, data):
-    if (security_ctx.verbose):
-        print(f'\x1b[32;20m++++ {data} ++++\x1b[0m')
-
-
 def custom_data_request(security_ctx, data):
     # Encrypt the custom data
     enc_cmd = security_ctx.encrypt_data(str_to_bytes(data))
-    print_verbose(security_ctx, f'Client -> Device (CustomData cmd): 0x{enc_cmd.hex()}')
-    return enc_cmd.decode('latin-1')
+    log_verbose(logger, security_ctx, 'Client -> Device (CustomData cmd): %s', Hex(enc_cmd))
+    return enc_cmd
 
 
 def custom_data_response(security_ctx, response_data):
     # Decrypt response packet
-    decrypt = security_ctx.decrypt_data(str_to_bytes(response_data))
-    print(f'++++ CustomData response: {str(decrypt)}++++')
+    decrypt = security_ctx.decrypt_data(response_data)
+    log_verbose(logger, security_ctx, 'CustomData response: %s', decrypt)
     return 0
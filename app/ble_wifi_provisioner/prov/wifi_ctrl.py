@@ -5,30 +5,25 @@
 # APIs for interpreting and creating protobuf packets for Wi-Fi State Controlling
 import logging
 from .. import proto
-from ..utils import str_to_bytes
+from ..utils import Hex, log_verbose
 
 logger = logging.getLogger('BLEWiFiProvisioner.prov')
 
-def print_verbose(security_ctx, data):
-    if (security_ctx.verbose):
-        logger.log(level=logging.INFO, msg=f'\x1b[32;20m++++ {data} ++++\x1b[0m')
-
-
 def ctrl_reset_request(security_ctx):
     # Form protobuf request packet for CtrlReset command
     cmd = proto.wifi_ctrl_pb2.WiFiCtrlPayload()
     cmd.msg = proto.wifi_ctrl_pb2.TypeCmdCtrlReset
     enc_cmd = security_ctx.encrypt_data(cmd.SerializeToString())
-    print_verbose(security_ctx, f'Client -> Device (Encrypted CmdCtrlReset): 0x{enc_cmd.hex()}')
-    return enc_cmd.decode('latin-1')
+    log_verbose(logger, security_ctx, 'Client -> Device (Encrypted CmdCtrlReset): %s', Hex(enc_cmd))
+    return enc_cmd
 
 
 def ctrl_reset_response(security_ctx, response_data):
     # Interpret protobuf response packet from CtrlReset command
-    dec_resp = security_ctx.decrypt_data(str_to_bytes(response_data))
+    dec_resp = security_ctx.decrypt_data(response_data)
     resp = proto.wifi_ctrl_pb2.WiFiCtrlPayload()
     resp.ParseFromString(dec_resp)
-    print_verbose(security_ctx, f'CtrlReset status: 0x{str(resp.status)}')
+    log_verbose(logger, security_ctx, 'CtrlReset status: 0x%s', resp.status)
     if resp.status != 0:
         raise RuntimeError
 
@@ -38,15 +33,15 @@ def ctrl_reprov_request(security_ctx):
     cmd = proto.wifi_ctrl_pb2.WiFiCtrlPayload()
     cmd.msg = proto.wifi_ctrl_pb2.TypeCmdCtrlReprov
     enc_cmd = security_ctx.encrypt_data(cmd.SerializeToString())
-    print_verbose(security_ctx, f'Client -> Device (Encrypted CmdCtrlReset): 0x{enc_cmd.hex()}')
-    return enc_cmd.decode('latin-1')
+    log_verbose(logger, security_ctx, 'Client -> Device (Encrypted CmdCtrlReset): %s', Hex(enc_cmd))
+    return enc_cmd
 
 
 def ctrl_reprov_response(security_ctx, response_data):
     # Interpret protobuf response packet from CtrlReprov command
-    dec_resp = security_ctx.decrypt_data(str_to_bytes(response_data))
+    dec_resp = security_ctx.decrypt_data(response_data)
     resp = proto.wifi_ctrl_pb2.WiFiCtrlPayload()
     resp.ParseFromString(dec_resp)
-    print_verbose(security_ctx, f'CtrlReset status: 0x{str(resp.status)}')
+    log_verbose(logger, security_ctx, 'CtrlReset status: 0x%s', resp.status)
     if resp.status != 0:
         raise RuntimeError
@@ -6,15 +6,10 @@
 
 from .. import proto
 import logging
-from ..utils import str_to_bytes
+from ..utils import Hex, log_verbose, str_to_bytes
 
 logger = logging.getLogger('BLEWiFiProvisioner.prov')
 
-def print_verbose(security_ctx, data):
-    if (security_ctx.verbose):
-        logger.log(level=logging.INFO, msg=f'\x1b[32;20m++++ {data} ++++\x1b[0m')
-
-
 def config_get_status_request(security_ctx):
     # Form protobuf request packet for GetStatus command
     cfg1 = proto.wifi_config_pb2.WiFiConfigPayload()
@@ -22,41 +17,44 @@ def config_get_status_request(security_ctx):
     cmd_get_status = proto.wifi_config_pb2.CmdGetStatus()
     cfg1.cmd_get_status.MergeFrom(cmd_get_status)
     encrypted_cfg = security_ctx.encrypt_data(cfg1.SerializeToString())
-    print_verbose(security_ctx, f'Client -> Device (Encrypted CmdGetStatus): 0x{encrypted_cfg.hex()}')
-    return encrypted_cfg.decode('latin-1')
+    log_verbose(logger, security_ctx, 'Client -> Device (Encrypted CmdGetStatus): %s', Hex(encrypted_cfg))
+    return encrypted_cfg
 
 
 def config_get_status_response(security_ctx, response_data, verbose):
     # Interpret protobuf response packet from GetStatus command
-    decrypted_message = security_ctx.decrypt_data(str_to_bytes(response_data))
+    decrypted_message = security_ctx.decrypt_data(response_data)
     cmd_resp1 = proto.wifi_config_pb2.WiFiConfigPayload()
     cmd_resp1.ParseFromString(decrypted_message)
-    print_verbose(security_ctx, f'CmdGetStatus type: {str(cmd_resp1.msg)}')
-    print_verbose(security_ctx, f'CmdGetStatus status: {str(cmd_resp1.resp_get_status.status)}')
+    log_verbose(logger, security_ctx, 'CmdGetStatus type: %s', cmd_resp1.msg)
+    log_verbose(logger, security_ctx, 'CmdGetStatus status: %s', cmd_resp1.resp_get_status.status)
 
+    status = {'state': 'unknown', 'fail_reason': None}
     if cmd_resp1.resp_get_status.sta_state == 0:
         if verbose:
             logger.log(level=logging.INFO, msg='==== WiFi state: Connected ====')
-        return 'connected'
+        status['state'] = 'connected'
     elif cmd_resp1.resp_get_status.sta_state == 1:
         if verbose:
             logger.log(level=logging.INFO, msg='++++ WiFi state: Connecting... ++++')
-        return 'connecting'
+        status['state'] = 'connecting'
     elif cmd_resp1.resp_get_status.sta_state == 2:
         if verbose:
             logger.log(level=logging.INFO, msg='---- WiFi state: Disconnected ----')
-        return 'disconnected'
+        status['state'] = 'disconnected'
     elif cmd_resp1.resp_get_status.sta_state == 3:
         if verbose:
             logger.log(level=logging.INFO, msg='---- WiFi state: Connection Failed ----')
+        status['state'] = 'failed'
         if cmd_resp1.resp_get_status.fail_reason == 0:
             if verbose:
                 logger.log(level=logging.INFO, msg='---- Failure reason: Incorrect Password ----')
+            status['fail_reason'] = 'auth_error'
         elif cmd_resp1.resp_get_status.fail_reason == 1:
             if verbose:
                 logger.log(level=logging.INFO, msg='---- Failure reason: Incorrect SSID ----')
-        return 'failed'
-    return 'unknown'
+            status['fail_reason'] = 'network_not_found'
+    return status
 
 
 def config_set_config_request(security_ctx, ssid, passphrase):
@@ -66,16 +64,16 @@ def config_set_config_request(security_ctx, ssid, passphrase):
     cmd.cmd_set_config.ssid = str_to_bytes(ssid)
     cmd.cmd_set_config.passphrase = str_to_bytes(passphrase)
     enc_cmd = security_ctx.encrypt_data(cmd.SerializeToString())
-    print_verbose(security_ctx, f'Client -> Device (SetConfig cmd): 0x{enc_cmd.hex()}')
-    return enc_cmd.decode('latin-1')
+    log_verbose(logger, security_ctx, 'Client -> Device (SetConfig cmd): %s', Hex(enc_cmd))
+    return enc_cmd
 
 
 def config_set_config_response(security_ctx, response_data):
     # Interpret protobuf response packet from SetConfig command
-    decrypt = security_ctx.decrypt_data(str_to_bytes(response_data))
+    decrypt = security_ctx.decrypt_data(response_data)
     cmd_resp4 = proto.wifi_config_pb2.WiFiConfigPayload()
     cmd_resp4.ParseFromString(decrypt)
-    print_verbose(security_ctx, f'SetConfig status: 0x{str(cmd_resp4.resp_set_config.status)}')
+    log_verbose(logger, security_ctx, 'SetConfig status: 0x%s', cmd_resp4.resp_set_config.status)
     return cmd_resp4.resp_set_config.status
 
 
@@ -84,14 +82,14 @@ def config_apply_config_request(security_ctx):
     cmd = proto.wifi_config_pb2.WiFiConfigPayload()
     cmd.msg = proto.wifi_config_pb2.TypeCmdApplyConfig
     enc_cmd = security_ctx.encrypt_data(cmd.SerializeToString())
-    print_verbose(security_ctx, f'Client -> Device (ApplyConfig cmd): 0x{enc_cmd.hex()}')
-    return enc_cmd.decode('latin-1')
+    log_verbose(logger, security_ctx, 'Client -> Device (ApplyConfig cmd): %s', Hex(enc_cmd))
+    return enc_cmd
 
 
 def config_apply_config_response(security_ctx, response_data):
     # Interpret protobuf response packet from ApplyConfig command
-    decrypt = security_ctx.decrypt_data(str_to_bytes(response_data))
+    decrypt = security_ctx.decrypt_data(response_data)
     cmd_resp5 = proto.wifi_config_pb2.WiFiConfigPayload()
     cmd_resp5.ParseFromString(decrypt)
-    print_verbose(security_ctx, f'ApplyConfig status: 0x{str(cmd_resp5.resp_apply_config.status)}')
+    log_verbose(logger, security_ctx, 'ApplyConfig status: 0x%s', cmd_resp5.resp_apply_config.status)
     return cmd_resp5.resp_apply_config.status
@@ -0,0 +1,130 @@
+import random
+import asyncio
+import logging
+
+from . import metrics
+from .utils import retry_delays
+
+logger = logging.getLogger("BLEWiFiProvisioner.retry")
+
+# Failure classes, see `classify_failure`
+SCAN_MISS = "scan_miss"
+GATT_ERROR = "gatt_error"
+HANDSHAKE_ERROR = "handshake_error"
+BAD_POP = "bad_pop"
+WRONG_PASSWORD = "wrong_password"
+AP_NOT_FOUND = "ap_not_found"
+WIFI_ERROR = "wifi_error"
+UNSUPPORTED = "unsupported"
+
+# Retrying with the same PoP, Wi-Fi credentials or firmware fails the same way
+NON_RETRYABLE = (BAD_POP, WRONG_PASSWORD, UNSUPPORTED)
+
+WIFI_FAILED = "Wi-Fi connection failed: "
+
+
+def classify_failure(reason, phase):
+    """
+    Failure class of a provisioning failure from its `reason` (exception
+    message) and the last phase the device reached (BLEWiFiProvisioner.phase)
+    """
+    reason = reason or ""
+    if reason.startswith(WIFI_FAILED):
+        reason = reason[len(WIFI_FAILED):]
+    kind = metrics.failure_reason(reason)
+    if kind == "device_not_found":
+        return SCAN_MISS
+    if kind == "session_auth":
+        return BAD_POP
+    if kind == "auth_error":
+        return WRONG_PASSWORD
+    if kind == "network_not_found":
+        return AP_NOT_FOUND
+    if kind == "unsupported":
+        return UNSUPPORTED
+    if kind in metrics.WIFI_FAIL_REASONS:
+        return WIFI_ERROR
+    if kind == "session" or phase == "connected":
+        return HANDSHAKE_ERROR
+    return GATT_ERROR
+
+
+def recovery(failure, phase, link_connected):
+    """
+    What a retry has to redo before resuming `prov_device`: "connect" (link
+    and session) if the link is down, "reprov" (reset the Wi-Fi state machine
+    of the device) if it gave up joining, else "session" since a failed
+    exchange may have left the ciphers of both ends out of step
+    """
+    if failure == SCAN_MISS or not link_connected or phase == "scanning":
+        return "connect"
+    if failure in (AP_NOT_FOUND, WIFI_ERROR):
+        return "reprov"
+    return "session"
+
+
+class RetryPolicy:
+    """
+    Up to `max_attempts` attempts per device, separated by jittered
+    exponential backoff (see utils.retry_delays). NON_RETRYABLE failures
+    are not retried.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=8.0, jitter=0.5, rng=None):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def delays(self):
+        return retry_delays(self.backoff, 2.0, self.max_backoff, self.jitter, self.rng)
+
+    def retryable(self, failure):
+        return failure not in NON_RETRYABLE
+
+
+async def provision(provisioner, device, policy=None):
+    """
+    Connect `provisioner` to `device` (BLEWiFiProvisioner.connect keyword
+    arguments) and provision it, retrying per `policy`. A retry resumes
+    from the step that failed (`provisioner.prov_step`): the link is set up
+    again only if it dropped and the credentials are sent again only if the
+    device gave up joining.
+
+    Returns a dict with "provisioned", "attempts", "error" and "failure"
+    (class of the last failure). Never raises but on cancellation.
+    """
+    policy = policy or RetryPolicy()
+    delays = policy.delays()
+    step = "connect"
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if step == "connect":
+                if provisioner.link_connected:
+                    await provisioner.disconnect()
+                await provisioner.connect(**device)
+            elif step == "session":
+                await provisioner.restart_session()
+            elif step == "reprov" and provisioner.supports("wifi_ctrl"):
+                await provisioner.reprov_wifi()
+            await provisioner.prov_device(resume_from=provisioner.prov_step)
+            return {"provisioned": True, "attempts": attempt, "error": None, "failure": None}
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            failure = classify_failure(error, provisioner.phase)
+            if attempt >= policy.max_attempts or not policy.retryable(failure):
+                return {"provisioned": False, "attempts": attempt, "error": error, "failure": failure}
+            step = recovery(failure, provisioner.phase, provisioner.link_connected)
+            delay = next(delays)
+            logger.debug(
+                f"{provisioner.device_address}: {failure} ({error}), redoing {step} and resuming "
+                f"{provisioner.prov_step} in {delay:.2f}s"
+            )
+            provisioner.emit(
+                "retry", reason=error, attempt=attempt + 1, failure=failure,
+                recovery=step, resume_from=provisioner.prov_step,
+            )
+            await asyncio.sleep(delay)
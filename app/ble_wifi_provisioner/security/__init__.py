@@ -3,3 +3,5 @@
 #
 
 from .security1 import *  # noqa: F403, F401
+from .security2 import *  # noqa: F403, F401
+from .keypool import *  # noqa: F403, F401
@@ -0,0 +1,78 @@
+# Pool of ephemeral keypairs pre-generated off the event loop for security1/2 handshakes
+
+import logging
+import threading
+from collections import deque
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+logger = logging.getLogger('BLEWiFiProvisioner.security')
+
+
+def generate_keypair():
+    # (private key, raw public key bytes)
+    private_key = X25519PrivateKey.generate()
+    public_key = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.Raw,
+        format=serialization.PublicFormat.Raw)
+    return private_key, public_key
+
+
+class KeyPool:
+    """
+    Keeps up to `size` keypairs made by `factory` (X25519 by default) ready,
+    refilled by a background thread named `name`. Every keypair is handed
+    out once; when the pool runs dry (or was not started) keypairs are
+    generated inline, which is counted as a miss.
+    """
+
+    def __init__(self, size=32, factory=generate_keypair, name='keypool'):
+        self.size = size
+        self.factory = factory
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._keys = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._fill, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get(self):
+        with self._cond:
+            if self._keys:
+                self.hits += 1
+                self._cond.notify()
+                return self._keys.popleft()
+            self.misses += 1
+        return self.factory()
+
+    def stats(self):
+        return {'size': self.size, 'available': len(self._keys), 'hits': self.hits, 'misses': self.misses}
+
+    def _fill(self):
+        while True:
+            with self._cond:
+                while self._running and len(self._keys) >= self.size:
+                    self._cond.wait()
+                if not self._running:
+                    return
+            keypair = self.factory()
+            with self._cond:
+                self._keys.append(keypair)
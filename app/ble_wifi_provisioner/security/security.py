@@ -8,3 +8,5 @@
 class Security:
     def __init__(self, security_session):
         self.security_session = security_session
+        # Address of the device, prefixing the log records of the exchange
+        self.device = None
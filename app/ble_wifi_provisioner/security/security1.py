@@ -8,18 +8,28 @@
 from .. import proto
 import logging
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PublicKey
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from ..utils import long_to_bytes, str_to_bytes
+from ..utils import Hex, log_verbose, str_to_bytes
 
+from .keypool import generate_keypair
 from .security import Security
 
 logger = logging.getLogger('BLEWiFiProvisioner.security')
 
 
 def a_xor_b(a: bytes, b: bytes) -> bytes:
-    return b''.join(long_to_bytes(a[i] ^ b[i]) for i in range(0, len(b)))
+    # XOR of the first len(b) bytes of a with b, as one integer operation
+    n = len(b)
+    return (int.from_bytes(a[:n], 'big') ^ int.from_bytes(b, 'big')).to_bytes(n, 'big')
+
+
+def pop_digest(pop: bytes) -> bytes:
+    # SHA256 of the PoP, mixed into the session key
+    h = hashes.Hash(hashes.SHA256(), backend=default_backend())
+    h.update(pop)
+    return h.finalize()
 
 
 # Enum for state of protocomm_security1 FSM
@@ -31,11 +41,13 @@ class security_state:
 
 
 class Security1(Security):
-    def __init__(self, pop, verbose):
+    def __init__(self, pop, verbose, key_pool=None):
         # Initialize state of the security1 FSM
         self.session_state = security_state.REQUEST1
         self.pop = str_to_bytes(pop)
         self.verbose = verbose
+        # Optional KeyPool handing out pre-generated client keypairs
+        self.key_pool = key_pool
         Security.__init__(self, self.security1_session)
 
     def security1_session(self, response_data):
@@ -57,15 +69,9 @@ class Security1(Security):
         return None
 
     def __generate_key(self):
-        # Generate private and public key pair for client
-        self.client_private_key = X25519PrivateKey.generate()
-        self.client_public_key = self.client_private_key.public_key().public_bytes(
-            encoding=serialization.Encoding.Raw,
-            format=serialization.PublicFormat.Raw)
-
-    def _print_verbose(self, data):
-        if (self.verbose):
-            logger.log(level=logging.INFO, msg=f'\x1b[32;20m++++ {data} ++++\x1b[0m')
+        # Generate (or take a ready-made) private and public key pair for client
+        keypair = self.key_pool.get() if self.key_pool is not None else generate_keypair()
+        self.client_private_key, self.client_public_key = keypair
 
     def setup0_request(self):
         # Form SessionCmd0 request packet using client public key
@@ -73,37 +79,33 @@ class Security1(Security):
         setup_req.sec_ver = proto.session_pb2.SecScheme1
         self.__generate_key()
         setup_req.sec1.sc0.client_pubkey = self.client_public_key
-        self._print_verbose(f'Client Public Key:\t0x{self.client_public_key.hex()}')
-        return setup_req.SerializeToString().decode('latin-1')
+        log_verbose(logger, self, 'Client Public Key:\t%s', Hex(self.client_public_key))
+        return setup_req.SerializeToString()
 
     def setup0_response(self, response_data):
         # Interpret SessionResp0 response packet
         setup_resp = proto.session_pb2.SessionData()
-        setup_resp.ParseFromString(str_to_bytes(response_data))
-        self._print_verbose('Security version:\t' + str(setup_resp.sec_ver))
+        setup_resp.ParseFromString(response_data)
+        log_verbose(logger, self, 'Security version:\t%s', setup_resp.sec_ver)
         if setup_resp.sec_ver != proto.session_pb2.SecScheme1:
             raise RuntimeError('Incorrect security scheme')
 
         self.device_public_key = setup_resp.sec1.sr0.device_pubkey
         # Device random is the initialization vector
         device_random = setup_resp.sec1.sr0.device_random
-        self._print_verbose(f'Device Public Key:\t0x{self.device_public_key.hex()}')
-        self._print_verbose(f'Device Random:\t0x{device_random.hex()}')
+        log_verbose(logger, self, 'Device Public Key:\t%s', Hex(self.device_public_key))
+        log_verbose(logger, self, 'Device Random:\t%s', Hex(device_random))
 
         # Calculate Curve25519 shared key using Client private key and Device public key
         sharedK = self.client_private_key.exchange(X25519PublicKey.from_public_bytes(self.device_public_key))
-        self._print_verbose(f'Shared Key:\t0x{sharedK.hex()}')
+        log_verbose(logger, self, 'Shared Key:\t%s', Hex(sharedK))
 
         # If PoP is provided, XOR SHA256 of PoP with the previously
         # calculated Shared Key to form the actual Shared Key
         if len(self.pop) > 0:
-            # Calculate SHA256 of PoP
-            h = hashes.Hash(hashes.SHA256(), backend=default_backend())
-            h.update(self.pop)
-            digest = h.finalize()
-            # XOR with and update Shared Key
-            sharedK = a_xor_b(sharedK, digest)
-            self._print_verbose(f'Updated Shared Key (Shared key XORed with PoP):\t0x{sharedK.hex()}')
+            # XOR with SHA256 of PoP and update Shared Key
+            sharedK = a_xor_b(sharedK, pop_digest(bytes(self.pop)))
+            log_verbose(logger, self, 'Updated Shared Key (Shared key XORed with PoP):\t%s', Hex(sharedK))
         # Initialize the encryption engine with Shared Key and initialization vector
         cipher = Cipher(algorithms.AES(sharedK), modes.CTR(device_random), backend=default_backend())
         self.cipher = cipher.encryptor()
@@ -115,19 +117,19 @@ class Security1(Security):
         setup_req.sec1.msg = proto.sec1_pb2.Session_Command1
         # Encrypt device public key and attach to the request packet
         client_verify = self.cipher.update(self.device_public_key)
-        self._print_verbose(f'Client Proof:\t0x{client_verify.hex()}')
+        log_verbose(logger, self, 'Client Proof:\t%s', Hex(client_verify))
         setup_req.sec1.sc1.client_verify_data = client_verify
-        return setup_req.SerializeToString().decode('latin-1')
+        return setup_req.SerializeToString()
 
     def setup1_response(self, response_data):
         # Interpret SessionResp1 response packet
         setup_resp = proto.session_pb2.SessionData()
-        setup_resp.ParseFromString(str_to_bytes(response_data))
+        setup_resp.ParseFromString(response_data)
         # Ensure security scheme matches
         if setup_resp.sec_ver == proto.session_pb2.SecScheme1:
             # Read encrypyed device verify string
             device_verify = setup_resp.sec1.sr1.device_verify_data
-            self._print_verbose(f'Device Proof:\t0x{device_verify.hex()}')
+            log_verbose(logger, self, 'Device Proof:\t%s', Hex(device_verify))
             # Decrypt the device verify string
             enc_client_pubkey = self.cipher.update(setup_resp.sec1.sr1.device_verify_data)
             # Match decryped string with client public key
@@ -0,0 +1,119 @@
+# SPDX-FileCopyrightText: 2018-2023 Espressif Systems (Shanghai) CO LTD
+# SPDX-License-Identifier: Apache-2.0
+#
+
+# APIs for interpreting and creating protobuf packets for
+# protocomm endpoint with security type protocomm_security2
+
+from .. import proto
+import logging
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from ..utils import Hex, log_verbose, long_to_bytes, str_to_bytes
+
+from .security import Security
+from .security1 import security_state
+from .srp6a import Srp6a
+
+logger = logging.getLogger('BLEWiFiProvisioner.security')
+
+# Username of the ESP-IDF wifi_provisioning manager
+DEFAULT_USERNAME = 'wifiprov'
+
+
+class Security2(Security):
+    def __init__(self, username, password, verbose, ephemeral_pool=None, executor=None):
+        # Initialize state of the security2 FSM
+        self.session_state = security_state.REQUEST1
+        self.username = str_to_bytes(username or DEFAULT_USERNAME)
+        self.password = str_to_bytes(password)
+        self.verbose = verbose
+        # Optional KeyPool of SRP6a ephemerals (srp6a.generate_ephemeral) and
+        # concurrent.futures executor running the SRP6a premaster secret
+        self.ephemeral_pool = ephemeral_pool
+        self.executor = executor
+        self.srp6a_ctx = None
+        self.cipher = None
+        self.nonce = None
+        Security.__init__(self, self.security2_session)
+
+    def security2_session(self, response_data):
+        # protocomm security2 FSM which interprets/forms
+        # protobuf packets according to present state of session
+        if (self.session_state == security_state.REQUEST1):
+            self.session_state = security_state.RESPONSE1_REQUEST2
+            return self.setup0_request()
+        elif (self.session_state == security_state.RESPONSE1_REQUEST2):
+            self.session_state = security_state.RESPONSE2
+            self.setup0_response(response_data)
+            return self.setup1_request()
+        elif (self.session_state == security_state.RESPONSE2):
+            self.session_state = security_state.FINISHED
+            self.setup1_response(response_data)
+            return None
+
+        logger.log(level=logging.INFO, msg='Unexpected state')
+        return None
+
+    def setup0_request(self):
+        # Form SessionCmd0 request packet using username and client public key
+        ephemeral = self.ephemeral_pool.get() if self.ephemeral_pool is not None else None
+        self.srp6a_ctx = Srp6a(self.username, self.password, ephemeral=ephemeral, executor=self.executor)
+        setup_req = proto.session_pb2.SessionData()
+        setup_req.sec_ver = proto.session_pb2.SecScheme2
+        setup_req.sec2.msg = proto.sec2_pb2.S2Session_Command0
+        setup_req.sec2.sc0.client_username = self.username
+        setup_req.sec2.sc0.client_pubkey = long_to_bytes(self.srp6a_ctx.A)
+        log_verbose(logger, self, 'Client Public Key:\t%s', Hex(setup_req.sec2.sc0.client_pubkey))
+        return setup_req.SerializeToString()
+
+    def setup0_response(self, response_data):
+        # Interpret SessionResp0 response packet
+        setup_resp = proto.session_pb2.SessionData()
+        setup_resp.ParseFromString(response_data)
+        log_verbose(logger, self, 'Security version:\t%s', setup_resp.sec_ver)
+        if setup_resp.sec_ver != proto.session_pb2.SecScheme2:
+            raise RuntimeError('Incorrect security scheme')
+        if setup_resp.sec2.sr0.status != proto.constants_pb2.Success:
+            raise RuntimeError('Failed to verify username!')
+
+        device_pubkey = setup_resp.sec2.sr0.device_pubkey
+        device_salt = setup_resp.sec2.sr0.device_salt
+        log_verbose(logger, self, 'Device Public Key:\t%s', Hex(device_pubkey))
+        log_verbose(logger, self, 'Device Salt:\t%s', Hex(device_salt))
+        # Client proof, from the verifier and the premaster secret
+        self.client_proof = self.srp6a_ctx.process_challenge(device_salt, device_pubkey)
+
+    def setup1_request(self):
+        # Form SessionCmd1 request packet using client proof
+        setup_req = proto.session_pb2.SessionData()
+        setup_req.sec_ver = proto.session_pb2.SecScheme2
+        setup_req.sec2.msg = proto.sec2_pb2.S2Session_Command1
+        setup_req.sec2.sc1.client_proof = self.client_proof
+        log_verbose(logger, self, 'Client Proof:\t%s', Hex(self.client_proof))
+        return setup_req.SerializeToString()
+
+    def setup1_response(self, response_data):
+        # Interpret SessionResp1 response packet
+        setup_resp = proto.session_pb2.SessionData()
+        setup_resp.ParseFromString(response_data)
+        # Ensure security scheme matches
+        if setup_resp.sec_ver == proto.session_pb2.SecScheme2:
+            if setup_resp.sec2.sr1.status != proto.constants_pb2.Success:
+                raise RuntimeError('Failed to verify device!')
+            device_proof = setup_resp.sec2.sr1.device_proof
+            log_verbose(logger, self, 'Device Proof:\t%s', Hex(device_proof))
+            self.srp6a_ctx.verify_session(device_proof)
+            if not self.srp6a_ctx.authenticated():
+                raise RuntimeError('Failed to verify device!')
+            # AES-GCM with the first 256 bits of the session key and the device nonce
+            self.nonce = setup_resp.sec2.sr1.device_nonce
+            self.cipher = AESGCM(self.srp6a_ctx.K[:32])
+            log_verbose(logger, self, 'Nonce:\t%s', Hex(self.nonce))
+        else:
+            raise RuntimeError('Unsupported security protocol')
+
+    def encrypt_data(self, data):
+        return self.cipher.encrypt(self.nonce, bytes(data), None)
+
+    def decrypt_data(self, data):
+        return self.cipher.decrypt(self.nonce, bytes(data), None)
@@ -0,0 +1,137 @@
+# SRP6a (RFC 5054, 3072-bit group, SHA512) as used by protocomm security2.
+# The big-integer math lives in module level functions so that it can be
+# run in an executor (ephemerals, session key).
+
+import hashlib
+import secrets
+
+from ..utils import bytes_to_long, long_to_bytes
+
+# RFC 5054 3072-bit group
+N = int(
+    'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74020BBEA6'
+    '3B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245'
+    'E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7EDEE386BFB5A899FA5AE9F2411'
+    '7C4B1FE649286651ECE45B3DC2007CB8A163BF0598DA48361C55D39A69163FA8FD24CF5F'
+    '83655D23DCA3AD961C62F356208552BB9ED529077096966D670C354E4ABC9804F1746C08'
+    'CA18217C32905E462E36CE3BE39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9'
+    'DE2BCBF6955817183995497CEA956AE515D2261898FA051015728E5A8AAAC42DAD33170D'
+    '04507A33A85521ABDF1CBA64ECFB850458DBEF0A8AEA71575D060C7DB3970F85A6E1E4C7'
+    'ABF5AE8CDB0933D71E8C94E04A25619DCEE3D2261AD2EE6BF12FFA06D98A0864D8760273'
+    '3EC86A64521F2B18177B200CBBE117577A615D6C770988C0BAD946E208E24FA074E5AB31'
+    '43DB5BFCE0FD108E4B82D120A93AD2CAFFFFFFFFFFFFFFFF', 16)
+g = 5
+N_LEN = (N.bit_length() + 7) // 8
+
+
+def H(*args, width=None):
+    # Hash of the concatenated arguments (ints as big endian, left padded to `width`)
+    h = hashlib.sha512()
+    for arg in args:
+        data = long_to_bytes(arg) if isinstance(arg, int) else arg
+        if width is not None:
+            data = b'\x00' * (width - len(data)) + data
+        h.update(data)
+    return bytes_to_long(h.digest())
+
+
+# Multiplier parameter k = H(N | PAD(g))
+k = H(N, g, width=N_LEN)
+
+
+def _hn_xor_hg():
+    hn = hashlib.sha512(long_to_bytes(N)).digest()
+    hg = hashlib.sha512(long_to_bytes(g).rjust(N_LEN, b'\x00')).digest()
+    return bytes(a ^ b for a, b in zip(hn, hg))
+
+
+HN_XOR_HG = _hn_xor_hg()
+
+
+def generate_ephemeral():
+    # Client ephemeral (a, A), see security.KeyPool
+    a = secrets.randbits(256)
+    return a, pow(g, a, N)
+
+
+def ephemeral_factory(executor=None):
+    # KeyPool factory; with an executor (process pool) the pool thread waits
+    # without holding the GIL, which a 3072-bit pow() never releases
+    if executor is None:
+        return generate_ephemeral
+    return lambda: executor.submit(generate_ephemeral).result()
+
+
+def verifier(username: bytes, password: bytes, salt: bytes):
+    """
+    Private key x = H(s | H(I | ':' | p)) and verifier v = g^x, identical for
+    every device sharing credentials and salt
+    """
+    x = H(salt, long_to_bytes(H(username + b':' + password)))
+    return x, pow(g, x, N)
+
+
+def client_premaster_secret(a, A, B, x, v):
+    # S = (B - k * g^x)^(a + u * x), the expensive step of the client
+    u = H(A, B, width=N_LEN)
+    if u == 0:
+        raise RuntimeError('Invalid SRP6a device public key')
+    return pow((B - k * v) % N, a + u * x, N)
+
+
+def server_premaster_secret(A, b, v, B):
+    # S = (A * v^u)^b, as computed by the device
+    u = H(A, B, width=N_LEN)
+    return pow(A * pow(v, u, N) % N, b, N)
+
+
+def client_proof(username: bytes, salt: bytes, A, B, K):
+    # M = H(H(N) xor H(g) | H(I) | s | A | B | K)
+    h = hashlib.sha512()
+    for part in (HN_XOR_HG, hashlib.sha512(username).digest(), salt, long_to_bytes(A), long_to_bytes(B), K):
+        h.update(part)
+    return h.digest()
+
+
+def server_proof(A, M, K):
+    # H(A | M | K)
+    return hashlib.sha512(long_to_bytes(A) + M + K).digest()
+
+
+class Srp6a:
+    """
+    Client side of one SRP6a exchange. `ephemeral` is a ready-made (a, A)
+    pair; `executor` (concurrent.futures) runs the premaster secret.
+    """
+
+    def __init__(self, username, password, ephemeral=None, executor=None):
+        self.username = username
+        self.password = password
+        self.a, self.A = ephemeral if ephemeral is not None else generate_ephemeral()
+        self.executor = executor
+        self.K = None
+        self.M = None
+        self._H_AMK = None
+        self._authenticated = False
+
+    def process_challenge(self, salt: bytes, B_bytes: bytes) -> bytes:
+        B = bytes_to_long(B_bytes)
+        # The salt goes through an integer, dropping leading zero bytes, as in esp_prov
+        salt = long_to_bytes(bytes_to_long(salt))
+        if B % N == 0:
+            raise RuntimeError('Invalid SRP6a device public key')
+        x, v = verifier(self.username, self.password, salt)
+        if self.executor is not None:
+            S = self.executor.submit(client_premaster_secret, self.a, self.A, B, x, v).result()
+        else:
+            S = client_premaster_secret(self.a, self.A, B, x, v)
+        self.K = hashlib.sha512(long_to_bytes(S)).digest()
+        self.M = client_proof(self.username, salt, self.A, B, self.K)
+        self._H_AMK = server_proof(self.A, self.M, self.K)
+        return self.M
+
+    def verify_session(self, device_proof: bytes):
+        self._authenticated = device_proof == self._H_AMK
+
+    def authenticated(self):
+        return self._authenticated
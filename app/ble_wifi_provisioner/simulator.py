@@ -0,0 +1,49 @@
+from contextlib import asynccontextmanager
+
+from .ble_wifi_provisioner import BLEWiFiProvisioner
+from .transport import SimulatedESP32Device, Transport_Sim
+
+
+class SimulatedFleet:
+    """
+    Virtual devices handing out provisioner sessions the way BLEAdapterManager
+    does, so the provisioning engine can run hundreds of devices without
+    radios. Every session gets its own Transport_Sim built with `transport_kwargs`.
+    """
+
+    def __init__(self, devices=(), provisioner_kwargs=None, **transport_kwargs):
+        self.devices = {device.address: device for device in devices}
+        self.provisioner_kwargs = dict(provisioner_kwargs or {})
+        self.transport_kwargs = transport_kwargs
+
+    @classmethod
+    def generate(cls, count, pop="abcd1234", provisioner_kwargs=None, device_kwargs=None, **transport_kwargs):
+        devices = [
+            SimulatedESP32Device(
+                name=f"ESP32_{i:06X}",
+                address=f"B0:A7:32:{(i >> 16) & 0xFF:02X}:{(i >> 8) & 0xFF:02X}:{i & 0xFF:02X}",
+                pop=pop,
+                **(device_kwargs or {}),
+            )
+            for i in range(count)
+        ]
+        return cls(devices, provisioner_kwargs, **transport_kwargs)
+
+    def device_list(self, pop="abcd1234"):
+        # Keyword arguments of BLEWiFiProvisioner.connect for every device
+        return [
+            {"device_name": d.name, "device_address": d.address, "device_pop": pop}
+            for d in self.devices.values()
+        ]
+
+    def provisioner(self, **kwargs):
+        transport = Transport_Sim(list(self.devices.values()), **self.transport_kwargs)
+        return BLEWiFiProvisioner(transport=transport, **{**self.provisioner_kwargs, **kwargs})
+
+    @asynccontextmanager
+    async def session(self, device=None, iface=None, **kwargs):
+        provisioner = self.provisioner(**kwargs)
+        try:
+            yield provisioner
+        finally:
+            await provisioner.disconnect()
@@ -0,0 +1,82 @@
+import time
+import logging
+
+logger = logging.getLogger("BLEWiFiProvisioner.survey")
+
+
+class SiteSurvey:
+    """
+    Wi-Fi scan results reported by the devices, by BSSID, with the RSSI each
+    reporting device measured. Reports expire after `ttl` seconds. A fresh
+    report of a device stands in for another scan on it; the reports of the
+    devices on one adapter (`group`, the HCI interface) may stand in for one
+    another only where they are known to be close together.
+    """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        # bssid -> {"ssid", "channel", "auth", "reports": {reporter: (rssi, group, seen_at)}}
+        self._aps = dict()
+
+    def report(self, reporter, aps, group=None):
+        # Results of a complete scan run on `reporter` (device address)
+        now = time.monotonic()
+        self._expire(now)
+        for ap in aps:
+            entry = self._aps.setdefault(ap["bssid"], {"reports": dict()})
+            entry.update(ssid=ap["ssid"], channel=ap["channel"], auth=ap["auth"])
+            entry["reports"][reporter] = (ap["rssi"], group, now)
+        logger.debug(f"{reporter} reported {len(aps)} access points")
+
+    def fresh(self, reporter=None, group=None, max_age=None):
+        # Whether `reporter` (or a device of `group`) reported a scan within `max_age` (default the TTL)
+        return bool(self.aps(reporter=reporter, group=group, max_age=max_age))
+
+    def aps(self, reporter=None, group=None, max_age=None):
+        """
+        Access points reported within `max_age` seconds, by `reporter` and/or
+        the devices of `group` if given, strongest first. `rssi` is the best
+        one measured, `avg_rssi` the mean over the reporting devices and `age`
+        the newest report's.
+        """
+        now = time.monotonic()
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        aps = []
+        for bssid, entry in self._aps.items():
+            reports = [
+                (rssi, seen_at) for _reporter, (rssi, _group, seen_at) in entry["reports"].items()
+                if now - seen_at <= max_age and (group is None or _group == group)
+                and (reporter is None or _reporter == reporter)
+            ]
+            if not reports:
+                continue
+            rssis = [rssi for rssi, _ in reports]
+            aps.append({
+                "ssid": entry["ssid"],
+                "bssid": bssid,
+                "channel": entry["channel"],
+                "auth": entry["auth"],
+                "rssi": max(rssis),
+                "avg_rssi": sum(rssis) / len(rssis),
+                "reporters": len(reports),
+                "age": now - max(seen_at for _, seen_at in reports),
+            })
+        aps.sort(key=lambda ap: ap["rssi"], reverse=True)
+        return aps
+
+    def channels(self, group=None, max_age=None):
+        # Per channel: access points heard and the strongest RSSI, least crowded first
+        channels = dict()
+        for ap in self.aps(group=group, max_age=max_age):
+            channel = channels.setdefault(ap["channel"], {"channel": ap["channel"], "aps": 0, "max_rssi": ap["rssi"]})
+            channel["aps"] += 1
+            channel["max_rssi"] = max(channel["max_rssi"], ap["rssi"])
+        return sorted(channels.values(), key=lambda c: (c["aps"], c["max_rssi"]))
+
+    def _expire(self, now):
+        for bssid in list(self._aps):
+            reports = self._aps[bssid]["reports"]
+            for reporter in [r for r, (_, _, seen_at) in reports.items() if now - seen_at > self.ttl]:
+                del reports[reporter]
+            if not reports:
+                del self._aps[bssid]
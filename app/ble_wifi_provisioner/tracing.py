@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import logging
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger("BLEWiFiProvisioner.tracing")
+
+# Attributes children take over from their parent span, correlating the spans of a batch and a device
+INHERITED_ATTRIBUTES = ("batch_id", "device_address")
+
+_current_span = contextvars.ContextVar("ble_prov_current_span", default=None)
+_exporters = []
+
+
+class Span:
+    """
+    Timed operation in the OpenTelemetry shape: one trace per root span (e.g.
+    a provisioning batch), parent/child links and attributes. Exported when
+    it ends, as a dict (see `to_dict`).
+    """
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict()
+        if parent is not None:
+            for key in INHERITED_ATTRIBUTES:
+                if key in parent.attributes:
+                    self.attributes[key] = parent.attributes[key]
+        self.attributes.update(attributes or {})
+        self.status = "OK"
+        self.start_time = time.time()
+        self.end_time = None
+        self._start = time.monotonic()
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        self.status = "ERROR"
+        self.attributes["error"] = str(error) or type(error).__name__
+
+    def end(self):
+        if self.end_time is not None:
+            return
+        self.end_time = self.start_time + (time.monotonic() - self._start)
+        for exporter in _exporters:
+            try:
+                exporter.export(self)
+            except Exception as e:
+                logger.warning(f"Failed to export span {self.name}: {e}")
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": None if self.end_time is None else self.end_time - self.start_time,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    # Handed out while no exporter is set, so disabled tracing costs next to nothing
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def enabled():
+    return bool(_exporters)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_span(name, parent=None, **attributes):
+    """
+    Span to be ended by the caller, a child of `parent` (default the current
+    span) that does not become the current span, e.g. one that outlives
+    the tasks it is the parent of
+    """
+    if not _exporters:
+        return NOOP_SPAN
+    if parent is None or parent is NOOP_SPAN:
+        parent = _current_span.get()
+    return Span(name, parent=parent, attributes=attributes)
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    # Current span for the duration of the block; exceptions mark it as failed
+    if not _exporters:
+        yield NOOP_SPAN
+        return
+    _span = start_span(name, parent=parent, **attributes)
+    token = _current_span.set(_span)
+    try:
+        yield _span
+    except BaseException as e:
+        _span.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        _span.end()
+
+
+class ConsoleSpanExporter:
+    # One JSON object per ended span on `stream` (stderr by default)
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stderr
+
+    def export(self, span):
+        self.stream.write(json.dumps(span.to_dict()) + "\n")
+
+    def shutdown(self):
+        self.stream.flush()
+
+
+class JsonlSpanExporter:
+    # Ended spans appended to `path` as JSON lines, e.g. for building flame charts offline
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict()) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(line)
+
+    def shutdown(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def make_exporter(kind, path=None):
+    # "console", "jsonl" (to `path`) or "" / "none" (tracing disabled)
+    if kind in ("", "none", None):
+        return None
+    if kind == "console":
+        return ConsoleSpanExporter()
+    if kind == "jsonl":
+        return JsonlSpanExporter(path)
+    raise RuntimeError(f"Unknown span exporter: {kind}")
+
+
+def add_exporter(exporter):
+    _exporters.append(exporter)
+
+
+def remove_exporter(exporter):
+    if exporter in _exporters:
+        _exporters.remove(exporter)
+    exporter.shutdown()
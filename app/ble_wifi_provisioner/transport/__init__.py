@@ -2,4 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 #
 
+from .ble_scanner import *  # noqa: F403, F401
+from .gatt_cache import *  # noqa: F403, F401
 from .transport_ble import *  # noqa: F403, F401
+from .transport_sim import *  # noqa: F403, F401
@@ -3,8 +3,13 @@
 #
 
 import bleak
+import time
+import asyncio
 import platform
 import logging
+from contextlib import nullcontext
+
+from .. import metrics
 
 logger = logging.getLogger('BLEWiFiProvisioner.transport')
 
@@ -14,9 +19,25 @@ def device_sort(device):
     return device[0].address
 
 
+# How a protocomm request/response pair is exchanged over a characteristic
+EXCHANGE_AUTO = 'auto'
+# Write with response, then read: 2 ATT round trips (legacy, always supported)
+EXCHANGE_WRITE_READ = 'write-read'
+# Write command (no response) pipelined with the read: 1 ATT round trip
+EXCHANGE_WRITE_CMD = 'write-cmd'
+# Write, response pushed by the device as a notification/indication
+EXCHANGE_NOTIFY = 'notify'
+
+
 class BLE_Bleak_Client:
-    def __init__(self, iface, verbose=None):
-        self.adapter = None
+    # Running estimate of how long a full discovery pass takes, used to report
+    # the connect latency saved by the registry and targeted lookups
+    full_scan_time = 5.0
+
+    def __init__(self, iface, verbose=None, scanner=None, lookup_timeout=2.0, gatt_cache=None, adapter=None,
+                 exchange_mode=EXCHANGE_AUTO, notify_timeout=5.0):
+        # Optional BLEAdapter arbitrating the radio between provisioners
+        self.adapter = adapter
         self.adapter_props = None
         self.characteristics = dict()
         self.device = None
@@ -27,32 +48,126 @@ class BLE_Bleak_Client:
         
         self.iface = iface
         self.verbose = verbose
+        # Optional BLE_Background_Scanner whose registry replaces full scans
+        self.scanner = scanner
+        # Timeout of the targeted find-by-address lookup before a full scan
+        self.lookup_timeout = lookup_timeout
+        # (BLEDevice, AdvertisementData) of the last device found, reused on reconnect
+        self.found_device = None
+        self.connect_timings = dict()
+        # Optional GATTNameCache sparing the descriptor reads on connect
+        self.gatt_cache = gatt_cache
+        self.nu_lookup_source = None
+        self.proto_ver = None
+        # EXCHANGE_AUTO picks the cheapest mode each characteristic supports
+        self.exchange_mode = exchange_mode
+        self.notify_timeout = notify_timeout
+        self.exchange_stats = {'messages': 0, 'round_trips': 0}
+        self._exchange_modes = dict()
+        self._notify_queues = dict()
+
+    def _radio(self):
+        return self.adapter.radio() if self.adapter is not None else nullcontext()
+
+    def _registry(self):
+        if self.scanner is not None and self.scanner.running:
+            return self.scanner.registry
+        return None
+
+    async def _scan(self):
+        start_time = time.monotonic()
+        try:
+            async with self._radio():
+                discovery = await bleak.BleakScanner.discover(return_adv=True, adapter=self.iface)
+        except bleak.exc.BleakDBusError as e:
+            if str(e) == '[org.bluez.Error.NotReady] Resource Not Ready':
+                raise RuntimeError('Bluetooth is not ready. Maybe try `bluetoothctl power on`?')
+            raise
+        scan_time = time.monotonic() - start_time
+        metrics.SCAN_SECONDS.labels(kind='full').observe(scan_time)
+        BLE_Bleak_Client.full_scan_time = 0.8 * BLE_Bleak_Client.full_scan_time + 0.2 * scan_time
+        if self.scanner is not None:
+            for device, adv_data in discovery.values():
+                self.scanner.registry.update(device, adv_data)
+        return discovery
 
     async def discover(self):
-        return await bleak.BleakScanner.discover(return_adv=True, adapter=self.iface)
-    
-    async def connect(self, devname, devaddr):
-        self.devname = devname
-        self.devaddr = devaddr
+        registry = self._registry()
+        if registry is not None:
+            return registry.devices()
+        return await self._scan()
+
+    def _matches(self, device):
+        if device.name is not None and device.name == self.devname:
+            return True
+        return self.devaddr is not None and device.address.upper() == self.devaddr.upper()
+
+    async def _find_device_targeted(self):
+        # Stops scanning as soon as the wanted device advertises
+        found = dict()
 
+        def _filter(device, adv_data):
+            if self._matches(device):
+                found['device'] = (device, adv_data)
+                return True
+            return False
+
+        start_time = time.monotonic()
         try:
-            discovery = await bleak.BleakScanner.discover(return_adv=True, adapter=self.iface)
-            devices = list(discovery.values())
+            async with self._radio():
+                await bleak.BleakScanner.find_device_by_filter(_filter, timeout=self.lookup_timeout, adapter=self.iface)
         except bleak.exc.BleakDBusError as e:
             if str(e) == '[org.bluez.Error.NotReady] Resource Not Ready':
                 raise RuntimeError('Bluetooth is not ready. Maybe try `bluetoothctl power on`?')
             raise
+        metrics.SCAN_SECONDS.labels(kind='targeted').observe(time.monotonic() - start_time)
+        if 'device' in found and self.scanner is not None:
+            self.scanner.registry.update(*found['device'])
+        return found.get('device')
+
+    async def _find_device(self):
+        """
+        Resolve (BLEDevice, AdvertisementData) of the device to connect to, from the
+        cheapest source available: the device found by a previous connect, the
+        background scanner registry, a targeted lookup and finally a full scan
+
+        Returns the pair and the name of the source it was resolved from
+        """
+        if self.found_device is not None and self._matches(self.found_device[0]):
+            return self.found_device, 'cached'
+
+        registry = self._registry()
+        if registry is not None:
+            found_device = registry.find(devname=self.devname, devaddr=self.devaddr)
+            if found_device:
+                return found_device, 'registry'
+
+        if self.lookup_timeout:
+            found_device = await self._find_device_targeted()
+            if found_device:
+                return found_device, 'targeted'
 
         found_device = None
-        
+        devices = list((await self._scan()).values())
         for d in devices:
             if d[0].name is not None and d[0].name == self.devname:
                 found_device = d
             elif d[0].address == self.devaddr:
                 found_device = d
+        return found_device, 'scan'
+
+    async def connect(self, devname, devaddr, proto_ver=None):
+        # `proto_ver`: response of the device known beforehand (capability cache), spares reading it
+        self.devname = devname
+        self.devaddr = devaddr
+
+        start_time = time.monotonic()
+        found_device, source = await self._find_device()
+        lookup_time = time.monotonic() - start_time
 
         if not found_device:
             raise RuntimeError('Device not found')
+        self.found_device = found_device
 
         uuids = found_device[1].service_uuids
         # There should be 1 service UUID in advertising data
@@ -64,8 +179,17 @@ class BLE_Bleak_Client:
             self.srv_uuid_adv = uuids[0]
         if self.verbose:
             logger.log(level=logging.INFO, msg='Connecting...')
-        self.device = bleak.BleakClient(found_device[0].address, adapter=self.iface)
-        await self.device.connect()
+        # Passing the BLEDevice (not its address) keeps bleak from scanning again
+        self.device = bleak.BleakClient(found_device[0], adapter=self.iface)
+        try:
+            async with self._radio():
+                await self.device.connect()
+        except Exception:
+            # Resolve the device afresh on the next attempt
+            self.found_device = None
+            self.device = None
+            raise
+        connected_time = time.monotonic()
         # must be paired on Windows to access characteristics;
         # cannot be paired on Mac
         if platform.system() == 'Windows':
@@ -81,24 +205,114 @@ class BLE_Bleak_Client:
             self.device = None
             raise RuntimeError('Provisioning service not found')
 
+        nu_lookup = None
+        self.proto_ver = proto_ver
+        if self.gatt_cache is not None:
+            nu_lookup = await self._nu_lookup_from_cache(service)
+        if nu_lookup is not None:
+            self.nu_lookup_source = 'cache'
+        else:
+            nu_lookup = await self._read_nu_lookup(service)
+            self.nu_lookup_source = 'descriptors'
+            if self.gatt_cache is not None and 'proto-ver' in nu_lookup:
+                # Already read on a cache miss for unseen firmware
+                if self.proto_ver is None:
+                    self.proto_ver = await self._read_proto_ver(nu_lookup['proto-ver'])
+                await self.gatt_cache.put(service.uuid, self.proto_ver, nu_lookup)
+
+        # Create lookup table
+        self.nu_lookup = nu_lookup
+
+        self.connect_timings = {
+            'lookup_source': source,
+            'nu_lookup_source': self.nu_lookup_source,
+            'lookup': lookup_time,
+            'connect': connected_time - start_time - lookup_time,
+            'services': time.monotonic() - connected_time,
+            'total': time.monotonic() - start_time,
+            'saved': 0.0 if source == 'scan' else max(0.0, BLE_Bleak_Client.full_scan_time - lookup_time),
+        }
+        metrics.CONNECT_SECONDS.labels(iface=str(self.iface)).observe(self.connect_timings['connect'])
+        metrics.DESCRIPTOR_READ_SECONDS.labels(source=self.nu_lookup_source).observe(self.connect_timings['services'])
+        if self.verbose:
+            logger.log(level=logging.INFO, msg='Connect timings (s): ' + ', '.join(
+                f'{k}={v:.3f}' if isinstance(v, float) else f'{k}={v}' for k, v in self.connect_timings.items()
+            ))
+
+        return True
+
+    async def _read_nu_lookup(self, service):
+        # Endpoint names are the user descriptions (0x2901) of the characteristics
         nu_lookup = dict()
         for characteristic in service.characteristics:
             for descriptor in characteristic.descriptors:
                 if descriptor.uuid[4:8] != '2901':
                     continue
                 readval = await self.device.read_gatt_descriptor(descriptor.handle)
-                found_name = ''.join(chr(b) for b in readval).lower()
+                found_name = bytes(readval).decode('latin-1').lower()
                 nu_lookup[found_name] = characteristic.uuid
                 self.characteristics[characteristic.uuid] = characteristic
+        return nu_lookup
 
-        # Create lookup table
-        self.nu_lookup = nu_lookup
+    async def _read_proto_ver(self, characteristic_uuid):
+        response = await self.send_data(characteristic_uuid, b'---')
+        return response.decode('latin-1')
 
-        return True
+    async def _nu_lookup_from_cache(self, service):
+        """
+        Resolve the endpoint map from the GATT name cache: read `proto-ver`
+        through the cached characteristic, unless known already, and use the
+        map stored for that version, provided all its characteristics exist
+        in the service. Stale entries are invalidated; returns None on a miss.
+        """
+        candidates = await self.gatt_cache.candidates(service.uuid)
+        if not candidates:
+            return None
+        characteristics = {c.uuid: c for c in service.characteristics}
+
+        ver_uuids = {lookup.get('proto-ver') for lookup in candidates.values()}
+        ver_uuids = [uuid for uuid in ver_uuids if uuid in characteristics]
+        if not ver_uuids:
+            await self.gatt_cache.invalidate(service.uuid)
+            return None
+        proto_ver = self.proto_ver
+        if proto_ver is None:
+            try:
+                proto_ver = self.proto_ver = await self._read_proto_ver(ver_uuids[0])
+            except Exception as e:
+                logger.log(level=logging.INFO, msg=f'Cached proto-ver lookup failed: {e}')
+                await self.gatt_cache.invalidate(service.uuid)
+                return None
+
+        nu_lookup = candidates.get(proto_ver)
+        if nu_lookup is None:
+            # Firmware not seen before, keep the other versions
+            return None
+        if not all(uuid in characteristics for uuid in nu_lookup.values()):
+            await self.gatt_cache.invalidate(service.uuid, proto_ver)
+            return None
+
+        for uuid in nu_lookup.values():
+            self.characteristics[uuid] = characteristics[uuid]
+        return dict(nu_lookup)
+
+    async def invalidate_cached_lookup(self):
+        # The endpoint map in use came from the cache and proved wrong
+        if self.gatt_cache is not None and self.nu_lookup_source == 'cache' and self.srv_uuid_adv:
+            await self.gatt_cache.invalidate(self.srv_uuid_adv, self.proto_ver)
 
     def get_nu_lookup(self):
         return self.nu_lookup
 
+    @property
+    def mtu(self):
+        # Negotiated ATT MTU, the default 23 bytes until connected
+        return self.device.mtu_size if self.device is not None else 23
+
+    @property
+    def connected(self):
+        return self.device is not None and self.device.is_connected
+
     def has_characteristic(self, uuid):
         logger.log(level=logging.INFO, msg='checking for characteristic ' + uuid)
         if uuid in self.characteristics:
@@ -115,8 +329,68 @@ class BLE_Bleak_Client:
             self.device = None
             self.nu_lookup = None
             self.characteristics = dict()
+            self._exchange_modes = dict()
+            self._notify_queues = dict()
+
+    def get_exchange_mode(self, characteristic_uuid):
+        mode = self._exchange_modes.get(characteristic_uuid)
+        if mode is not None:
+            return mode
+        mode = self.exchange_mode
+        if mode == EXCHANGE_AUTO:
+            characteristic = self.characteristics.get(characteristic_uuid)
+            properties = characteristic.properties if characteristic is not None else []
+            if 'notify' in properties or 'indicate' in properties:
+                mode = EXCHANGE_NOTIFY
+            elif 'write-without-response' in properties:
+                mode = EXCHANGE_WRITE_CMD
+            else:
+                mode = EXCHANGE_WRITE_READ
+        self._exchange_modes[characteristic_uuid] = mode
+        return mode
+
+    async def _exchange_notify(self, characteristic_uuid, payload):
+        queue = self._notify_queues.get(characteristic_uuid)
+        if queue is None:
+            queue = asyncio.Queue()
+            await self.device.start_notify(characteristic_uuid, lambda _, data: queue.put_nowait(data))
+            self._notify_queues[characteristic_uuid] = queue
+        characteristic = self.characteristics.get(characteristic_uuid)
+        with_response = (
+            characteristic is None or 'write-without-response' not in characteristic.properties
+            or not self._fits_write_command(payload)
+        )
+        await self.device.write_gatt_char(characteristic_uuid, payload, with_response)
+        readval = await asyncio.wait_for(queue.get(), timeout=self.notify_timeout)
+        round_trips = 1 + int(with_response)
+        # Notifications carry at most MTU - 3 bytes, read longer responses in full
+        if len(readval) >= self.device.mtu_size - 3:
+            readval = await self.device.read_gatt_char(characteristic_uuid)
+            round_trips += 1
+        return readval, round_trips
+
+    def _fits_write_command(self, data):
+        # An ATT Write Command carries at most MTU - 3 bytes and has no long-write procedure
+        return len(data) <= self.device.mtu_size - 3
 
     async def send_data(self, characteristic_uuid, data):
-        await self.device.write_gatt_char(characteristic_uuid, bytearray(data.encode('latin-1')), True)
-        readval = await self.device.read_gatt_char(characteristic_uuid)
-        return ''.join(chr(b) for b in readval)
+        mode = self.get_exchange_mode(characteristic_uuid)
+        try:
+            if mode == EXCHANGE_NOTIFY:
+                readval, round_trips = await self._exchange_notify(characteristic_uuid, data)
+            else:
+                # Requests longer than a Write Command go as acknowledged (long) writes
+                with_response = mode == EXCHANGE_WRITE_READ or not self._fits_write_command(data)
+                await self.device.write_gatt_char(characteristic_uuid, data, with_response)
+                readval = await self.device.read_gatt_char(characteristic_uuid)
+                round_trips = 2 if with_response else 1
+        except bleak.exc.BleakError:
+            await self.invalidate_cached_lookup()
+            raise
+        except asyncio.TimeoutError as e:
+            # The response notification never came
+            await self.invalidate_cached_lookup()
+            raise bleak.exc.BleakError(f'No response from {characteristic_uuid} within {self.notify_timeout}s') from e
+        self.exchange_stats['messages'] += 1
+        self.exchange_stats['round_trips'] += round_trips
+        return bytes(readval)
@@ -0,0 +1,110 @@
+# Long-running BLE scanner feeding an in-memory registry of advertising devices
+
+import time
+import logging
+
+import bleak
+
+logger = logging.getLogger('BLEWiFiProvisioner.transport')
+
+
+class BLEDeviceRegistry:
+    """
+    Devices heard by a BLE_Background_Scanner, keyed by address. Every entry
+    keeps the latest (BLEDevice, AdvertisementData) pair - i.e. name, service
+    UUIDs and RSSI - and the time it was last seen. Entries not seen for
+    `ttl` seconds are evicted.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._entries = dict()
+
+    def update(self, device, adv_data):
+        self._entries[device.address] = (device, adv_data, time.monotonic())
+
+    def evict_expired(self):
+        oldest = time.monotonic() - self.ttl
+        for address in [a for a, (_, _, seen) in self._entries.items() if seen < oldest]:
+            del self._entries[address]
+
+    def get(self, address):
+        # Returns the (BLEDevice, AdvertisementData) pair of `address`, if fresh
+        entry = self._entries.get(address)
+        if entry is None or entry[2] < time.monotonic() - self.ttl:
+            return None
+        return entry[0], entry[1]
+
+    def find(self, devname=None, devaddr=None):
+        # Same matching rules as BLE_Bleak_Client.connect: name or address
+        if devaddr is not None:
+            found = self.get(devaddr)
+            if found is not None:
+                return found
+        if devname is not None:
+            for device, adv_data in self.devices().values():
+                if device.name is not None and device.name == devname:
+                    return device, adv_data
+        return None
+
+    def last_seen(self, address):
+        entry = self._entries.get(address)
+        return None if entry is None else entry[2]
+
+    def devices(self):
+        # Same shape as `BleakScanner.discover(return_adv=True)`
+        self.evict_expired()
+        return {address: (device, adv_data) for address, (device, adv_data, _) in self._entries.items()}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class BLE_Background_Scanner:
+    def __init__(self, iface, registry=None, ttl=60.0):
+        self.iface = iface
+        self.registry = registry if registry is not None else BLEDeviceRegistry(ttl=ttl)
+        self._scanner = None
+        self._paused = False
+
+    @property
+    def running(self):
+        # The registry stays valid while the scan is briefly paused
+        return self._scanner is not None
+
+    async def start(self):
+        if self._scanner is not None:
+            return
+        scanner = bleak.BleakScanner(detection_callback=self._on_detection, adapter=self.iface)
+        try:
+            await scanner.start()
+        except bleak.exc.BleakDBusError as e:
+            if str(e) == '[org.bluez.Error.NotReady] Resource Not Ready':
+                raise RuntimeError('Bluetooth is not ready. Maybe try `bluetoothctl power on`?')
+            raise
+        self._scanner = scanner
+        logger.log(level=logging.INFO, msg=f'Background scan started on {self.iface}')
+
+    async def stop(self):
+        if self._scanner is None:
+            return
+        scanner, self._scanner = self._scanner, None
+        if not self._paused:
+            await scanner.stop()
+        self._paused = False
+        logger.log(level=logging.INFO, msg=f'Background scan stopped on {self.iface}')
+
+    async def pause(self):
+        if self._scanner is None or self._paused:
+            return
+        self._paused = True
+        await self._scanner.stop()
+
+    async def resume(self):
+        if self._scanner is None or not self._paused:
+            return
+        await self._scanner.start()
+        self._paused = False
+
+    def _on_detection(self, device, adv_data):
+        self.registry.update(device, adv_data)
@@ -0,0 +1,81 @@
+# Persistent cache of protocomm endpoint names resolved from GATT user descriptions
+
+import os
+import json
+import asyncio
+import logging
+
+logger = logging.getLogger('BLEWiFiProvisioner.transport')
+
+
+class GATTNameCache:
+    """
+    Endpoint name -> characteristic UUID maps (`nu_lookup`) of protocomm BLE
+    services, stored as JSON at `path` and keyed by service UUID and the
+    `proto-ver` string of the firmware. Devices running the same firmware
+    expose the same map, so a hit spares one 0x2901 descriptor read per
+    characteristic on every connect. The file is read and written in a
+    worker thread, off the event loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        # Serializes loading and writing the file
+        self._lock = asyncio.Lock()
+
+    async def _load(self):
+        if self._entries is None:
+            async with self._lock:
+                if self._entries is None:
+                    self._entries = await asyncio.to_thread(self._read)
+        return self._entries
+
+    async def _save(self):
+        async with self._lock:
+            # Snapshot of the entries as they are now, they keep changing meanwhile
+            data = json.dumps(self._entries, indent=2, sort_keys=True)
+            await asyncio.to_thread(self._write, data)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.log(level=logging.WARNING, msg=f'Ignoring unreadable GATT name cache {self.path}: {e}')
+        return dict()
+
+    def _write(self, data):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.log(level=logging.WARNING, msg=f'Failed to write GATT name cache {self.path}: {e}')
+
+    async def candidates(self, service_uuid):
+        # proto-ver -> nu_lookup of every firmware seen with this service
+        return dict((await self._load()).get(service_uuid.lower(), {}))
+
+    async def get(self, service_uuid, proto_ver):
+        return (await self.candidates(service_uuid)).get(proto_ver)
+
+    async def put(self, service_uuid, proto_ver, nu_lookup):
+        (await self._load()).setdefault(service_uuid.lower(), {})[proto_ver] = dict(nu_lookup)
+        await self._save()
+
+    async def invalidate(self, service_uuid, proto_ver=None):
+        entries = await self._load()
+        service_uuid = service_uuid.lower()
+        if proto_ver is None:
+            entries.pop(service_uuid, None)
+        else:
+            entries.get(service_uuid, {}).pop(proto_ver, None)
+            if not entries.get(service_uuid, True):
+                del entries[service_uuid]
+        logger.log(level=logging.INFO, msg=f'Invalidated GATT name cache for {service_uuid}')
+        await self._save()
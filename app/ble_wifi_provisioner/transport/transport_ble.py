@@ -2,33 +2,64 @@
 # SPDX-License-Identifier: Apache-2.0
 #
 
-from .ble_cli import BLE_Bleak_Client
+from .ble_cli import BLE_Bleak_Client, EXCHANGE_AUTO
 from .transport import Transport
+from .. import metrics
+from .. import tracing
 
 
 class Transport_BLE(Transport):
-    def __init__(self, iface, verbose):
+    def __init__(self, iface, verbose, scanner=None, lookup_timeout=2.0, gatt_cache=None, adapter=None,
+                 exchange_mode=EXCHANGE_AUTO):
         self.name_uuid_lookup = None
         self.verbose = verbose
 
         # Get BLE client module
-        self.cli = BLE_Bleak_Client(iface=iface, verbose=verbose)
+        self.cli = BLE_Bleak_Client(
+            iface=iface, verbose=verbose, scanner=scanner, lookup_timeout=lookup_timeout,
+            gatt_cache=gatt_cache, adapter=adapter, exchange_mode=exchange_mode
+        )
 
     async def discover(self):
         return await self.cli.discover()
 
-    async def connect(self, devname, devaddr):
+    async def connect(self, devname, devaddr, proto_ver=None):
         # Use client to connect to BLE device and bind to service
-        if not await self.cli.connect(devname=devname, devaddr=devaddr):
+        if not await self.cli.connect(devname=devname, devaddr=devaddr, proto_ver=proto_ver):
             raise RuntimeError("Failed to initialize transport")
 
         self.name_uuid_lookup = self.cli.get_nu_lookup()
 
+    @property
+    def connect_timings(self):
+        # Lookup source and per-step latency of the last connect
+        return self.cli.connect_timings
+
+    @property
+    def mtu(self):
+        # Negotiated ATT MTU of the connection
+        return self.cli.mtu
+
+    @property
+    def connected(self):
+        # Whether the link is still up, e.g. after the device dropped it
+        return self.cli.connected
+
+    @property
+    def proto_ver(self):
+        # `proto-ver` response read while resolving endpoints, if any
+        return self.cli.proto_ver
+
     async def disconnect(self):
         await self.cli.disconnect(verbose=self.verbose)
 
     async def send_data(self, ep_name, data):
         # Write (and read) data to characteristic corresponding to the endpoint
         if ep_name not in self.name_uuid_lookup.keys():
+            await self.cli.invalidate_cached_lookup()
             raise RuntimeError(f"Invalid endpoint: {ep_name}")
-        return await self.cli.send_data(self.name_uuid_lookup[ep_name], data)
+        with metrics.SEND_DATA_SECONDS.labels(endpoint=ep_name).time(), \
+                tracing.span("send_data", endpoint=ep_name, request_size=len(data)) as span:
+            response = await self.cli.send_data(self.name_uuid_lookup[ep_name], data)
+            span.set_attribute("response_size", len(response))
+            return response
@@ -0,0 +1,391 @@
+# In-process simulated ESP32 speaking the protocomm endpoints, and the
+# transport talking to it, to exercise BLEWiFiProvisioner without radios
+
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from types import SimpleNamespace
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from .. import proto
+from .. import tracing
+from ..security import srp6a
+from ..utils import bytes_to_long, long_to_bytes
+from .transport import Transport
+
+logger = logging.getLogger('BLEWiFiProvisioner.transport')
+
+# Endpoints exposed by the simulated device, as found in the user descriptions
+SIM_ENDPOINTS = ('proto-ver', 'prov-session', 'prov-config', 'prov-scan', 'prov-ctrl', 'custom-data')
+
+DEFAULT_SIM_APS = [
+    {'ssid': 'raspberry_wifi', 'bssid': 'b827eb000001', 'channel': 6, 'rssi': -48, 'auth': 3},
+    {'ssid': 'office', 'bssid': 'f09fc2000002', 'channel': 1, 'rssi': -67, 'auth': 3},
+    {'ssid': 'guest', 'bssid': 'f09fc2000003', 'channel': 11, 'rssi': -71, 'auth': 0},
+    {'ssid': 'lab-iot', 'bssid': '3c846a000004', 'channel': 6, 'rssi': -80, 'auth': 4},
+]
+
+
+class SimulatedESP32Device:
+    """
+    ESP32 running the wifi_provisioning manager over protocomm with security 1
+    (X25519 key exchange, PoP, AES-CTR) or, with `sec_ver=2`, security 2
+    (SRP6a with `username` and the PoP as password, AES-GCM). Wi-Fi
+    connection takes `wifi_connect_time` seconds after ApplyConfig and then
+    succeeds, unless `wifi_fail_reason` ('auth_error' or 'network_not_found')
+    is set.
+    """
+
+    def __init__(self, name, address, pop='', aps=None, wifi_connect_time=2.0, wifi_fail_reason=None,
+                 wifi_scan_time=1.0, processing_time=0.002, proto_ver=None, sec_ver=1, username='wifiprov',
+                 salt=None, endpoints=SIM_ENDPOINTS):
+        self.name = name
+        self.address = address
+        self.pop = pop.encode('latin-1') if isinstance(pop, str) else pop
+        self.sec_ver = sec_ver
+        self.username = username.encode('latin-1')
+        # Devices flashed with the same credentials share salt and verifier
+        self.salt = salt or hashlib.sha256(self.username + b':' + self.pop).digest()[:16]
+        self.aps = list(DEFAULT_SIM_APS if aps is None else aps)
+        self.wifi_connect_time = wifi_connect_time
+        self.wifi_fail_reason = wifi_fail_reason
+        self.wifi_scan_time = wifi_scan_time
+        self.processing_time = processing_time
+        # Endpoints registered by the firmware, see SIM_ENDPOINTS
+        self.endpoints = tuple(endpoints)
+        self.proto_ver = proto_ver or json.dumps(
+            {'prov': {'ver': 'v1.1', 'sec_ver': sec_ver, 'cap': ['wifi_scan']}}, separators=(',', ':')
+        )
+        self.ssid = None
+        self.passphrase = None
+        self._apply_time = None
+        self._scan_count = 0
+        self.reset_session()
+
+    # --- protocomm endpoints ---
+
+    def reset_session(self):
+        self._cipher = None
+        self._session_established = False
+        self._device_public_key = None
+        self._client_public_key = None
+        self._srp = None
+        self._nonce = None
+
+    async def handle(self, ep_name, data):
+        if self.processing_time:
+            await asyncio.sleep(self.processing_time)
+        if ep_name == 'proto-ver':
+            return self.proto_ver.encode('latin-1')
+        if ep_name == 'prov-session':
+            return self._handle_session(data)
+        if not self._session_established:
+            raise RuntimeError('Session not established')
+        request = self._decrypt(data)
+        if ep_name == 'prov-config':
+            response = self._handle_config(request)
+        elif ep_name == 'prov-scan':
+            response = await self._handle_scan(request)
+        elif ep_name == 'prov-ctrl':
+            response = self._handle_ctrl(request)
+        elif ep_name == 'custom-data':
+            response = request
+        else:
+            raise RuntimeError(f'Invalid endpoint: {ep_name}')
+        return self._encrypt(response)
+
+    def _decrypt(self, data):
+        if self.sec_ver == 2:
+            return self._cipher.decrypt(self._nonce, bytes(data), None)
+        return self._cipher.update(data)
+
+    def _encrypt(self, data):
+        if self.sec_ver == 2:
+            return self._cipher.encrypt(self._nonce, data, None)
+        return self._cipher.update(data)
+
+    def _handle_session(self, data):
+        request = proto.session_pb2.SessionData()
+        request.ParseFromString(data)
+        if self.sec_ver == 2:
+            return self._handle_session2(request)
+        response = proto.session_pb2.SessionData()
+        response.sec_ver = proto.session_pb2.SecScheme1
+        if request.sec_ver != proto.session_pb2.SecScheme1:
+            raise RuntimeError('Incorrect security scheme')
+
+        if request.sec1.msg == proto.sec1_pb2.Session_Command0:
+            self.reset_session()
+            private_key = X25519PrivateKey.generate()
+            self._device_public_key = private_key.public_key().public_bytes(
+                encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw)
+            self._client_public_key = request.sec1.sc0.client_pubkey
+            device_random = os.urandom(16)
+            shared_key = private_key.exchange(X25519PublicKey.from_public_bytes(self._client_public_key))
+            if len(self.pop) > 0:
+                digest = hashlib.sha256(self.pop).digest()
+                shared_key = bytes(a ^ b for a, b in zip(shared_key, digest))
+            cipher = Cipher(algorithms.AES(shared_key), modes.CTR(device_random), backend=default_backend())
+            self._cipher = cipher.encryptor()
+            response.sec1.msg = proto.sec1_pb2.Session_Response0
+            response.sec1.sr0.status = proto.constants_pb2.Success
+            response.sec1.sr0.device_pubkey = self._device_public_key
+            response.sec1.sr0.device_random = device_random
+        elif request.sec1.msg == proto.sec1_pb2.Session_Command1 and self._cipher is not None:
+            response.sec1.msg = proto.sec1_pb2.Session_Response1
+            client_verify = self._cipher.update(request.sec1.sc1.client_verify_data)
+            if client_verify != self._device_public_key:
+                # Wrong PoP: the client cannot verify the empty device proof
+                self.reset_session()
+                response.sec1.sr1.status = proto.constants_pb2.CryptoError
+            else:
+                response.sec1.sr1.status = proto.constants_pb2.Success
+                response.sec1.sr1.device_verify_data = self._cipher.update(self._client_public_key)
+                self._session_established = True
+        else:
+            raise RuntimeError('Unexpected session command')
+        return response.SerializeToString()
+
+    def _handle_session2(self, request):
+        response = proto.session_pb2.SessionData()
+        response.sec_ver = proto.session_pb2.SecScheme2
+        if request.sec_ver != proto.session_pb2.SecScheme2:
+            raise RuntimeError('Incorrect security scheme')
+
+        # Salt as the client hashes it, see srp6a.Srp6a.process_challenge
+        salt = long_to_bytes(bytes_to_long(self.salt))
+        _, v = srp6a.verifier(self.username, self.pop, salt)
+        if request.sec2.msg == proto.sec2_pb2.S2Session_Command0:
+            self.reset_session()
+            response.sec2.msg = proto.sec2_pb2.S2Session_Response0
+            if request.sec2.sc0.client_username != self.username:
+                response.sec2.sr0.status = proto.constants_pb2.InvalidArgument
+                return response.SerializeToString()
+            A = bytes_to_long(request.sec2.sc0.client_pubkey)
+            b = bytes_to_long(os.urandom(32))
+            B = (srp6a.k * v + pow(srp6a.g, b, srp6a.N)) % srp6a.N
+            self._srp = (A, b, B)
+            response.sec2.sr0.status = proto.constants_pb2.Success
+            response.sec2.sr0.device_pubkey = long_to_bytes(B)
+            response.sec2.sr0.device_salt = self.salt
+        elif request.sec2.msg == proto.sec2_pb2.S2Session_Command1 and self._srp is not None:
+            A, b, B = self._srp
+            response.sec2.msg = proto.sec2_pb2.S2Session_Response1
+            S = srp6a.server_premaster_secret(A, b, v, B)
+            K = hashlib.sha512(long_to_bytes(S)).digest()
+            M = srp6a.client_proof(self.username, salt, A, B, K)
+            if request.sec2.sc1.client_proof != M:
+                # Wrong PoP (password)
+                self.reset_session()
+                response.sec2.sr1.status = proto.constants_pb2.CryptoError
+            else:
+                self._nonce = os.urandom(12)
+                self._cipher = AESGCM(K[:32])
+                response.sec2.sr1.status = proto.constants_pb2.Success
+                response.sec2.sr1.device_proof = srp6a.server_proof(A, M, K)
+                response.sec2.sr1.device_nonce = self._nonce
+                self._session_established = True
+        else:
+            raise RuntimeError('Unexpected session command')
+        return response.SerializeToString()
+
+    def wifi_state(self):
+        # (sta_state, fail_reason) per wifi_constants.proto
+        if self._apply_time is None:
+            return proto.wifi_constants_pb2.Disconnected, None
+        if time.monotonic() - self._apply_time < self.wifi_connect_time:
+            return proto.wifi_constants_pb2.Connecting, None
+        if self.wifi_fail_reason == 'auth_error':
+            return proto.wifi_constants_pb2.ConnectionFailed, proto.wifi_constants_pb2.AuthError
+        if self.wifi_fail_reason == 'network_not_found':
+            return proto.wifi_constants_pb2.ConnectionFailed, proto.wifi_constants_pb2.NetworkNotFound
+        return proto.wifi_constants_pb2.Connected, None
+
+    def _handle_config(self, request):
+        cmd = proto.wifi_config_pb2.WiFiConfigPayload()
+        cmd.ParseFromString(request)
+        resp = proto.wifi_config_pb2.WiFiConfigPayload()
+        if cmd.msg == proto.wifi_config_pb2.TypeCmdSetConfig:
+            self.ssid = cmd.cmd_set_config.ssid
+            self.passphrase = cmd.cmd_set_config.passphrase
+            resp.msg = proto.wifi_config_pb2.TypeRespSetConfig
+            resp.resp_set_config.status = proto.constants_pb2.Success
+        elif cmd.msg == proto.wifi_config_pb2.TypeCmdApplyConfig:
+            resp.msg = proto.wifi_config_pb2.TypeRespApplyConfig
+            if self.ssid is None:
+                resp.resp_apply_config.status = proto.constants_pb2.InvalidArgument
+            else:
+                self._apply_time = time.monotonic()
+                resp.resp_apply_config.status = proto.constants_pb2.Success
+        elif cmd.msg == proto.wifi_config_pb2.TypeCmdGetStatus:
+            resp.msg = proto.wifi_config_pb2.TypeRespGetStatus
+            resp.resp_get_status.status = proto.constants_pb2.Success
+            sta_state, fail_reason = self.wifi_state()
+            resp.resp_get_status.sta_state = sta_state
+            if fail_reason is not None:
+                resp.resp_get_status.fail_reason = fail_reason
+            elif sta_state == proto.wifi_constants_pb2.Connected:
+                resp.resp_get_status.connected.ip4_addr = '192.168.4.2'
+                resp.resp_get_status.connected.ssid = self.ssid
+                resp.resp_get_status.connected.auth_mode = proto.wifi_constants_pb2.WPA2_PSK
+        else:
+            raise RuntimeError('Unsupported config command')
+        return resp.SerializeToString()
+
+    async def _handle_scan(self, request):
+        cmd = proto.wifi_scan_pb2.WiFiScanPayload()
+        cmd.ParseFromString(request)
+        resp = proto.wifi_scan_pb2.WiFiScanPayload()
+        resp.status = proto.constants_pb2.Success
+        if cmd.msg == proto.wifi_scan_pb2.TypeCmdScanStart:
+            if cmd.cmd_scan_start.blocking and self.wifi_scan_time:
+                await asyncio.sleep(self.wifi_scan_time)
+            self._scan_count = len(self.aps)
+            resp.msg = proto.wifi_scan_pb2.TypeRespScanStart
+        elif cmd.msg == proto.wifi_scan_pb2.TypeCmdScanStatus:
+            resp.msg = proto.wifi_scan_pb2.TypeRespScanStatus
+            resp.resp_scan_status.scan_finished = True
+            resp.resp_scan_status.result_count = self._scan_count
+        elif cmd.msg == proto.wifi_scan_pb2.TypeCmdScanResult:
+            resp.msg = proto.wifi_scan_pb2.TypeRespScanResult
+            start = cmd.cmd_scan_result.start_index
+            for ap in self.aps[start:start + cmd.cmd_scan_result.count]:
+                entry = resp.resp_scan_result.entries.add()
+                entry.ssid = ap['ssid'].encode('latin-1')
+                entry.bssid = bytes.fromhex(ap['bssid'])
+                entry.channel = ap['channel']
+                entry.rssi = ap['rssi']
+                entry.auth = ap['auth']
+        else:
+            raise RuntimeError('Unsupported scan command')
+        return resp.SerializeToString()
+
+    def _handle_ctrl(self, request):
+        cmd = proto.wifi_ctrl_pb2.WiFiCtrlPayload()
+        cmd.ParseFromString(request)
+        resp = proto.wifi_ctrl_pb2.WiFiCtrlPayload()
+        resp.status = proto.constants_pb2.Success
+        if cmd.msg == proto.wifi_ctrl_pb2.TypeCmdCtrlReset:
+            self.ssid = self.passphrase = self._apply_time = None
+            resp.msg = proto.wifi_ctrl_pb2.TypeRespCtrlReset
+        elif cmd.msg == proto.wifi_ctrl_pb2.TypeCmdCtrlReprov:
+            self._apply_time = None
+            resp.msg = proto.wifi_ctrl_pb2.TypeRespCtrlReprov
+        else:
+            raise RuntimeError('Unsupported ctrl command')
+        return resp.SerializeToString()
+
+
+class Transport_Sim(Transport):
+    """
+    Transport to a SimulatedESP32Device with the costs of a BLE link: every
+    ATT round trip takes `att_latency` seconds, long values are split in
+    MTU-sized prepared writes and blob reads, and responses longer than
+    `max_value_len` are rejected as protocomm_ble does. Connect and send
+    failures are injected with `connect_fail_rate` and `send_fail_rate`.
+    """
+
+    def __init__(self, devices, verbose=False, att_latency=0.0075, mtu=247, connect_time=0.5,
+                 connect_fail_rate=0.0, send_fail_rate=0.0, max_value_len=None, seed=None):
+        # One device or an iterable of them, looked up by name or address
+        if isinstance(devices, SimulatedESP32Device):
+            devices = [devices]
+        self.devices = {device.address: device for device in devices}
+        self.verbose = verbose
+        self.att_latency = att_latency
+        self.mtu = mtu
+        self.connect_time = connect_time
+        self.connect_fail_rate = connect_fail_rate
+        self.send_fail_rate = send_fail_rate
+        self.max_value_len = max_value_len
+        self.random = random.Random(seed)
+
+        self.device = None
+        self.name_uuid_lookup = None
+        self.connect_timings = dict()
+        self.proto_ver = None
+        self.exchange_stats = {'messages': 0, 'round_trips': 0}
+
+    async def discover(self):
+        # Same shape as `BleakScanner.discover(return_adv=True)`
+        return {
+            device.address: (
+                SimpleNamespace(name=device.name, address=device.address),
+                SimpleNamespace(local_name=device.name, service_uuids=[], rssi=-60),
+            )
+            for device in self.devices.values()
+        }
+
+    def _find(self, devname, devaddr):
+        if devaddr in self.devices:
+            return self.devices[devaddr]
+        for device in self.devices.values():
+            if device.name == devname:
+                return device
+        return None
+
+    async def connect(self, devname, devaddr, proto_ver=None):
+        start_time = time.monotonic()
+        device = self._find(devname, devaddr)
+        if device is None:
+            raise RuntimeError('Device not found')
+        await asyncio.sleep(self.connect_time)
+        if self.random.random() < self.connect_fail_rate:
+            raise RuntimeError('Failed to initialize transport')
+        device.reset_session()
+        self.device = device
+        self.name_uuid_lookup = {ep_name: ep_name for ep_name in device.endpoints}
+        self.connect_timings = {'lookup_source': 'simulated', 'total': time.monotonic() - start_time}
+
+    @property
+    def connected(self):
+        return self.device is not None
+
+    async def disconnect(self):
+        if self.device is not None:
+            self.device.reset_session()
+        self.device = None
+        self.name_uuid_lookup = None
+
+    def _round_trips(self, request_len, response_len):
+        # Long write: prepared writes plus execute; long read: read then blob reads
+        if request_len <= self.mtu - 3:
+            writes = 1
+        else:
+            writes = math.ceil(request_len / (self.mtu - 5)) + 1
+        reads = 1 + math.ceil(max(0, response_len - (self.mtu - 1)) / (self.mtu - 1))
+        return writes + reads
+
+    async def send_data(self, ep_name, data):
+        with tracing.span('send_data', endpoint=ep_name, request_size=len(data)) as span:
+            response = await self._send_data(ep_name, data)
+            span.set_attribute('response_size', len(response))
+            return response
+
+    async def _send_data(self, ep_name, data):
+        if self.device is None:
+            raise RuntimeError('Not connected')
+        if ep_name not in self.name_uuid_lookup:
+            raise RuntimeError(f'Invalid endpoint: {ep_name}')
+        if self.random.random() < self.send_fail_rate:
+            raise RuntimeError('GATT operation failed')
+        request = data
+        response = await self.device.handle(ep_name, request)
+        if self.max_value_len is not None and len(response) > self.max_value_len:
+            raise RuntimeError(f'Response of {len(response)} bytes exceeds characteristic limit')
+        round_trips = self._round_trips(len(request), len(response))
+        if self.att_latency:
+            await asyncio.sleep(self.att_latency * round_trips)
+        self.exchange_stats['messages'] += 1
+        self.exchange_stats['round_trips'] += round_trips
+        return response
@@ -2,4 +2,6 @@
 # SPDX-License-Identifier: Apache-2.0
 #
 
+from .backoff import *  # noqa: F403, F401
 from .convenience import *  # noqa: F403, F401
+from .log import *  # noqa: F403, F401
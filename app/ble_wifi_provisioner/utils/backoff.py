@@ -0,0 +1,30 @@
+# Delay schedules for polling and retrying operations against a device
+
+import random
+
+__all__ = ['poll_delays', 'retry_delays']
+
+
+def poll_delays(initial=(1.0,), factor=2.0, max_delay=5.0):
+    """
+    Yield an endless sequence of delays (in seconds): the `initial` delays
+    first, then the last one grown geometrically by `factor` up to `max_delay`
+    """
+    delay = 0.0
+    for delay in initial:
+        yield delay
+    delay = delay or max_delay
+    while True:
+        delay = min(delay * factor, max_delay)
+        yield delay
+
+
+def retry_delays(initial=0.5, factor=2.0, max_delay=8.0, jitter=0.5, rng=random):
+    """
+    Yield an endless sequence of delays (in seconds) between retries: `initial`
+    grown geometrically by `factor` up to `max_delay`, each shortened by a
+    random fraction of up to `jitter` so that devices which failed together
+    do not retry in lockstep
+    """
+    for delay in poll_delays((initial,), factor, max_delay):
+        yield delay * (1.0 - jitter * rng.random())
@@ -14,8 +14,10 @@ def long_to_bytes(n: int) -> bytes:
     return n.to_bytes((n.bit_length() + 7) // 8, 'big')
 
 
-# 'deadbeef' -> b'deadbeef'
-def str_to_bytes(s: str) -> bytes:
+# 'deadbeef' -> b'deadbeef', bytes-like objects are passed through
+def str_to_bytes(s) -> bytes:
+    if isinstance(s, (bytes, bytearray, memoryview)):
+        return s
     return bytes(s, encoding='latin-1')
 
 
@@ -0,0 +1,34 @@
+# Logging helpers of the BLEWiFiProvisioner.* loggers: nothing is formatted
+# (payloads hex dumped in particular) unless the record is emitted
+
+import logging
+
+__all__ = ['Hex', 'DeviceLogger', 'log_verbose']
+
+
+class Hex:
+    # '0x...' of a payload, rendered only when a record is formatted
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return '0x' + bytes(self.data).hex()
+
+
+class DeviceLogger(logging.LoggerAdapter):
+    # Prefixes the records with the device they concern, `extra['device']`
+    def process(self, msg, kwargs):
+        device = self.extra.get('device')
+        return (f'[{device}] {msg}' if device else msg), kwargs
+
+
+def log_verbose(logger, ctx, msg, *args):
+    # Exchange details of security context `ctx`: INFO records if it is verbose, DEBUG otherwise
+    level = logging.INFO if ctx.verbose else logging.DEBUG
+    if not logger.isEnabledFor(level):
+        return
+    device = getattr(ctx, 'device', None)
+    prefix = f'[{device}] '.replace('%', '%%') if device else ''
+    logger.log(level, '\x1b[32;20m++++ ' + prefix + msg + ' ++++\x1b[0m', *args)
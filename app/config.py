@@ -8,11 +8,79 @@ SECRET_KEY = os.environ.get("SECRET_KEY")
 BLE_PROV_MICROSERVICE_HOST = os.environ.get("BLE_PROV_MICROSERVICE_HOST", "host.docker.internal")
 BLE_PROV_MICROSERVICE_PORT = os.environ.get("BLE_PROV_MICROSERVICE_PORT", "8006")
 EDGE_GATEWAY_BLE_IFACE = os.environ.get("EDGE_GATEWAY_BLE_IFACE", "hci0")
+# Comma separated list, devices are spread across all the adapters
+EDGE_GATEWAY_BLE_IFACES = [iface.strip() for iface in EDGE_GATEWAY_BLE_IFACE.split(",") if iface.strip()]
+# GATT connections held at the same time on one adapter, across all requests
+BLE_ADAPTER_MAX_CONNECTIONS = int(os.environ.get("BLE_ADAPTER_MAX_CONNECTIONS", "4"))
+# Warm sessions: seconds a device stays connected (session established) after an operation for
+# the next one (0 disconnects after every operation), and how many an adapter keeps at most
+BLE_SESSION_IDLE_TIMEOUT = float(os.environ.get("BLE_SESSION_IDLE_TIMEOUT", "0"))
+BLE_MAX_WARM_SESSIONS = int(os.environ.get("BLE_MAX_WARM_SESSIONS", str(max(1, BLE_ADAPTER_MAX_CONNECTIONS // 2))))
+# RSSI (dB) an adapter at full load must gain over an idle one to be picked for a device
+BLE_ADAPTER_LOAD_PENALTY = float(os.environ.get("BLE_ADAPTER_LOAD_PENALTY", "20.0"))
+# Directory of the on-disk caches kept across restarts
+BLE_PROV_CACHE_DIR = os.environ.get("BLE_PROV_CACHE_DIR", os.path.expanduser("~/.cache/esn-ble-prov"))
+# GATT endpoint name cache, keyed by service UUID and proto-ver (empty disables it)
+BLE_GATT_CACHE_PATH = os.environ.get("BLE_GATT_CACHE_PATH", os.path.join(BLE_PROV_CACHE_DIR, "gatt_names.json"))
+# proto-ver capabilities by device address, empty keeps them in memory only
+BLE_CAPABILITY_CACHE_PATH = os.environ.get(
+    "BLE_CAPABILITY_CACHE_PATH", os.path.join(BLE_PROV_CACHE_DIR, "capabilities.json")
+)
+# Wi-Fi site survey: seconds the scan results of a device stand in for another scan on it (or,
+# on request, on the devices of the same adapter), 0 disables the survey
+BLE_WIFI_SURVEY_TTL = float(os.environ.get("BLE_WIFI_SURVEY_TTL", "300.0"))
+# Background BLE scan: seconds a device stays in the registry after it was last heard
+BLE_SCAN_REGISTRY_TTL = float(os.environ.get("BLE_SCAN_REGISTRY_TTL", "60.0"))
+# Targeted find-by-address timeout on connect before falling back to a full scan (0 disables it)
+BLE_CONNECT_LOOKUP_TIMEOUT = float(os.environ.get("BLE_CONNECT_LOOKUP_TIMEOUT", "2.0"))
 EDGE_GATEWAY_WIFI_SSID = os.environ.get("EDGE_GATEWAY_WIFI_SSID", "raspberry_wifi")
 EDGE_GATEWAY_WIFI_PASSPHRASE = os.environ.get("EDGE_GATEWAY_WIFI_PASSPHRASE", "raspberry_wifi")
 EDGE_SENSOR_SERVICE_NAME_PREFIX = os.environ.get("EDGE_SENSOR_SERVICE_NAME_PREFIX", "ESP32_")
 EDGE_SENSOR_OUI = os.environ.get("EDGE_SENSOR_OUI", "B0:A7:32")
 BLE_PROV_MAX_RETRIES = int(os.environ.get("BLE_PROV_MAX_RETRIES", "3"))
+# Delay between provisioning attempts of a device (in seconds): exponential backoff from the
+# initial delay up to the maximum one, each delay shortened by a random fraction up to the jitter
+BLE_PROV_RETRY_BACKOFF = float(os.environ.get("BLE_PROV_RETRY_BACKOFF", "0.5"))
+BLE_PROV_RETRY_MAX_BACKOFF = float(os.environ.get("BLE_PROV_RETRY_MAX_BACKOFF", "8.0"))
+BLE_PROV_RETRY_JITTER = float(os.environ.get("BLE_PROV_RETRY_JITTER", "0.5"))
+# How protocomm messages are exchanged over GATT: "auto" picks notifications or pipelined
+# write commands where the characteristic supports them, "write-read" forces the legacy exchange
+BLE_EXCHANGE_MODE = os.environ.get("BLE_EXCHANGE_MODE", "auto")
+# Security1 handshakes: X25519 keypairs kept pre-generated in a background thread (0 disables
+# the pool) and whether the key exchange and cipher setup run off the event loop
+BLE_SEC_KEY_POOL_SIZE = int(os.environ.get("BLE_SEC_KEY_POOL_SIZE", "32"))
+BLE_SEC_HANDSHAKE_OFFLOAD = os.environ.get("BLE_SEC_HANDSHAKE_OFFLOAD", "0") not in ("0", "false", "False", "")
+# Security2 (SRP6a) handshakes: worker processes for the big-integer math (0 keeps it in a
+# thread of the app process) and SRP6a ephemerals kept pre-generated (0 disables the pool).
+# Both off by default: enable them on gateways provisioning Security2 fleets
+BLE_SEC2_WORKERS = int(os.environ.get("BLE_SEC2_WORKERS", "0"))
+BLE_SEC2_EPHEMERAL_POOL_SIZE = int(os.environ.get("BLE_SEC2_EPHEMERAL_POOL_SIZE", "0"))
+# Maximum number of devices of one batch provisioned (connected) at the same time
+BLE_PROV_MAX_IN_FLIGHT = int(os.environ.get("BLE_PROV_MAX_IN_FLIGHT", "4"))
+# Provisioning scheduler: devices provisioned at the same time across all requests (default
+# the connection slots of the adapters), and devices waiting at most per priority class and
+# per client (X-Client-Id header, else the client address) before requests are refused (429)
+BLE_PROV_CONCURRENCY = int(os.environ.get(
+    "BLE_PROV_CONCURRENCY", str(len(EDGE_GATEWAY_BLE_IFACES) * BLE_ADAPTER_MAX_CONNECTIONS)
+))
+BLE_PROV_MAX_QUEUED = int(os.environ.get("BLE_PROV_MAX_QUEUED", "1024"))
+BLE_PROV_MAX_QUEUED_PER_CLIENT = int(os.environ.get("BLE_PROV_MAX_QUEUED_PER_CLIENT", "256"))
+# Wi-Fi status polling after ApplyConfig: fast first polls (comma separated, in seconds),
+# then exponential backoff up to a maximum interval, until the timeout is reached
+BLE_PROV_WIFI_POLL_INITIAL = tuple(
+    float(d) for d in os.environ.get("BLE_PROV_WIFI_POLL_INITIAL", "1.0,1.0").split(",")
+)
+BLE_PROV_WIFI_POLL_BACKOFF = float(os.environ.get("BLE_PROV_WIFI_POLL_BACKOFF", "1.5"))
+BLE_PROV_WIFI_POLL_MAX_INTERVAL = float(os.environ.get("BLE_PROV_WIFI_POLL_MAX_INTERVAL", "5.0"))
+BLE_PROV_WIFI_POLL_TIMEOUT = float(os.environ.get("BLE_PROV_WIFI_POLL_TIMEOUT", "30.0"))
+# Tracing spans of the provisioning phases: exporter ("" disables tracing, "console" writes them
+# to stderr, "jsonl" appends them to BLE_TRACE_PATH) as one JSON object per span
+BLE_TRACE_EXPORTER = os.environ.get("BLE_TRACE_EXPORTER", "")
+BLE_TRACE_PATH = os.environ.get("BLE_TRACE_PATH", os.path.join(BLE_PROV_CACHE_DIR, "traces.jsonl"))
+# Background provisioning jobs: store backend ("memory" or "sqlite") and number of workers
+BLE_PROV_JOB_STORE = os.environ.get("BLE_PROV_JOB_STORE", "memory")
+BLE_PROV_JOB_STORE_PATH = os.environ.get("BLE_PROV_JOB_STORE_PATH", os.path.join(BLE_PROV_CACHE_DIR, "jobs.sqlite3"))
+BLE_PROV_JOB_WORKERS = int(os.environ.get("BLE_PROV_JOB_WORKERS", "1"))
 
 # CORS
 ORIGINS: list = [
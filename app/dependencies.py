@@ -1,11 +1,131 @@
-from app.config import EDGE_GATEWAY_WIFI_SSID, EDGE_GATEWAY_WIFI_PASSPHRASE, EDGE_GATEWAY_BLE_IFACE
-from app.ble_wifi_provisioner import BLEWiFiProvisioner
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
+from app.config import (
+    EDGE_GATEWAY_WIFI_SSID,
+    EDGE_GATEWAY_WIFI_PASSPHRASE,
+    EDGE_GATEWAY_BLE_IFACES,
+    BLE_ADAPTER_MAX_CONNECTIONS,
+    BLE_ADAPTER_LOAD_PENALTY,
+    BLE_SESSION_IDLE_TIMEOUT,
+    BLE_MAX_WARM_SESSIONS,
+    BLE_SCAN_REGISTRY_TTL,
+    BLE_CONNECT_LOOKUP_TIMEOUT,
+    BLE_EXCHANGE_MODE,
+    BLE_GATT_CACHE_PATH,
+    BLE_CAPABILITY_CACHE_PATH,
+    BLE_SEC_KEY_POOL_SIZE,
+    BLE_SEC_HANDSHAKE_OFFLOAD,
+    BLE_SEC2_WORKERS,
+    BLE_SEC2_EPHEMERAL_POOL_SIZE,
+    BLE_WIFI_SURVEY_TTL,
+    BLE_TRACE_EXPORTER,
+    BLE_TRACE_PATH,
+    BLE_PROV_WIFI_POLL_INITIAL,
+    BLE_PROV_WIFI_POLL_BACKOFF,
+    BLE_PROV_WIFI_POLL_MAX_INTERVAL,
+    BLE_PROV_WIFI_POLL_TIMEOUT,
+    BLE_PROV_JOB_STORE,
+    BLE_PROV_JOB_STORE_PATH,
+    BLE_PROV_JOB_WORKERS,
+    BLE_PROV_CONCURRENCY,
+    BLE_PROV_MAX_QUEUED,
+    BLE_PROV_MAX_QUEUED_PER_CLIENT,
+)
+from app.ble_wifi_provisioner import BLEAdapterManager, CapabilityCache, GATTNameCache, KeyPool, SiteSurvey
+from app.ble_wifi_provisioner import tracing
+from app.ble_wifi_provisioner.security import srp6a
+from app.jobs import JobQueue, make_job_store
+from app.scheduler import ProvisioningScheduler
 
-def get_ble_provisioner():
-    provisioner = BLEWiFiProvisioner(
+
+# Exporter of the tracing spans, registered with the app
+span_exporter = tracing.make_exporter(BLE_TRACE_EXPORTER, BLE_TRACE_PATH)
+
+# Security1 client keypairs pre-generated for the handshakes, started with the app
+key_pool = KeyPool(size=BLE_SEC_KEY_POOL_SIZE, name='security1-keypool') if BLE_SEC_KEY_POOL_SIZE > 0 else None
+
+# Security2 SRP6a math in worker processes, and its ephemerals pre-generated there. The workers
+# are started by a fork server: forking the app process, which runs threads, is unsafe
+sec2_executor = ProcessPoolExecutor(
+    max_workers=BLE_SEC2_WORKERS, mp_context=multiprocessing.get_context("forkserver")
+) if BLE_SEC2_WORKERS > 0 else None
+sec2_ephemeral_pool = KeyPool(
+    size=BLE_SEC2_EPHEMERAL_POOL_SIZE, factory=srp6a.ephemeral_factory(sec2_executor),
+    name='security2-keypool',
+) if BLE_SEC2_EPHEMERAL_POOL_SIZE > 0 else None
+
+# Wi-Fi scan results of the devices, shared by all the provisioners
+site_survey = SiteSurvey(ttl=BLE_WIFI_SURVEY_TTL) if BLE_WIFI_SURVEY_TTL > 0 else None
+
+# Owns the HCI adapter(s) for the lifetime of the app: background scan,
+# GATT name cache, connection slots and radio arbitration
+adapter_manager = BLEAdapterManager(
+    ifaces=EDGE_GATEWAY_BLE_IFACES,
+    provisioner_kwargs=dict(
         wifi_ssid=EDGE_GATEWAY_WIFI_SSID,
         wifi_passphrase=EDGE_GATEWAY_WIFI_PASSPHRASE,
-        iface=EDGE_GATEWAY_BLE_IFACE
-    )
-    yield provisioner
\ No newline at end of file
+        wifi_poll_initial=BLE_PROV_WIFI_POLL_INITIAL,
+        wifi_poll_backoff=BLE_PROV_WIFI_POLL_BACKOFF,
+        wifi_poll_max_interval=BLE_PROV_WIFI_POLL_MAX_INTERVAL,
+        wifi_poll_timeout=BLE_PROV_WIFI_POLL_TIMEOUT,
+        lookup_timeout=BLE_CONNECT_LOOKUP_TIMEOUT,
+        exchange_mode=BLE_EXCHANGE_MODE,
+        key_pool=key_pool,
+        handshake_offload=BLE_SEC_HANDSHAKE_OFFLOAD,
+        sec2_ephemeral_pool=sec2_ephemeral_pool,
+        sec2_executor=sec2_executor,
+        capability_cache=CapabilityCache(BLE_CAPABILITY_CACHE_PATH or None),
+        site_survey=site_survey,
+    ),
+    max_connections=BLE_ADAPTER_MAX_CONNECTIONS,
+    scan_ttl=BLE_SCAN_REGISTRY_TTL,
+    gatt_cache=GATTNameCache(BLE_GATT_CACHE_PATH) if BLE_GATT_CACHE_PATH else None,
+    load_penalty=BLE_ADAPTER_LOAD_PENALTY,
+    session_idle_timeout=BLE_SESSION_IDLE_TIMEOUT,
+    max_warm_sessions=BLE_MAX_WARM_SESSIONS,
+)
+
+# Orders the devices of all the provisioning requests, see app.scheduler
+scheduler = ProvisioningScheduler(
+    concurrency=BLE_PROV_CONCURRENCY,
+    max_queued=BLE_PROV_MAX_QUEUED,
+    max_queued_per_client=BLE_PROV_MAX_QUEUED_PER_CLIENT,
+)
+
+# Background provisioning jobs, started with the app
+job_queue = JobQueue(
+    store=make_job_store(BLE_PROV_JOB_STORE, BLE_PROV_JOB_STORE_PATH),
+    session_factory=adapter_manager.session,
+    workers=BLE_PROV_JOB_WORKERS,
+)
+
+
+def get_adapter_manager():
+    yield adapter_manager
+
+
+def get_ble_provisioner():
+    yield adapter_manager.provisioner()
+
+
+def get_ble_session_factory():
+    # Provisioning engine opens one session (provisioner) per device
+    yield adapter_manager.session
+
+
+def get_ble_warm_session_factory():
+    # Follow-up operations reuse the connection of the previous one, see BLEAdapterManager.warm_session
+    yield adapter_manager.warm_session
+
+
+def get_site_survey():
+    yield site_survey
+
+
+def get_job_queue():
+    yield job_queue
+
+
+def get_scheduler():
+    yield scheduler
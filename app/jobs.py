@@ -0,0 +1,184 @@
+"""
+In-process queue of provisioning jobs and the stores keeping their progress.
+Jobs are run by `api.utils.iter_provision_ble_devices`; the device PoPs only
+live in memory, the store keeps status and per-device results. Store calls
+run in a worker thread, off the event loop.
+"""
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.api import schemas
+from app.api import utils as api_utils
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_INTERRUPTED = "interrupted"
+
+
+class JobStore(abc.ABC):
+    """Base class of the job stores"""
+
+    @abc.abstractmethod
+    def save(self, job):
+        pass
+
+    @abc.abstractmethod
+    def get(self, job_id):
+        pass
+
+    @abc.abstractmethod
+    def interrupt_unfinished(self):
+        # Jobs queued or running when the service stopped will not resume
+        pass
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        self._jobs = dict()
+
+    def save(self, job):
+        self._jobs[job.job_id] = job.model_copy(deep=True)
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return None if job is None else job.model_copy(deep=True)
+
+    def interrupt_unfinished(self):
+        for job in self._jobs.values():
+            if job.status in (JOB_QUEUED, JOB_RUNNING):
+                job.status = JOB_INTERRUPTED
+                job.updated_at = time.time()
+
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Calls come from worker threads
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, updated_at REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    def save(self, job):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, updated_at, data) VALUES (?, ?, ?, ?)",
+                (job.job_id, job.status, job.updated_at, job.model_dump_json()),
+            )
+            self._db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return None if row is None else schemas.ProvisioningJob(**json.loads(row[0]))
+
+    def interrupt_unfinished(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_RUNNING)
+            ).fetchall()
+        for (data,) in rows:
+            job = schemas.ProvisioningJob(**json.loads(data))
+            job.status = JOB_INTERRUPTED
+            job.updated_at = time.time()
+            self.save(job)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def make_job_store(backend, path=None):
+    if backend == "memory":
+        return MemoryJobStore()
+    elif backend == "sqlite":
+        return SQLiteJobStore(path)
+    raise ValueError(f"Unknown job store backend: {backend}")
+
+
+class JobQueue:
+    """
+    Provisioning jobs run in the background by `workers` tasks, one job per
+    worker at a time. Progress is saved to `store` after every device.
+    """
+
+    def __init__(self, store, session_factory, workers=1):
+        self.store = store
+        self.session_factory = session_factory
+        self.workers = workers
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    async def start(self):
+        await asyncio.to_thread(self.store.interrupt_unfinished)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(max(1, self.workers))]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, devices, admission=None):
+        now = time.time()
+        job = schemas.ProvisioningJob(
+            job_id=uuid.uuid4().hex,
+            status=JOB_QUEUED,
+            created_at=now,
+            updated_at=now,
+            total=len(devices),
+        )
+        await self._save(job)
+        self._queue.put_nowait((job, devices, admission))
+        return job
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _save(self, job):
+        # The store gets its own copy, the job keeps changing meanwhile
+        await asyncio.to_thread(self.store.save, job.model_copy(deep=True))
+
+    async def _worker(self):
+        while True:
+            job, devices, admission = await self._queue.get()
+            try:
+                await self._run(job, devices, admission)
+            except Exception as e:
+                logger.error(f"Provisioning job {job.job_id} failed: {e}")
+                job.status = JOB_INTERRUPTED
+                job.updated_at = time.time()
+                await self._save(job)
+            finally:
+                if admission is not None:
+                    admission.close()
+                self._queue.task_done()
+
+    async def _run(self, job, devices, admission=None):
+        job.status = JOB_RUNNING
+        job.updated_at = time.time()
+        await self._save(job)
+        async for result in api_utils.iter_provision_ble_devices(
+            devices, self.session_factory, batch_id=job.job_id, admission=admission
+        ):
+            job.results.append(result)
+            job.completed = len(job.results)
+            job.updated_at = time.time()
+            await self._save(job)
+        job.status = JOB_DONE
+        job.updated_at = time.time()
+        await self._save(job)
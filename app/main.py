@@ -1,12 +1,38 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from app.api.routes import ble_router
+from app.api.routes import ble_router, metrics_router
 from app.config import SECRET_KEY, ORIGINS
+from app.ble_wifi_provisioner import tracing
+from app.dependencies import adapter_manager, job_queue, key_pool, sec2_ephemeral_pool, sec2_executor, span_exporter
 
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
-app = FastAPI(debug=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if span_exporter is not None:
+        tracing.add_exporter(span_exporter)
+    for pool in (key_pool, sec2_ephemeral_pool):
+        if pool is not None:
+            pool.start()
+    await adapter_manager.start()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await adapter_manager.stop()
+    for pool in (key_pool, sec2_ephemeral_pool):
+        if pool is not None:
+            pool.stop()
+    if sec2_executor is not None:
+        sec2_executor.shutdown()
+    if span_exporter is not None:
+        tracing.remove_exporter(span_exporter)
+
+
+app = FastAPI(debug=True, lifespan=lifespan)
 
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
 
@@ -21,3 +47,4 @@ app.add_middleware(
 
 # Routes
 app.include_router(ble_router)
+app.include_router(metrics_router)
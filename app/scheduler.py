@@ -0,0 +1,200 @@
+"""
+Scheduler in front of the provisioning engine. The devices of all the
+requests wait for one of `concurrency` provisioning slots: interactive
+requests go before bulk ones and, within a priority class, clients take
+turns. Requests are admitted only while the queues have room.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Priority classes, highest first
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+# Devices of a bulk rollout may wait for minutes
+QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+QUEUE_DEPTH = Gauge(
+    "ble_prov_queue_depth", "Devices admitted and waiting for a provisioning slot", ["priority"]
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "ble_prov_queue_wait_seconds", "Time devices waited for a provisioning slot", ["priority"],
+    buckets=QUEUE_WAIT_BUCKETS,
+)
+RUNNING = Gauge(
+    "ble_prov_running", "Devices holding a provisioning slot"
+)
+REJECTED = Counter(
+    "ble_prov_rejected_total", "Provisioning requests refused by admission control", ["priority", "reason"]
+)
+
+
+class QueueFull(RuntimeError):
+    # No room for the request right now, try again in `retry_after` seconds
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Admission:
+    """
+    Devices of one request admitted to the scheduler, each of them
+    provisioned within `slot()`. `close()` gives back the room of the ones
+    that did not get to run, e.g. when the client went away.
+    """
+
+    def __init__(self, scheduler, client, priority, devices):
+        self.scheduler = scheduler
+        self.client = client
+        self.priority = priority
+        # Devices admitted that did not get a slot yet
+        self.reserved = devices
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.scheduler._acquire(self)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.scheduler._release(time.monotonic() - start_time)
+
+    def close(self):
+        self.scheduler._unreserve(self)
+
+
+class ProvisioningScheduler:
+    """
+    At most `concurrency` devices provisioned at the same time across all
+    requests. A priority class holds at most `max_queued` devices waiting,
+    and a client at most `max_queued_per_client`; beyond that requests are
+    refused with QueueFull. `service_time` seeds the moving average of the
+    seconds a device holds its slot, used to estimate when to retry.
+    """
+
+    def __init__(self, concurrency, max_queued=1024, max_queued_per_client=256, service_time=10.0):
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max_queued
+        self.max_queued_per_client = max_queued_per_client
+        self.service_time = service_time
+        self._running = 0
+        # Devices admitted that did not get a slot yet, by priority and by client
+        self._queued = {priority: 0 for priority in PRIORITIES}
+        self._client_queued = dict()
+        # priority -> client -> (future, admission) waiting for a slot; clients take turns
+        self._waiters = {priority: OrderedDict() for priority in PRIORITIES}
+
+    def default_priority(self, devices, background=False):
+        # An operator waiting on a single device goes before rollouts
+        return PRIORITY_INTERACTIVE if devices == 1 and not background else PRIORITY_BULK
+
+    def admit(self, client, priority, devices):
+        """
+        Admission of `devices` devices of `client` in class `priority`. Raises
+        ValueError if the request could never fit the queues, QueueFull if it
+        does not fit them now.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        if devices > min(self.max_queued, self.max_queued_per_client):
+            REJECTED.labels(priority=priority, reason="too_large").inc()
+            raise ValueError(f"{devices} devices exceed the provisioning queue limit")
+        if self._queued[priority] + devices > self.max_queued:
+            reason = "queue_full"
+        elif self._client_queued.get(client, 0) + devices > self.max_queued_per_client:
+            reason = "client_queue_full"
+        else:
+            reason = None
+        if reason is not None:
+            REJECTED.labels(priority=priority, reason=reason).inc()
+            raise QueueFull(f"Provisioning queue is full ({reason})", self.retry_after(priority))
+        self._queued[priority] += devices
+        self._client_queued[client] = self._client_queued.get(client, 0) + devices
+        QUEUE_DEPTH.labels(priority=priority).set(self._queued[priority])
+        return Admission(self, client, priority, devices)
+
+    def retry_after(self, priority):
+        # Seconds until the devices queued ahead of a new request of `priority` should be running
+        ahead = sum(self._queued[p] for p in PRIORITIES[:PRIORITIES.index(priority) + 1])
+        return max(1, math.ceil(self.service_time * ahead / self.concurrency))
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "service_time": self.service_time,
+            "queues": [
+                {"priority": priority, "queued": self._queued[priority], "clients": len(self._waiters[priority])}
+                for priority in PRIORITIES
+            ],
+        }
+
+    async def _acquire(self, admission):
+        if admission.reserved <= 0:
+            raise RuntimeError("No admitted device left to provision")
+        waiter = asyncio.get_running_loop().create_future()
+        enqueued_at = time.monotonic()
+        self._waiters[admission.priority].setdefault(admission.client, deque()).append((waiter, admission))
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Granted as the task was cancelled: hand the slot on
+            if waiter.done() and not waiter.cancelled():
+                self._release(None)
+            raise
+        QUEUE_WAIT_SECONDS.labels(priority=admission.priority).observe(time.monotonic() - enqueued_at)
+
+    def _release(self, elapsed):
+        self._running -= 1
+        RUNNING.set(self._running)
+        if elapsed is not None:
+            self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+        self._dispatch()
+
+    def _unreserve(self, admission):
+        if admission.reserved <= 0:
+            return
+        self._dequeue(admission, admission.reserved)
+
+    def _dequeue(self, admission, devices):
+        admission.reserved -= devices
+        self._queued[admission.priority] -= devices
+        self._client_queued[admission.client] -= devices
+        if not self._client_queued[admission.client]:
+            del self._client_queued[admission.client]
+        QUEUE_DEPTH.labels(priority=admission.priority).set(self._queued[admission.priority])
+
+    def _dispatch(self):
+        while self._running < self.concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            future, admission = waiter
+            self._dequeue(admission, 1)
+            self._running += 1
+            RUNNING.set(self._running)
+            future.set_result(None)
+
+    def _next_waiter(self):
+        # Highest priority first, then the client that waited longest for its turn
+        for priority in PRIORITIES:
+            clients = self._waiters[priority]
+            while clients:
+                client, waiters = next(iter(clients.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+                # Skip the waiters cancelled meanwhile
+                if not waiter[0].done():
+                    return waiter
+        return None
@@ -0,0 +1,117 @@
+"""
+Benchmark of the GATT exchange modes of BLE_Bleak_Client against a fake
+BleakClient that charges `--att-latency` seconds per ATT round trip.
+
+    python -m benchmarks.exchange_modes --messages 200 --att-latency 0.0075
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from types import SimpleNamespace
+
+import bleak
+
+from app.ble_wifi_provisioner import prov, security
+from app.ble_wifi_provisioner.transport import ble_cli
+
+CHARACTERISTIC_UUID = "0000ff52-0000-1000-8000-00805f9b34fb"
+
+
+class FakeBleakClient:
+    """
+    Echoes every write back, as read value or notification. Write Commands
+    longer than MTU - 3 bytes are rejected, acknowledged writes longer than
+    that take the prepared writes of a long write.
+    """
+
+    def __init__(self, att_latency, mtu_size=247):
+        self.att_latency = att_latency
+        self.mtu_size = mtu_size
+        self._value = b""
+        self._notify = dict()
+
+    async def write_gatt_char(self, uuid, data, response):
+        if not response and len(data) > self.mtu_size - 3:
+            raise bleak.exc.BleakError(f"Write Command of {len(data)} bytes exceeds MTU {self.mtu_size}")
+        self._value = bytes(data)
+        if response:
+            writes = 1 if len(data) <= self.mtu_size - 3 else math.ceil(len(data) / (self.mtu_size - 5)) + 1
+            await asyncio.sleep(self.att_latency * writes)
+        if uuid in self._notify:
+            # Pushed by the device half a round trip after the write
+            asyncio.get_running_loop().call_later(
+                self.att_latency / 2, self._notify[uuid], None, bytearray(self._value)
+            )
+
+    async def read_gatt_char(self, uuid):
+        await asyncio.sleep(self.att_latency)
+        return bytearray(self._value)
+
+    async def start_notify(self, uuid, callback):
+        await asyncio.sleep(self.att_latency)
+        self._notify[uuid] = callback
+
+
+def protocomm_payloads():
+    # Requests as sent on the wire; AES-CTR keeps the length of the plaintext
+    ctx = SimpleNamespace(encrypt_data=lambda data: data, verbose=False, device=None)
+    return {
+        "set_config": prov.config_set_config_request(ctx, "raspberry_wifi", "raspberry_wifi"),
+        "sec1_session": security.Security1("abcd1234", False).security_session(None),
+        "sec2_session": security.Security2("wifiprov", "abcd1234", False).security_session(None),
+    }
+
+
+async def run_mode(mode, properties, messages, att_latency, payload, mtu_size=247, name=None):
+    client = ble_cli.BLE_Bleak_Client(iface="hci0", exchange_mode=mode)
+    client.device = FakeBleakClient(att_latency, mtu_size=mtu_size)
+    client.characteristics[CHARACTERISTIC_UUID] = SimpleNamespace(properties=properties)
+
+    start_time = time.perf_counter()
+    for _ in range(messages):
+        await client.send_data(CHARACTERISTIC_UUID, payload)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "payload": name or f"{len(payload)} bytes",
+        "payload_size": len(payload),
+        "mtu": mtu_size,
+        "mode": client.get_exchange_mode(CHARACTERISTIC_UUID),
+        "messages": messages,
+        "elapsed": elapsed,
+        "messages_per_second": messages / elapsed,
+        "round_trips_per_message": client.exchange_stats["round_trips"] / messages,
+    }
+
+
+async def main(args):
+    payload = b"x" * args.payload_size
+    scenarios = [
+        # Before: legacy exchange
+        (ble_cli.EXCHANGE_WRITE_READ, ["read", "write"]),
+        # After: whatever each characteristic supports
+        (ble_cli.EXCHANGE_AUTO, ["read", "write", "write-without-response"]),
+        (ble_cli.EXCHANGE_AUTO, ["read", "write", "notify"]),
+        (ble_cli.EXCHANGE_AUTO, ["read", "write", "write-without-response", "notify"]),
+    ]
+    results = [
+        await run_mode(mode, properties, args.messages, args.att_latency, payload)
+        for mode, properties in scenarios
+    ]
+    # Default MTU: protocomm requests longer than a Write Command (20 bytes)
+    for name, payload in protocomm_payloads().items():
+        results += [
+            await run_mode(mode, properties, args.messages, args.att_latency, payload, mtu_size=23, name=name)
+            for mode, properties in scenarios
+        ]
+    print(json.dumps({"att_latency": args.att_latency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--att-latency", type=float, default=0.0075, help="seconds per ATT round trip")
+    parser.add_argument("--payload-size", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,66 @@
+"""
+Micro-benchmark of the Security1 PoP key derivation: XOR of the X25519
+shared key with SHA256(pop), per byte and hashing every time (before) vs
+one integer XOR and a memoised digest (after).
+
+    python -m benchmarks.key_derivation --iterations 100000
+"""
+
+import argparse
+import json
+import os
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+
+from app.ble_wifi_provisioner.security import security1
+from app.ble_wifi_provisioner.utils import long_to_bytes
+
+POP = b"abcd1234"
+
+
+def legacy_a_xor_b(a, b):
+    return b''.join(long_to_bytes(a[i] ^ b[i]) for i in range(0, len(b)))
+
+
+def legacy_derive(shared_key, pop):
+    h = hashes.Hash(hashes.SHA256(), backend=default_backend())
+    h.update(pop)
+    return legacy_a_xor_b(shared_key, h.finalize())
+
+
+def derive(shared_key, pop):
+    return security1.a_xor_b(shared_key, security1.pop_digest(pop))
+
+
+def timeit(func, shared_key, iterations):
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        func(shared_key, POP)
+    return (time.perf_counter() - start_time) / iterations
+
+
+def run(iterations):
+    shared_key = os.urandom(32)
+    assert legacy_derive(shared_key, POP) == derive(shared_key, POP)
+    results = {
+        "xor": {
+            "before": timeit(lambda k, _: legacy_a_xor_b(k, k), shared_key, iterations),
+            "after": timeit(lambda k, _: security1.a_xor_b(k, k), shared_key, iterations),
+        },
+        "derivation": {
+            "before": timeit(legacy_derive, shared_key, iterations),
+            "after": timeit(derive, shared_key, iterations),
+        },
+    }
+    for result in results.values():
+        result["speedup"] = result["before"] / result["after"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+    print(json.dumps({"iterations": args.iterations, "seconds_per_call": run(args.iterations)}, indent=2))
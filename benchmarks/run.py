@@ -0,0 +1,299 @@
+"""
+Benchmark suite of the provisioning pipeline, run against simulated devices
+(no radios needed). Results are printed, or written with --output, as JSON
+so they can be compared between releases.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --only security1_handshake prov_messages
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+
+from app.api import schemas
+from app.api import utils as api_utils
+from app.ble_wifi_provisioner import BLEWiFiProvisioner, SimulatedESP32Device, SimulatedFleet, Transport_Sim
+from app.ble_wifi_provisioner import prov, security
+
+from benchmarks import exchange_modes, key_derivation
+
+POP = "abcd1234"
+SSID = "raspberry_wifi"
+PASSPHRASE = "raspberry_wifi"
+
+
+def summarize(samples):
+    # Seconds per operation
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean": statistics.fmean(samples),
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        "min": samples[0],
+        "max": samples[-1],
+    }
+
+
+async def open_session(device, key_pool=None, offload=False, device_time=None):
+    # Client Security1 context with an established session to `device`
+    sec = security.Security1(POP, False, key_pool=key_pool)
+    response = None
+    while True:
+        if response is not None and offload:
+            request = await asyncio.to_thread(sec.security_session, response)
+        else:
+            request = sec.security_session(response)
+        if request is None:
+            return sec
+        start_cpu = time.thread_time()
+        response = await device.handle("prov-session", request)
+        if device_time is not None:
+            device_time.append(time.thread_time() - start_cpu)
+
+
+async def bench_security1_handshake(args):
+    """
+    Handshake latency with inline key generation, with a KeyPool and with
+    the key exchange offloaded to a thread; `event_loop_busy` is the CPU
+    time the client side of the handshake spent on the event loop
+    """
+    device = SimulatedESP32Device("ESP32_BENCH", "B0:A7:32:00:00:00", pop=POP, processing_time=0)
+    key_pool = security.KeyPool(size=args.iterations)
+    key_pool.start()
+    results = dict()
+    try:
+        for name, pool, offload in (("inline", None, False), ("pooled", key_pool, False),
+                                    ("pooled_offload", key_pool, True)):
+            # Let the pool fill up between scenarios
+            while pool is not None and pool.stats()["available"] < pool.size:
+                await asyncio.sleep(0.01)
+            samples, busy = [], []
+            for _ in range(args.iterations):
+                device.reset_session()
+                device_time = []
+                start_time, start_cpu = time.perf_counter(), time.thread_time()
+                await open_session(device, key_pool=pool, offload=offload, device_time=device_time)
+                samples.append(time.perf_counter() - start_time)
+                busy.append(time.thread_time() - start_cpu - sum(device_time))
+            results[name] = {**summarize(samples), "event_loop_busy": statistics.fmean(busy)}
+        results["key_pool"] = key_pool.stats()
+    finally:
+        key_pool.stop()
+    return results
+
+
+async def bench_security2_handshake(args):
+    """
+    SRP6a handshake latency, client and simulated device side
+    """
+    device = SimulatedESP32Device("ESP32_BENCH", "B0:A7:32:00:00:00", pop=POP, processing_time=0, sec_ver=2)
+    samples = []
+    for _ in range(max(1, args.iterations // 20)):
+        device.reset_session()
+        sec = security.Security2(None, POP, False)
+        start_time = time.perf_counter()
+        response = None
+        while (request := sec.security_session(response)) is not None:
+            response = await device.handle("prov-session", request)
+        samples.append(time.perf_counter() - start_time)
+    return {"handshake": summarize(samples)}
+
+
+async def bench_prov_messages(args):
+    """
+    Client-side cost of every prov/* request builder (serialize + encrypt)
+    and response parser (decrypt + parse); the device side is not timed
+    """
+    device = SimulatedESP32Device("ESP32_BENCH", "B0:A7:32:00:00:00", pop=POP, processing_time=0,
+                                  wifi_connect_time=0, wifi_scan_time=0)
+    sec = await open_session(device)
+    messages = {
+        "set_config": ("prov-config", lambda: prov.config_set_config_request(sec, SSID, PASSPHRASE),
+                       lambda r: prov.config_set_config_response(sec, r)),
+        "apply_config": ("prov-config", lambda: prov.config_apply_config_request(sec),
+                         lambda r: prov.config_apply_config_response(sec, r)),
+        "get_status": ("prov-config", lambda: prov.config_get_status_request(sec),
+                       lambda r: prov.config_get_status_response(sec, r, verbose=False)),
+        "scan_start": ("prov-scan", lambda: prov.scan_start_request(sec, blocking=False),
+                       lambda r: prov.scan_start_response(sec, r)),
+        "scan_status": ("prov-scan", lambda: prov.scan_status_request(sec),
+                        lambda r: prov.scan_status_response(sec, r)),
+        "scan_result": ("prov-scan", lambda: prov.scan_result_request(sec, 0, 4),
+                        lambda r: prov.scan_result_response(sec, r)),
+        "ctrl_reprov": ("prov-ctrl", lambda: prov.ctrl_reprov_request(sec),
+                        lambda r: prov.ctrl_reprov_response(sec, r)),
+    }
+    results = dict()
+    for name, (ep_name, build, parse) in messages.items():
+        build_samples, parse_samples = [], []
+        for _ in range(args.iterations):
+            start_time = time.perf_counter()
+            request = build()
+            build_samples.append(time.perf_counter() - start_time)
+            response = await device.handle(ep_name, request)
+            start_time = time.perf_counter()
+            parse(response)
+            parse_samples.append(time.perf_counter() - start_time)
+        results[name] = {"request": summarize(build_samples), "response": summarize(parse_samples)}
+    return results
+
+
+async def bench_logging(args):
+    """
+    Client-side cost of a request/response pair with the BLEWiFiProvisioner
+    loggers at INFO (payload dumps skipped before any formatting) and at
+    DEBUG (dumps formatted and written to an in-memory stream)
+    """
+    device = SimulatedESP32Device("ESP32_BENCH", "B0:A7:32:00:00:00", pop=POP, processing_time=0,
+                                  wifi_connect_time=0, wifi_scan_time=0)
+    sec = await open_session(device)
+    sec.device = device.address
+    messages = {
+        "set_config": ("prov-config", lambda: prov.config_set_config_request(sec, SSID, PASSPHRASE),
+                       lambda r: prov.config_set_config_response(sec, r)),
+        "scan_result": ("prov-scan", lambda: prov.scan_result_request(sec, 0, 4),
+                        lambda r: prov.scan_result_response(sec, r)),
+        "custom_data": ("custom-data", lambda: prov.custom_data_request(sec, "x" * 32),
+                        lambda r: prov.custom_data_response(sec, r)),
+    }
+    logger = logging.getLogger("BLEWiFiProvisioner")
+    saved = logger.level, logger.handlers, logger.propagate
+    logger.handlers, logger.propagate = [logging.StreamHandler(io.StringIO())], False
+    results = dict()
+    try:
+        for level in (logging.INFO, logging.DEBUG):
+            logger.setLevel(level)
+            level_results = results[logging.getLevelName(level)] = dict()
+            for name, (ep_name, build, parse) in messages.items():
+                samples = []
+                for _ in range(args.iterations):
+                    start_time = time.perf_counter()
+                    request = build()
+                    elapsed = time.perf_counter() - start_time
+                    response = await device.handle(ep_name, request)
+                    start_time = time.perf_counter()
+                    parse(response)
+                    samples.append(elapsed + time.perf_counter() - start_time)
+                level_results[name] = summarize(samples)
+    finally:
+        logger.setLevel(saved[0])
+        logger.handlers, logger.propagate = saved[1], saved[2]
+    for name in messages:
+        results.setdefault("debug_overhead", dict())[name] = (
+            results["DEBUG"][name]["median"] / results["INFO"][name]["median"]
+        )
+    return results
+
+
+async def bench_prov_device(args):
+    # connect + session + prov_device against one simulated device over a simulated link
+    samples = []
+    for _ in range(args.samples):
+        device = SimulatedESP32Device("ESP32_BENCH", "B0:A7:32:00:00:00", pop=POP,
+                                      wifi_connect_time=args.wifi_connect_time)
+        provisioner = BLEWiFiProvisioner(
+            SSID, PASSPHRASE, transport=Transport_Sim(device, att_latency=args.att_latency, connect_time=0),
+            wifi_poll_initial=(args.wifi_connect_time,),
+        )
+        start_time = time.perf_counter()
+        await provisioner.connect(device.name, device.address, POP)
+        await provisioner.prov_device()
+        await provisioner.disconnect()
+        samples.append(time.perf_counter() - start_time)
+    return summarize(samples)
+
+
+async def bench_batch_throughput(args):
+    fleet = SimulatedFleet.generate(
+        args.devices,
+        pop=POP,
+        provisioner_kwargs=dict(wifi_ssid=SSID, wifi_passphrase=PASSPHRASE,
+                                wifi_poll_initial=(args.wifi_connect_time,)),
+        device_kwargs=dict(wifi_connect_time=args.wifi_connect_time),
+        att_latency=args.att_latency,
+    )
+    devices = [schemas.BLEDeviceWithPoP(**d) for d in fleet.device_list(pop=POP)]
+    start_time = time.perf_counter()
+    not_prov, prov_devices = await api_utils.provision_ble_devices(devices, fleet.session, args.max_in_flight)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "devices": len(devices),
+        "max_in_flight": args.max_in_flight,
+        "provisioned": len(prov_devices),
+        "failed": len(not_prov),
+        "elapsed": elapsed,
+        "devices_per_second": len(devices) / elapsed,
+    }
+
+
+async def bench_key_derivation(args):
+    return key_derivation.run(args.iterations * 20)
+
+
+async def bench_exchange_modes(args):
+    return [
+        await exchange_modes.run_mode(mode, properties, 50, args.att_latency, b"x" * 32)
+        for mode, properties in (
+            ("write-read", ["read", "write"]),
+            ("auto", ["read", "write", "write-without-response"]),
+        )
+    ]
+
+
+BENCHMARKS = {
+    "security1_handshake": bench_security1_handshake,
+    "security2_handshake": bench_security2_handshake,
+    "key_derivation": bench_key_derivation,
+    "prov_messages": bench_prov_messages,
+    "logging": bench_logging,
+    "prov_device": bench_prov_device,
+    "batch_throughput": bench_batch_throughput,
+    "exchange_modes": bench_exchange_modes,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    report = {
+        "timestamp": time.time(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "params": vars(args).copy(),
+        "results": dict(),
+    }
+    for name in args.only or BENCHMARKS:
+        report["results"][name] = await BENCHMARKS[name](args)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--iterations", type=int, default=500, help="samples of the micro-benchmarks")
+    parser.add_argument("--samples", type=int, default=5, help="samples of the end-to-end prov_device benchmark")
+    parser.add_argument("--devices", type=int, default=200, help="devices of the batch benchmark")
+    parser.add_argument("--max-in-flight", type=int, default=50)
+    parser.add_argument("--att-latency", type=float, default=0.0075, help="seconds per ATT round trip")
+    parser.add_argument("--wifi-connect-time", type=float, default=1.0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    asyncio.run(main(parser.parse_args()))
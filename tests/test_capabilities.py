@@ -0,0 +1,103 @@
+import asyncio
+import json
+
+import pytest
+
+from app.ble_wifi_provisioner.capabilities import CapabilityCache, DeviceCapabilities
+from app.ble_wifi_provisioner.simulator import SimulatedFleet
+from app.ble_wifi_provisioner.transport.transport_sim import SIM_ENDPOINTS
+
+LEGACY_ENDPOINTS = ("prov-session", "prov-config")
+
+
+def _proto_ver(**prov):
+    return json.dumps({"prov": prov})
+
+
+@pytest.mark.parametrize("proto_ver, endpoints, version, sec_ver, pop_required, commands", [
+    (_proto_ver(ver="v1.1", sec_ver=2, cap=["wifi_scan"]), SIM_ENDPOINTS,
+     "v1.1", 2, True, {"wifi_config", "wifi_scan", "wifi_ctrl"}),
+    (_proto_ver(ver="v1.1", cap=["wifi_scan", "no_pop"]), SIM_ENDPOINTS,
+     "v1.1", 1, False, {"wifi_config", "wifi_scan", "wifi_ctrl"}),
+    # The version does not tell whether prov-ctrl exists, the endpoint table does
+    (_proto_ver(ver="v1.1", cap=["wifi_scan"]), LEGACY_ENDPOINTS, "v1.1", 1, True, {"wifi_config", "wifi_scan"}),
+    (_proto_ver(ver="v1.0", cap=["no_sec"]), LEGACY_ENDPOINTS, "v1.0", 0, False, {"wifi_config"}),
+    (_proto_ver(ver="v1.0", sec_ver=1, cap=["wifi_scan"]), SIM_ENDPOINTS,
+     "v1.0", 1, True, {"wifi_config", "wifi_scan", "wifi_ctrl"}),
+    # Legacy firmware answers a bare version string
+    ("v1.0", LEGACY_ENDPOINTS, "v1.0", 1, True, {"wifi_config"}),
+    ("", (), "", 1, True, {"wifi_config"}),
+    ("[]", (), "", 1, True, {"wifi_config"}),
+])
+def test_device_capabilities(proto_ver, endpoints, version, sec_ver, pop_required, commands):
+    capabilities = DeviceCapabilities(proto_ver, endpoints)
+    assert capabilities.version == version
+    assert capabilities.sec_ver == sec_ver
+    assert capabilities.pop_required is pop_required
+    assert capabilities.commands == commands
+    assert capabilities.supports("wifi_config")
+    assert not capabilities.supports("custom_data")
+
+
+def test_capability_cache(tmp_path):
+    path = str(tmp_path / "capabilities.json")
+    proto_ver = _proto_ver(ver="v1.1", sec_ver=2, cap=["wifi_scan"])
+
+    async def run():
+        cache = CapabilityCache(path)
+        assert await cache.get("B0:A7:32:00:00:01") is None
+        await cache.put("B0:A7:32:00:00:01", proto_ver)
+
+        # Entries are per device, and survive restarts
+        assert await CapabilityCache(path).get("B0:A7:32:00:00:01") == proto_ver
+        assert await CapabilityCache(path).get("B0:A7:32:00:00:02") is None
+
+        await cache.invalidate("B0:A7:32:00:00:01")
+        assert await CapabilityCache(path).get("B0:A7:32:00:00:01") is None
+
+    asyncio.run(run())
+
+
+def test_capability_cache_unreadable(tmp_path):
+    path = tmp_path / "capabilities.json"
+    path.write_text("{not json")
+    assert asyncio.run(CapabilityCache(str(path)).get("B0:A7:32:00:00:01")) is None
+
+
+def _connect_all(fleet, cache, rounds=1):
+    sources = []
+
+    async def run():
+        for _ in range(rounds):
+            for device in fleet.device_list():
+                async with fleet.session(wifi_ssid="ssid", wifi_passphrase="passphrase", capability_cache=cache) as p:
+                    await p.connect(**device)
+                    sources.append((device["device_address"], p.capabilities_source, p.capabilities))
+
+    asyncio.run(run())
+    return sources
+
+
+def test_connect_uses_cached_capabilities():
+    proto_ver = _proto_ver(ver="v1.1", sec_ver=1, cap=["wifi_scan"])
+    fleet = SimulatedFleet.generate(2, device_kwargs={"proto_ver": proto_ver}, att_latency=0, connect_time=0)
+    sources = _connect_all(fleet, CapabilityCache(), rounds=2)
+    # Each device reads proto-ver on its first connect only
+    assert [source == "cache" for _, source, _ in sources] == [False, False, True, True]
+    assert all(capabilities.proto_ver == proto_ver for _, _, capabilities in sources)
+
+
+def test_devices_do_not_share_capabilities():
+    # Same name prefix, different firmware: the first device must not decide for the second
+    fleet = SimulatedFleet.generate(2, att_latency=0, connect_time=0)
+    first, second = fleet.devices.values()
+    first.proto_ver = _proto_ver(ver="v1.1", sec_ver=1, cap=["wifi_scan"])
+    second.proto_ver = _proto_ver(ver="v1.0", sec_ver=1, cap=[])
+    second.endpoints = LEGACY_ENDPOINTS + ("proto-ver",)
+    sources = _connect_all(fleet, CapabilityCache())
+    (_, _, first_capabilities), (_, second_source, second_capabilities) = sources
+    assert first_capabilities.supports("wifi_ctrl")
+    assert second_source != "cache"
+    assert second_capabilities.proto_ver == second.proto_ver
+    assert not second_capabilities.supports("wifi_ctrl")
+    assert not second_capabilities.supports("wifi_scan")
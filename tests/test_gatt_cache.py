@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+from app.ble_wifi_provisioner.transport import GATTNameCache
+
+SERVICE_UUID = "021A9004-0382-4AEA-BFF4-6B3F1C5ADFB4"
+
+
+def _nu_lookup(n):
+    return {"proto-ver": f"uuid-{n}-ver", "prov-session": f"uuid-{n}-session"}
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "gatt_names.json")
+
+    async def run():
+        cache = GATTNameCache(path)
+        assert await cache.candidates(SERVICE_UUID) == {}
+        await cache.put(SERVICE_UUID, "v1.0", _nu_lookup(0))
+        await cache.put(SERVICE_UUID, "v1.1", _nu_lookup(1))
+
+        # Entries survive restarts, keyed by lowercase service UUID and proto-ver
+        reloaded = GATTNameCache(path)
+        assert await reloaded.get(SERVICE_UUID.lower(), "v1.1") == _nu_lookup(1)
+        await reloaded.invalidate(SERVICE_UUID, "v1.0")
+        assert list(await GATTNameCache(path).candidates(SERVICE_UUID)) == ["v1.1"]
+        await reloaded.invalidate(SERVICE_UUID)
+        assert await GATTNameCache(path).candidates(SERVICE_UUID) == {}
+
+    asyncio.run(run())
+
+
+def test_concurrent_puts(tmp_path):
+    path = tmp_path / "gatt_names.json"
+
+    async def run():
+        cache = GATTNameCache(str(path))
+        await asyncio.gather(*(cache.put(SERVICE_UUID, f"v{n}", _nu_lookup(n)) for n in range(20)))
+
+    asyncio.run(run())
+    # The last write has every entry
+    assert len(json.loads(path.read_text())[SERVICE_UUID.lower()]) == 20
+
+
+def test_unreadable(tmp_path):
+    path = tmp_path / "gatt_names.json"
+    path.write_text("{not json")
+    assert asyncio.run(GATTNameCache(str(path)).candidates(SERVICE_UUID)) == {}
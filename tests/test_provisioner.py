@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+from bleak.exc import BleakError
+
+from app.ble_wifi_provisioner.simulator import SimulatedFleet
+from app.ble_wifi_provisioner.transport import Transport_Sim
+
+
+def _connect(fleet):
+    events = []
+
+    async def run():
+        async with fleet.session(wifi_ssid="ssid", wifi_passphrase="passphrase", on_event=events.append) as p:
+            await p.connect(**fleet.device_list()[0])
+
+    asyncio.run(run())
+    return events
+
+
+@pytest.mark.parametrize("method, error, reason", [
+    ("connect", BleakError("Device disconnected"), "Device disconnected"),
+    ("send_data", asyncio.TimeoutError(), "TimeoutError"),
+    ("send_data", BleakError("Device disconnected"), "Device disconnected"),
+])
+def test_link_errors_are_runtime_errors(monkeypatch, method, error, reason):
+    # bleak errors and GATT timeouts fail the connect like the transport's own errors
+    async def fail(self, *args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(Transport_Sim, method, fail)
+    fleet = SimulatedFleet.generate(1, att_latency=0, connect_time=0)
+    with pytest.raises(RuntimeError, match=reason):
+        _connect(fleet)
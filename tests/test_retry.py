@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from app.ble_wifi_provisioner import retry
+from app.ble_wifi_provisioner.retry import RetryPolicy, classify_failure, recovery
+from app.ble_wifi_provisioner.simulator import SimulatedFleet
+from app.ble_wifi_provisioner.transport import Transport_Sim
+
+
+@pytest.mark.parametrize("reason, phase, failure", [
+    ("Device not found", "idle", retry.SCAN_MISS),
+    ("Failed to initialize transport", "scanning", retry.GATT_ERROR),
+    ("Failed to verify session", "connected", retry.BAD_POP),
+    ("Error in establishing session", "connected", retry.HANDSHAKE_ERROR),
+    ("GATT operation failed", "connected", retry.HANDSHAKE_ERROR),
+    ("GATT operation failed", "applied", retry.GATT_ERROR),
+    ("Wi-Fi connection failed: auth_error", "applied", retry.WRONG_PASSWORD),
+    ("Wi-Fi connection failed: network_not_found", "applied", retry.AP_NOT_FOUND),
+    ("Command not supported by the device: wifi_ctrl", "applied", retry.UNSUPPORTED),
+    ("Unsupported security scheme: 3", "connected", retry.UNSUPPORTED),
+    ("", "idle", retry.GATT_ERROR),
+    (None, "idle", retry.GATT_ERROR),
+])
+def test_classify_failure(reason, phase, failure):
+    assert classify_failure(reason, phase) == failure
+
+
+@pytest.mark.parametrize("failure, phase, link_connected, step", [
+    (retry.SCAN_MISS, "idle", False, "connect"),
+    (retry.GATT_ERROR, "applied", False, "connect"),
+    (retry.GATT_ERROR, "scanning", True, "connect"),
+    (retry.GATT_ERROR, "config_sent", True, "session"),
+    (retry.HANDSHAKE_ERROR, "connected", True, "session"),
+    (retry.AP_NOT_FOUND, "applied", True, "reprov"),
+    (retry.WIFI_ERROR, "applied", True, "reprov"),
+])
+def test_recovery(failure, phase, link_connected, step):
+    assert recovery(failure, phase, link_connected) == step
+
+
+def test_non_retryable():
+    policy = RetryPolicy()
+    for failure in retry.NON_RETRYABLE:
+        assert not policy.retryable(failure)
+    assert policy.retryable(retry.GATT_ERROR)
+
+
+def _fleet(**device_kwargs):
+    return SimulatedFleet.generate(
+        1, device_kwargs={"wifi_connect_time": 0.01, **device_kwargs},
+        provisioner_kwargs={"wifi_poll_initial": (0.01, 0.01), "wifi_poll_max_interval": 0.01},
+        att_latency=0, connect_time=0,
+    )
+
+
+def _provision(fleet, device, policy=None):
+    events = []
+
+    async def run():
+        async with fleet.session(wifi_ssid="ssid", wifi_passphrase="passphrase", on_event=events.append) as p:
+            return await retry.provision(p, device, policy or RetryPolicy(backoff=0, max_backoff=0, jitter=0))
+
+    return asyncio.run(run()), [event["phase"] for event in events], events
+
+
+def test_resume_after_link_drop(monkeypatch):
+    fleet = _fleet()
+    device = fleet.device_list()[0]
+    send_data = Transport_Sim.send_data
+    calls = []
+
+    async def drop_on_status(self, ep_name, data):
+        # Third prov-config request is the first status poll, after set and apply
+        if ep_name == "prov-config":
+            calls.append(ep_name)
+            if len(calls) == 3:
+                await self.disconnect()
+                raise RuntimeError("GATT operation failed")
+        return await send_data(self, ep_name, data)
+
+    monkeypatch.setattr(Transport_Sim, "send_data", drop_on_status)
+    result, phases, events = _provision(fleet, device)
+
+    assert result == {"provisioned": True, "attempts": 2, "error": None, "failure": None}
+    # The credentials were sent and applied once, the retry only waited for the outcome
+    assert phases.count("config_sent") == 1
+    assert phases.count("applied") == 1
+    assert phases.count("connected") == 2
+    [retry_event] = [event for event in events if event["phase"] == "retry"]
+    assert retry_event["recovery"] == "connect"
+    assert retry_event["resume_from"] == "wait"
+    assert phases[-1] == "wifi_connected"
+
+
+def test_bad_pop_not_retried():
+    fleet = _fleet()
+    device = {**fleet.device_list()[0], "device_pop": "wrong"}
+    result, phases, _ = _provision(fleet, device)
+    assert not result["provisioned"]
+    assert result["attempts"] == 1
+    assert result["failure"] == retry.BAD_POP
+    assert "retry" not in phases
+
+
+def test_wifi_failure_resends_credentials():
+    fleet = _fleet(wifi_fail_reason="network_not_found")
+    policy = RetryPolicy(max_attempts=2, backoff=0, max_backoff=0, jitter=0)
+    result, phases, events = _provision(fleet, fleet.device_list()[0], policy)
+    assert not result["provisioned"]
+    assert result["attempts"] == 2
+    assert result["failure"] == retry.AP_NOT_FOUND
+    assert phases.count("config_sent") == 2
+    [retry_event] = [event for event in events if event["phase"] == "retry"]
+    assert retry_event["recovery"] == "reprov"
+    assert retry_event["resume_from"] == "config"
@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import schemas
+from app.api import utils as api_utils
+from app.api.routes import _admit
+from app.ble_wifi_provisioner.simulator import SimulatedFleet
+from app.scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, ProvisioningScheduler, QueueFull
+
+
+def _run_order(scheduler, requests):
+    # Provision the devices of `requests` ((client, priority, devices) tuples), returning who ran in which order
+    order = []
+
+    async def device(admission, name):
+        async with admission.slot():
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def run():
+        tasks = []
+        for client, priority, devices in requests:
+            admission = scheduler.admit(client, priority, devices)
+            tasks += [asyncio.create_task(device(admission, client)) for _ in range(devices)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    return order
+
+
+def test_clients_take_turns():
+    scheduler = ProvisioningScheduler(concurrency=1)
+    order = _run_order(scheduler, [("a", PRIORITY_BULK, 3), ("b", PRIORITY_BULK, 2)])
+    assert order == ["a", "a", "b", "a", "b"]
+    assert scheduler.stats()["running"] == 0
+    assert all(queue["queued"] == 0 for queue in scheduler.stats()["queues"])
+
+
+def test_interactive_goes_first():
+    scheduler = ProvisioningScheduler(concurrency=1)
+    order = _run_order(scheduler, [("a", PRIORITY_BULK, 3), ("b", PRIORITY_INTERACTIVE, 1)])
+    assert order == ["a", "b", "a", "a"]
+
+
+def test_default_priority():
+    scheduler = ProvisioningScheduler(concurrency=1)
+    assert scheduler.default_priority(1) == PRIORITY_INTERACTIVE
+    assert scheduler.default_priority(1, background=True) == PRIORITY_BULK
+    assert scheduler.default_priority(2) == PRIORITY_BULK
+
+
+def test_queue_full():
+    scheduler = ProvisioningScheduler(concurrency=2, max_queued=4, max_queued_per_client=3, service_time=10.0)
+    admission = scheduler.admit("a", PRIORITY_BULK, 3)
+    with pytest.raises(QueueFull) as e:
+        scheduler.admit("a", PRIORITY_BULK, 1)
+    assert "client_queue_full" in str(e.value)
+    with pytest.raises(QueueFull) as e:
+        scheduler.admit("b", PRIORITY_BULK, 2)
+    assert "queue_full" in str(e.value)
+    # 3 devices ahead on 2 slots of 10 seconds
+    assert e.value.retry_after == 15
+    # Interactive requests have their own queue
+    scheduler.admit("b", PRIORITY_INTERACTIVE, 2)
+    # Closing an admission gives its room back
+    admission.close()
+    scheduler.admit("c", PRIORITY_BULK, 3)
+
+
+def test_request_too_large():
+    scheduler = ProvisioningScheduler(concurrency=1, max_queued=4, max_queued_per_client=2)
+    with pytest.raises(ValueError):
+        scheduler.admit("a", PRIORITY_BULK, 3)
+    with pytest.raises(ValueError):
+        scheduler.admit("a", "urgent", 1)
+
+
+def _request(client_id=None):
+    headers = {"x-client-id": client_id} if client_id else {}
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host="10.0.0.1"))
+
+
+def test_admit_http_errors():
+    scheduler = ProvisioningScheduler(concurrency=1, max_queued=2, max_queued_per_client=2, service_time=4.0)
+    admission = _admit(_request(), scheduler, [object(), object()], None)
+    assert (admission.client, admission.priority) == ("10.0.0.1", PRIORITY_BULK)
+
+    with pytest.raises(HTTPException) as e:
+        _admit(_request("other"), scheduler, [object(), object()], PRIORITY_BULK)
+    assert e.value.status_code == 429
+    assert e.value.headers == {"Retry-After": "8"}
+
+    with pytest.raises(HTTPException) as e:
+        _admit(_request(), scheduler, [object()] * 3, PRIORITY_INTERACTIVE)
+    assert e.value.status_code == 413
+
+    with pytest.raises(HTTPException) as e:
+        _admit(_request(), scheduler, [object()], "urgent")
+    assert e.value.status_code == 400
+
+
+def test_batch_holds_slots_in_flight_only():
+    # A batch limited to 2 devices in flight leaves the other slots to other clients
+    scheduler = ProvisioningScheduler(concurrency=4)
+    fleet = SimulatedFleet.generate(
+        4, device_kwargs={"wifi_connect_time": 0.01},
+        provisioner_kwargs={"wifi_ssid": "ssid", "wifi_passphrase": "passphrase"},
+        att_latency=0, connect_time=0.5,
+    )
+    devices = [schemas.BLEDeviceWithPoP(**device) for device in fleet.device_list()]
+
+    async def run():
+        admission = scheduler.admit("a", PRIORITY_BULK, len(devices))
+        batch = api_utils.iter_provision_ble_events(devices, fleet.session, max_in_flight=2, admission=admission)
+        first = asyncio.create_task(batch.__anext__())
+        await asyncio.sleep(0.1)
+        assert scheduler.stats()["running"] == 2
+        other = scheduler.admit("b", PRIORITY_INTERACTIVE, 1)
+        async with other.slot():
+            pass
+        await first
+        await batch.aclose()
+
+    asyncio.run(asyncio.wait_for(run(), 1.0))
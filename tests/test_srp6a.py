@@ -0,0 +1,109 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+from app.ble_wifi_provisioner.security import srp6a
+from app.ble_wifi_provisioner.utils import bytes_to_long, long_to_bytes
+
+
+def _hex(value):
+    return int("".join(value.split()), 16)
+
+
+# RFC 5054 Appendix B: 1024-bit group, SHA1
+RFC5054 = {
+    "I": b"alice",
+    "P": b"password123",
+    "s": bytes.fromhex("BEB25379D1A8581EB5A727673A2441EE"),
+    "N": _hex("""
+        EEAF0AB9 ADB38DD6 9C33F80A FA8FC5E8 60726187 75FF3C0B 9EA2314C
+        9C256576 D674DF74 96EA81D3 383B4813 D692C6E0 E0D5D8E2 50B98BE4
+        8E495C1D 6089DAD1 5DC7D7B4 6154D6B6 CE8EF4AD 69B15D49 82559B29
+        7BCF1885 C529F566 660E57EC 68EDBC3C 05726CC0 2FD4CBF4 976EAA9A
+        FD5138FE 8376435B 9FC61D2F C0EB06E3"""),
+    "g": 2,
+    "k": _hex("7556AA04 5AEF2CDD 07ABAF0F 665C3E81 8913186F"),
+    "x": _hex("94B7555A ABE9127C C58CCF49 93DB6CF8 4D16C124"),
+    "v": _hex("""
+        7E273DE8 696FFC4F 4E337D05 B4B375BE B0DDE156 9E8FA00A 9886D812
+        9BADA1F1 822223CA 1A605B53 0E379BA4 729FDC59 F105B478 7E5186F5
+        C671085A 1447B52A 48CF1970 B4FB6F84 00BBF4CE BFBB1681 52E08AB5
+        EA53D15C 1AFF87B2 B9DA6E04 E058AD51 CC72BFC9 033B564E 26480D78
+        E955A5E2 9E7AB245 DB2BE315 E2099AFB"""),
+    "a": _hex("""
+        60975527 035CF2AD 1989806F 0407210B C81EDC04 E2762A56 AFD529DD
+        DA2D4393"""),
+    "b": _hex("""
+        E487CB59 D31AC550 471E81F0 0F6928E0 1DDA08E9 74A004F4 9E61F5D1
+        05284D20"""),
+    "A": _hex("""
+        61D5E490 F6F1B795 47B0704C 436F523D D0E560F0 C64115BB 72557EC4
+        4352E890 3211C046 92272D8B 2D1A5358 A2CF1B6E 0BFCF99F 921530EC
+        8E393561 79EAE45E 42BA92AE ACED8251 71E1E8B9 AF6D9C03 E1327F44
+        BE087EF0 6530E69F 66615261 EEF54073 CA11CF58 58F0EDFD FE15EFEA
+        B349EF5D 76988A36 72FAC47B 0769447B"""),
+    "B": _hex("""
+        BD0C6151 2C692C0C B6D041FA 01BB152D 4916A1E7 7AF46AE1 05393011
+        BAF38964 DC46A067 0DD125B9 5A981652 236F99D9 B681CBF8 7837EC99
+        6C6DA044 53728610 D0C6DDB5 8B318885 D7D82C7F 8DEB75CE 7BD4FBAA
+        37089E6F 9C6059F3 88838E7A 00030B33 1EB76840 910440B1 B27AAEAE
+        EB4012B7 D7665238 A8E3FB00 4B117B58"""),
+    "u": _hex("CE38B959 3487DA98 554ED47D 70A7AE5F 462EF019"),
+    "S": _hex("""
+        B0DC82BA BCF30674 AE450C02 87745E79 90A3381F 63B387AA F271A10D
+        233861E3 59B48220 F7C4693C 9AE12B0A 6F67809F 0876E2D0 13800D6C
+        41BB59B6 D5979B5C 00A172B4 A2A5903A 0BDCAF8A 709585EB 2AFAFA8F
+        3499B200 210DCC1F 10EB3394 3CD67FC8 8A2F39A4 BE5BEC4E C0A3212D
+        C346D7E4 74B29EDE 8A469FFE CA686E5A"""),
+}
+
+
+@pytest.fixture
+def rfc5054_group(monkeypatch):
+    # The module math with the group and hash of the RFC 5054 test vectors
+    vectors = RFC5054
+    monkeypatch.setattr(srp6a, "hashlib", SimpleNamespace(sha512=hashlib.sha1))
+    monkeypatch.setattr(srp6a, "N", vectors["N"])
+    monkeypatch.setattr(srp6a, "g", vectors["g"])
+    monkeypatch.setattr(srp6a, "N_LEN", (vectors["N"].bit_length() + 7) // 8)
+    monkeypatch.setattr(srp6a, "k", srp6a.H(vectors["N"], vectors["g"], width=srp6a.N_LEN))
+    return vectors
+
+
+def test_rfc5054_vectors(rfc5054_group):
+    vectors = rfc5054_group
+    assert srp6a.k == vectors["k"]
+    x, v = srp6a.verifier(vectors["I"], vectors["P"], vectors["s"])
+    assert (x, v) == (vectors["x"], vectors["v"])
+    assert pow(srp6a.g, vectors["a"], srp6a.N) == vectors["A"]
+    assert (srp6a.k * v + pow(srp6a.g, vectors["b"], srp6a.N)) % srp6a.N == vectors["B"]
+    assert srp6a.H(vectors["A"], vectors["B"], width=srp6a.N_LEN) == vectors["u"]
+    assert srp6a.client_premaster_secret(vectors["a"], vectors["A"], vectors["B"], x, v) == vectors["S"]
+    assert srp6a.server_premaster_secret(vectors["A"], vectors["b"], v, vectors["B"]) == vectors["S"]
+
+
+def _server(username, password, salt, A):
+    # Device side of the exchange, as in transport_sim
+    _, v = srp6a.verifier(username, password, salt)
+    b = bytes_to_long(hashlib.sha256(salt).digest())
+    B = (srp6a.k * v + pow(srp6a.g, b, srp6a.N)) % srp6a.N
+    K = hashlib.sha512(long_to_bytes(srp6a.server_premaster_secret(A, b, v, B))).digest()
+    return B, K
+
+
+@pytest.mark.parametrize("device_password, authenticated", [(b"abcd1234", True), (b"wrong", False)])
+def test_session(device_password, authenticated):
+    salt = bytes.fromhex("0123456789ABCDEF0123456789ABCDEF")
+    client = srp6a.Srp6a(b"wifiprov", b"abcd1234")
+    B, K = _server(b"wifiprov", device_password, salt, client.A)
+    M = client.process_challenge(salt, long_to_bytes(B))
+    assert (M == srp6a.client_proof(b"wifiprov", salt, client.A, B, K)) is authenticated
+    client.verify_session(srp6a.server_proof(client.A, M, K))
+    assert client.authenticated() is authenticated
+
+
+def test_invalid_device_key():
+    client = srp6a.Srp6a(b"wifiprov", b"abcd1234")
+    with pytest.raises(RuntimeError):
+        client.process_challenge(b"salt", long_to_bytes(srp6a.N))